@@ -7,8 +7,10 @@
 //
 // and an implementation of the find-best-partition dynamic program.
 //
-// We don't implement a rolling median computation, on the assumption that
-// accesses are concentrated on small windows in the data.
+// Single windows are computed by sorting.  Consecutive windows, as
+// visited by the dynamic program and dist_row, are computed with a
+// rolling weighted median (RollingMedian), which adds or removes one
+// point at a time.
 
 #include <vector>
 #include <queue>
@@ -80,6 +82,209 @@ void compute_weighted_median(const_iterator start, const_iterator end,
 }
 
 
+//
+// Rolling weighted median.
+//
+// Maintains the window y[left:right], which can be moved by adding or
+// removing points at its ends.  The points are ranked once by (y, w),
+// and the points in the window are kept in Fenwick trees indexed by
+// rank, holding their count, weight, and weighted value.  Moving an end
+// of the window by one point, and finding the weighted median and
+// distance of the window are then O(log n).  The median has the same
+// tie rules as compute_weighted_median.  Weights are assumed to be
+// non-negative.
+//
+// The weighted values are stored relative to the first point added to
+// an empty window, to limit cancellation in the distance computation.
+//
+
+class RollingMedian
+{
+private:
+    const std::vector<std::pair<double,double> > &y_;
+    std::vector<size_t> rank_;
+    std::vector<size_t> order_;
+    std::vector<double> count_, weight_, value_;
+    std::vector<size_t> touched_;
+    size_t size_, step_, n_, left_, right_;
+    double ref_, total_weight_, total_value_;
+
+    void update(size_t k, double count, double weight, double value) {
+        for (size_t i = rank_[k] + 1; i <= size_; i += i & (~i + 1)) {
+            if (touched_.size() <= size_) {
+                touched_.push_back(i);
+            }
+            count_[i] += count;
+            weight_[i] += weight;
+            value_[i] += value;
+        }
+    }
+
+    void clear() {
+        // Reset the nodes touched since the last reset, or if there
+        // are too many to record, everything
+        if (touched_.size() <= size_) {
+            std::vector<size_t>::const_iterator it;
+            for (it = touched_.begin(); it != touched_.end(); ++it) {
+                count_[*it] = 0;
+                weight_[*it] = 0;
+                value_[*it] = 0;
+            }
+        }
+        else {
+            std::fill(count_.begin(), count_.end(), 0.0);
+            std::fill(weight_.begin(), weight_.end(), 0.0);
+            std::fill(value_.begin(), value_.end(), 0.0);
+        }
+        touched_.clear();
+        n_ = 0;
+        total_weight_ = 0;
+        total_value_ = 0;
+    }
+
+    void add(size_t k) {
+        if (n_ == 0) {
+            ref_ = y_[k].first;
+        }
+        double w = y_[k].second, v = w * (y_[k].first - ref_);
+        update(k, 1, w, v);
+        total_weight_ += w;
+        total_value_ += v;
+        ++n_;
+    }
+
+    void remove(size_t k) {
+        double w = y_[k].second, v = w * (y_[k].first - ref_);
+        update(k, -1, -w, -v);
+        total_weight_ -= w;
+        total_value_ -= v;
+        --n_;
+    }
+
+    // Smallest rank whose prefix count is >= count
+    size_t find_count(double count) const {
+        size_t pos = 0;
+        double acc = 0;
+        for (size_t step = step_; step > 0; step >>= 1) {
+            if (pos + step <= size_ && acc + count_[pos + step] < count) {
+                pos += step;
+                acc += count_[pos];
+            }
+        }
+        return pos;
+    }
+
+public:
+    RollingMedian(const std::vector<std::pair<double,double> > &y)
+        : y_(y), rank_(y.size()), order_(y.size()),
+          count_(y.size() + 1), weight_(y.size() + 1), value_(y.size() + 1),
+          size_(y.size()), step_(1), n_(0), left_(0), right_(0),
+          ref_(0), total_weight_(0), total_value_(0)
+    {
+        std::vector<std::pair<std::pair<double,double>,size_t> > items(size_);
+        for (size_t k = 0; k < size_; ++k) {
+            items[k] = std::make_pair(y_[k], k);
+        }
+        std::sort(items.begin(), items.end());
+        for (size_t k = 0; k < size_; ++k) {
+            order_[k] = items[k].second;
+            rank_[items[k].second] = k;
+        }
+        while (2 * step_ <= size_) {
+            step_ *= 2;
+        }
+    }
+
+    // Number of points to add or remove to move to the window y[left:right]
+    size_t move_cost(size_t left, size_t right) const {
+        if (left_ == right_ || right <= left_ || left >= right_) {
+            return right - left;
+        }
+        size_t cost = (left > left_ ? left - left_ : left_ - left) +
+                      (right > right_ ? right - right_ : right_ - right);
+        return std::min(cost, right - left);
+    }
+
+    void move(size_t left, size_t right) {
+        if (move_cost(left, right) == right - left) {
+            // Start over, also resetting rounding errors
+            clear();
+            left_ = right_ = left;
+        }
+
+        // Extend first, so that the window does not become empty
+        for (; left_ > left; --left_) {
+            add(left_ - 1);
+        }
+        for (; right_ < right; ++right_) {
+            add(right_);
+        }
+        for (; left_ < left; ++left_) {
+            remove(left_);
+        }
+        for (; right_ > right; --right_) {
+            remove(right_ - 1);
+        }
+    }
+
+    void get(double *mu, double *dist) const {
+        double midpoint = total_weight_ / 2;
+        size_t pos = 0;
+        double wsum = 0, vsum = 0, cnt = 0;
+
+        if (n_ == 0) {
+            *mu = 0;
+            *dist = 0;
+            return;
+        }
+
+        // First point at which the cumulative weight is >= midpoint
+        for (size_t step = step_; step > 0; step >>= 1) {
+            if (pos + step <= size_ && wsum + weight_[pos + step] < midpoint) {
+                pos += step;
+                wsum += weight_[pos];
+                vsum += value_[pos];
+                cnt += count_[pos];
+            }
+        }
+
+        if (pos >= size_) {
+            // Error condition, maybe some floating point summation issue
+            pos = find_count(n_);
+            cnt = n_ - 1;
+            wsum = total_weight_ - y_[order_[pos]].second;
+            vsum = total_value_ - y_[order_[pos]].second * (y_[order_[pos]].first - ref_);
+        }
+        else if (midpoint <= 0) {
+            pos = find_count(1);
+            cnt = wsum = vsum = 0;
+        }
+
+        const std::pair<double,double> &item = y_[order_[pos]];
+        wsum += item.second;
+        vsum += item.second * (item.first - ref_);
+        cnt += 1;
+
+        *mu = item.first;
+        if (wsum == midpoint && cnt < n_) {
+            *mu = (y_[order_[find_count(cnt + 1)]].first + *mu) / 2;
+        }
+
+        // Points up to pos are <= mu, and the rest >= mu
+        double m = *mu - ref_;
+        *dist = (m * wsum - vsum) + ((total_value_ - vsum) - m * (total_weight_ - wsum));
+        if (*dist < 0) {
+            *dist = 0;
+        }
+    }
+};
+
+
+// Windows smaller than this, and not near the current rolling median
+// window, are computed by sorting
+#define ROLLING_MIN_SIZE 64
+
+
 //
 // Cache for cache[left,right] == (mu, dist)
 //
@@ -138,6 +343,7 @@ typedef struct {
     PyObject_HEAD
     std::vector<std::pair<double,double> > *y;
     Cache *cache;
+    RollingMedian *rolling;
 } RangeMedianObject;
 
 
@@ -147,6 +353,7 @@ PyObject *RangeMedian_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
     self = (RangeMedianObject*)type->tp_alloc(type, 0);
     self->y = NULL;
     self->cache = NULL;
+    self->rolling = NULL;
     return (PyObject*)self;
 }
 
@@ -206,12 +413,21 @@ int RangeMedian_init(RangeMedianObject *self, PyObject *args, PyObject *kwds)
         Py_DECREF(wx);
     }
 
+    try {
+        self->rolling = new RollingMedian(*self->y);
+    }
+    catch (const std::bad_alloc&) {
+        PyErr_SetString(PyExc_MemoryError, "Allocating memory failed");
+        return -1;
+    }
+
     return 0;
 }
 
 
 static void RangeMedian_dealloc(RangeMedianObject *self)
 {
+    delete self->rolling;
     delete self->y;
     delete self->cache;
     Py_TYPE(self)->tp_free((PyObject*)self);
@@ -229,7 +445,16 @@ static int RangeMedian_mu_dist(RangeMedianObject *self, Py_ssize_t left, Py_ssiz
     }
 
     if (!self->cache->get(left, right, mu, dist)) {
-        compute_weighted_median(self->y->begin() + left, self->y->begin() + right + 1, mu, dist);
+        size_t window_size = right + 1 - left;
+        if (left <= right && (window_size >= ROLLING_MIN_SIZE ||
+                              self->rolling->move_cost(left, right + 1) < window_size)) {
+            // Large window, or near the previous one: use the rolling median
+            self->rolling->move(left, right + 1);
+            self->rolling->get(mu, dist);
+        }
+        else {
+            compute_weighted_median(self->y->begin() + left, self->y->begin() + right + 1, mu, dist);
+        }
         self->cache->set(left, right, *mu, *dist);
     }
 
@@ -299,16 +524,21 @@ static PyObject *RangeMedian_find_best_partition(RangeMedianObject *self, PyObje
     for (Py_ssize_t right = min_pos; right < max_pos; ++right) {
         B[right + 1 - min_pos] = inf;
 
+        // Visit the windows [left, right] from the smallest, so that
+        // each extends the previous one by a point
         Py_ssize_t aa = std::max(right + 1 - max_size, min_pos);
         Py_ssize_t bb = std::max(right + 1 - min_size + 1, min_pos);
-        for (Py_ssize_t left = aa; left < bb; ++left) {
+        for (Py_ssize_t left = bb - 1; left >= aa; --left) {
             double mu, dist;
-            if (RangeMedian_mu_dist(self, left, right, &mu, &dist) == -1) {
-                return NULL;
+            if (!self->cache->get(left, right, &mu, &dist)) {
+                self->rolling->move(left, right + 1);
+                self->rolling->get(&mu, &dist);
+                self->cache->set(left, right, mu, dist);
             }
 
+            // Rightmost minimum
             double b = B[left - min_pos] + gamma + dist;
-            if (b <= B[right + 1 - min_pos]) {
+            if (b < B[right + 1 - min_pos] || left == bb - 1) {
                 B[right + 1 - min_pos] = b;
                 p[right - min_pos] = left - 1;
             }
@@ -339,6 +569,75 @@ static PyObject *RangeMedian_find_best_partition(RangeMedianObject *self, PyObje
 }
 
 
+// Distances of consecutive windows, computed with the rolling median:
+// dist(left, r) for r = left, ..., right if extend_right, and
+// dist(l, right) for l = right, ..., left (in reverse) otherwise.
+static PyObject *RangeMedian_dist_windows(RangeMedianObject *self,
+                                          Py_ssize_t left, Py_ssize_t right,
+                                          bool extend_right)
+{
+    Py_ssize_t size = self->y->size();
+
+    if (!(0 <= left && left <= right && right < size)) {
+        PyErr_SetString(PyExc_ValueError, "argument out of range");
+        return NULL;
+    }
+
+    PyObject *dist_list;
+
+    dist_list = PyList_New(right - left + 1);
+    if (dist_list == NULL) {
+        return NULL;
+    }
+
+    for (Py_ssize_t k = 0; k <= right - left; ++k) {
+        double mu, dist;
+        Py_ssize_t pos = extend_right ? left + k : right - k;
+
+        if (extend_right) {
+            self->rolling->move(left, pos + 1);
+        }
+        else {
+            self->rolling->move(pos, right + 1);
+        }
+        self->rolling->get(&mu, &dist);
+
+        PyObject *num = PyFloat_FromDouble(dist);
+        if (num == NULL) {
+            Py_DECREF(dist_list);
+            return NULL;
+        }
+        PyList_SET_ITEM(dist_list, pos - left, num);
+    }
+
+    return dist_list;
+}
+
+
+static PyObject *RangeMedian_dist_row(RangeMedianObject *self, PyObject *args)
+{
+    Py_ssize_t left, right_max;
+
+    if (!PyArg_ParseTuple(args, "nn", &left, &right_max)) {
+        return NULL;
+    }
+
+    return RangeMedian_dist_windows(self, left, right_max, true);
+}
+
+
+static PyObject *RangeMedian_dist_col(RangeMedianObject *self, PyObject *args)
+{
+    Py_ssize_t left_min, right;
+
+    if (!PyArg_ParseTuple(args, "nn", &left_min, &right)) {
+        return NULL;
+    }
+
+    return RangeMedian_dist_windows(self, left_min, right, false);
+}
+
+
 //
 // RangeMedian type.
 //
@@ -346,6 +645,8 @@ static PyObject *RangeMedian_find_best_partition(RangeMedianObject *self, PyObje
 static PyMethodDef RangeMedian_methods[] = {
     {"mu", (PyCFunction)RangeMedian_mu, METH_VARARGS, NULL},
     {"dist", (PyCFunction)RangeMedian_dist, METH_VARARGS, NULL},
+    {"dist_row", (PyCFunction)RangeMedian_dist_row, METH_VARARGS, NULL},
+    {"dist_col", (PyCFunction)RangeMedian_dist_col, METH_VARARGS, NULL},
     {"find_best_partition", (PyCFunction)RangeMedian_find_best_partition, METH_VARARGS, NULL},
     {NULL, NULL}
 };
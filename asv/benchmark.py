@@ -20,7 +20,8 @@ internal commands:
   run BENCHMARK_DIR BENCHMARK_ID QUICK PROFILE_PATH RESULT_FILE
       Run a given benchmark, and store result in a file.
   run_server BENCHMARK_DIR SOCKET_FILENAME
-      Run a Unix socket forkserver.
+      Run a Unix socket forkserver, accepting a stream of
+      length-prefixed JSON commands.
 """
 
 # !!!!!!!!!!!!!!!!!!!! NOTE !!!!!!!!!!!!!!!!!!!!
@@ -38,6 +39,7 @@ if __name__ == "__main__":
 else:
     _old_sys_path_head = None
 
+import bisect
 import copy
 try:
     import cProfile as profile
@@ -51,12 +53,16 @@ if sys.version_info[0] >= 3:
     import importlib.machinery
 else:
     import imp
+import gc
 import inspect
 import itertools
 import json
+import math
+import mmap
 import os
 import pickle
 import re
+import signal
 import subprocess
 import textwrap
 import timeit
@@ -252,6 +258,109 @@ else:
                 p.cpu_affinity(affinity_list)
 
 
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the current process, so that
+    `get_peak_rss` measures from this point. Supported on Linux 4.0+.
+    Returns True if successful.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+
+    return get_peak_rss() is not None
+
+
+def get_peak_rss():
+    """
+    Return the peak resident set size (VmHWM) of the current process
+    in bytes, since the last `reset_peak_rss`, or None if unavailable.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class StackSampler(object):
+    """
+    Statistical profiler, which samples the Python call stack at
+    regular intervals of process CPU time, using a SIGPROF timer.
+
+    The overhead is a stack walk per sample, so that call-heavy code
+    is not slowed down more than other code.  Only the main thread is
+    sampled.
+    """
+
+    def __init__(self, interval=0.001):
+        if not hasattr(signal, 'setitimer') or not hasattr(signal, 'SIGPROF'):
+            raise RuntimeError("Sampling profiler is not supported on this platform")
+        self.interval = interval
+        self.counts = {}
+        self._root = None
+
+    def _sample(self, signum, frame):
+        # Stack as a tuple of code objects, formatted only when dumped
+        stack = []
+        while frame is not None and frame is not self._root:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(stack)
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def runcall(self, func, *args):
+        """
+        Call the given function, sampling its stack.
+        """
+        self._root = sys._getframe()
+        old_handler = signal.signal(signal.SIGPROF, self._sample)
+        try:
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            try:
+                return func(*args)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        finally:
+            signal.signal(signal.SIGPROF, old_handler)
+            self._root = None
+
+    def get_collapsed_stacks(self):
+        """
+        Return the samples in the collapsed stack format used by
+        flamegraph tools: one line per stack, with semicolon-separated
+        frames from outermost to innermost, followed by the count.
+        """
+        labels = {}
+        lines = []
+        for stack, count in self.counts.items():
+            frames = []
+            for code in reversed(stack):
+                label = labels.get(code)
+                if label is None:
+                    label = "{0} ({1}:{2})".format(
+                        code.co_name, code.co_filename, code.co_firstlineno)
+                    label = label.replace(';', ':')
+                    labels[code] = label
+                frames.append(label)
+            if frames:
+                lines.append("{0} {1}".format(";".join(frames), count))
+        lines.sort()
+        return "".join(line + "\n" for line in lines)
+
+    def dump_stats(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.get_collapsed_stacks().encode('utf-8'))
+
+
 def recvall(sock, size):
     """
     Receive data of given size from a socket connection
@@ -308,6 +417,27 @@ def get_setup_cache_key(func):
     return '{0}:{1}'.format(mname, inspect.getsourcelines(func)[1])
 
 
+def get_setup_cache_version(func):
+    """
+    Version identifying the results of a setup_cache function: the
+    hash of its source code, combined with its ``version`` attribute
+    if it has one.
+    """
+    if func is None:
+        return None
+
+    code = get_source_code([func])
+    if sys.version_info[0] >= 3:
+        code = code.encode('utf-8')
+    version = sha256(code).hexdigest()
+
+    explicit_version = getattr(func, "version", None)
+    if explicit_version is not None:
+        version = "{0}-{1}".format(explicit_version, version)
+
+    return version
+
+
 def get_source_code(items):
     """
     Extract source code of given items, and concatenate and dedent it.
@@ -446,6 +576,8 @@ class Benchmark(object):
         self._setup_cache = _get_first_attr(attr_sources, 'setup_cache', None)
         self.setup_cache_key = get_setup_cache_key(self._setup_cache)
         self.setup_cache_timeout = _get_first_attr([self._setup_cache], "timeout", None)
+        self.setup_cache_version = get_setup_cache_version(self._setup_cache)
+        self._setup_cache_mmap = _get_first_attr([self._setup_cache], "mmap", False)
         self.timeout = _get_first_attr(attr_sources, "timeout", 60.0)
         self.code = get_source_code([self.func] + self._setups + [self._setup_cache])
         if sys.version_info[0] >= 3:
@@ -572,10 +704,19 @@ class Benchmark(object):
     def do_run(self):
         return self.run(*self._current_params)
 
-    def do_profile(self, filename=None):
+    def do_profile(self, filename=None, profiler='cprofile'):
         def method_caller():
             run(*params)
 
+        if profiler == 'sampler':
+            if filename is not None:
+                self.redo_setup()
+
+                sampler = StackSampler()
+                sampler.runcall(self.func, *self._current_params)
+                sampler.dump_stats(filename)
+            return
+
         if profile is None:
             raise RuntimeError("cProfile could not be imported")
 
@@ -614,6 +755,7 @@ class TimeBenchmark(Benchmark):
         self.sample_time = _get_first_attr(self._attr_sources, 'sample_time', 0.01)
         self.warmup_time = _get_first_attr(self._attr_sources, 'warmup_time', -1)
         self.timer = _get_first_attr(self._attr_sources, 'timer', wall_timer)
+        self.ci_target = float(_get_first_attr(self._attr_sources, 'ci_target', 0))
 
     def do_setup(self):
         result = Benchmark.do_setup(self)
@@ -653,6 +795,10 @@ class TimeBenchmark(Benchmark):
                 min_repeat = 1
                 max_repeat = 10
                 max_time = 20.0
+                if self.ci_target > 0:
+                    # Sampling usually stops at the CI target well before
+                    # max_repeat
+                    max_repeat = 100
                 if self.processes > 1:
                     max_repeat //= 2
                     max_time /= 2.0
@@ -669,13 +815,14 @@ class TimeBenchmark(Benchmark):
                                                 max_time=max_time,
                                                 warmup_time=warmup_time,
                                                 number=self.number,
-                                                min_run_count=self.min_run_count)
+                                                min_run_count=self.min_run_count,
+                                                ci_target=self.ci_target)
 
         samples = [s/number for s in samples]
         return {'samples': samples, 'number': number}
 
     def benchmark_timing(self, timer, min_repeat, max_repeat, max_time, warmup_time,
-                         number, min_run_count):
+                         number, min_run_count, ci_target=0):
 
         sample_time = self.sample_time
         start_time = wall_timer()
@@ -731,6 +878,7 @@ class TimeBenchmark(Benchmark):
                 return [timing], number
 
         # Collect samples
+        sorted_samples = []
         while len(samples) < max_repeat:
             timing = timer.timeit(number)
             run_count += number
@@ -739,9 +887,50 @@ class TimeBenchmark(Benchmark):
             if too_slow(len(samples)):
                 break
 
+            # Stop when the median is known to the requested precision
+            if ci_target > 0:
+                bisect.insort(sorted_samples, timing)
+                if (len(samples) >= min_repeat and
+                        _median_ci_width(sorted_samples) <= ci_target):
+                    break
+
         return samples, number
 
 
+def _median_ci_width(y, alpha=0.01):
+    """
+    Relative width of the (1 - alpha) confidence interval of the
+    median of sorted samples `y`, computed as in
+    `asv.statistics.quantile_ci`. Returns infinity if the interval
+    is unbounded.
+    """
+    n = len(y)
+    pa = alpha / 2
+    pb = 1 - pa
+
+    a = None
+    b = None
+
+    # F = cumulative Bin(n, 1/2) probability, via the log pmf to
+    # avoid underflow for large n
+    F = 0
+    log_pmf = n * math.log(0.5)
+    for k, yp in enumerate(y):
+        F += math.exp(log_pmf)
+        if F <= pa:
+            a = yp
+        if F >= pb:
+            b = yp
+            break
+        log_pmf += math.log((n - k) / float(k + 1))
+
+    median = (y[(n - 1) // 2] + y[n // 2]) / 2.0 if n else 0
+    if a is None or b is None or median <= 0:
+        return float('inf')
+
+    return (b - a) / median
+
+
 class _SeparateProcessTimer(object):
     subprocess_tmpl = textwrap.dedent('''
         from __future__ import print_function
@@ -793,6 +982,50 @@ class TimerawBenchmark(TimeBenchmark):
         raise ValueError("Raw timing benchmarks cannot be profiled")
 
 
+_asizeof = None
+
+
+def _load_asizeof():
+    """
+    Load the asizeof module, once per process.
+    """
+    global _asizeof
+
+    if _asizeof is None:
+        # We can't import asizeof directly, because we haven't loaded
+        # the asv package in the benchmarking process.
+        path = os.path.join(
+            os.path.dirname(__file__), 'extern', 'asizeof.py')
+        if sys.version_info[0] >= 3:
+            _asizeof = importlib.machinery.SourceFileLoader('asizeof', path).load_module()
+        else:
+            _asizeof = imp.load_source('asizeof', path)
+
+    return _asizeof
+
+
+def _flat_buffer_size(obj):
+    """
+    Return the size of a bytes-like object that holds no references
+    to Python objects, such as bytes or a numeric Numpy array, or None
+    for other objects.
+    """
+    if isinstance(obj, (list, tuple, dict, set, frozenset)):
+        return None
+
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+
+    if 'O' in view.format:
+        # Buffer of Python objects
+        return None
+
+    # Aligned as in asizeof
+    return (sys.getsizeof(obj) + 7) & ~7
+
+
 class MemBenchmark(Benchmark):
     """
     Represents a single benchmark for tracking the memory consumption
@@ -805,23 +1038,24 @@ class MemBenchmark(Benchmark):
         Benchmark.__init__(self, name, func, attr_sources)
         self.type = "memory"
         self.unit = "bytes"
+        self.depth_limit = int(_get_first_attr(attr_sources, "depth_limit", 100))
 
     def run(self, *param):
-        # We can't import asizeof directly, because we haven't loaded
-        # the asv package in the benchmarking process.
-        path = os.path.join(
-            os.path.dirname(__file__), 'extern', 'asizeof.py')
-        if sys.version_info[0] >= 3:
-            asizeof = importlib.machinery.SourceFileLoader('asizeof', path).load_module()
-        else:
-            asizeof = imp.load_source('asizeof', path)
-
         obj = self.func(*param)
+        objcopy = copy.copy(obj)
 
-        sizeof2 = asizeof.asizeof([obj, obj])
-        sizeofcopy = asizeof.asizeof([obj, copy.copy(obj)])
+        if objcopy is obj:
+            # Immutable object, copying takes no memory
+            return 0
 
-        return sizeofcopy - sizeof2
+        size = _flat_buffer_size(objcopy)
+        if size is not None:
+            return size
+
+        # Size the object and its copy in one traversal; objects
+        # shared with the original are counted only for the original.
+        asizeof = _load_asizeof()
+        return asizeof.asizesof(obj, objcopy, limit=self.depth_limit)[1]
 
 
 class PeakMemBenchmark(Benchmark):
@@ -836,12 +1070,74 @@ class PeakMemBenchmark(Benchmark):
         Benchmark.__init__(self, name, func, attr_sources)
         self.type = "peakmemory"
         self.unit = "bytes"
+        self.subtract_baseline = bool(_get_first_attr(attr_sources, "subtract_baseline",
+                                                      False))
 
     def run(self, *param):
+        # If enabled, measure the peak above the memory in use before
+        # the call, if the peak can be reset. Otherwise, the peak over
+        # the whole process lifetime, which includes startup and imports.
+        baseline = None
+        if self.subtract_baseline and reset_peak_rss():
+            baseline = get_peak_rss()
+
         self.func(*param)
+
+        if baseline is not None:
+            peak = get_peak_rss()
+            if peak is not None:
+                return {'value': peak - baseline,
+                        'stats': {'baseline': baseline, 'peak': peak}}
+
         return get_maxrss()
 
 
+class AllocBenchmark(Benchmark):
+    """
+    Represents a single benchmark for tracking the memory allocations
+    made when calling a function, as traced by tracemalloc.
+    """
+    name_regex = re.compile(
+        '^(Alloc[A-Z_].+)|(alloc_.+)$')
+
+    def __init__(self, name, func, attr_sources):
+        Benchmark.__init__(self, name, func, attr_sources)
+        self.type = "allocation"
+        self.unit = "bytes"
+        self.alloc_by_file = int(_get_first_attr(attr_sources, "alloc_by_file", 0))
+
+    def run(self, *param):
+        try:
+            import tracemalloc
+        except ImportError:
+            raise NotImplementedError("Allocation benchmarks require tracemalloc")
+
+        # Only blocks allocated during the call are traced, so the
+        # traced memory starts from zero.
+        tracemalloc.start()
+        try:
+            self.func(*param)
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)])
+        file_stats = snapshot.statistics('filename')
+
+        stats = {'blocks': sum(stat.count for stat in file_stats),
+                 'size': sum(stat.size for stat in file_stats),
+                 'peak': peak}
+
+        if self.alloc_by_file > 0:
+            stats['by_file'] = dict(
+                (stat.traceback[0].filename, stat.size)
+                for stat in file_stats[:self.alloc_by_file])
+
+        return {'value': peak, 'stats': stats}
+
+
 class TrackBenchmark(Benchmark):
     """
     Represents a single benchmark for tracking an arbitrary value.
@@ -862,7 +1158,8 @@ class TrackBenchmark(Benchmark):
 
 
 benchmark_types = [
-    TimerawBenchmark, TimeBenchmark, MemBenchmark, PeakMemBenchmark, TrackBenchmark
+    TimerawBenchmark, TimeBenchmark, MemBenchmark, PeakMemBenchmark,
+    AllocBenchmark, TrackBenchmark
 ]
 
 
@@ -1119,6 +1416,78 @@ def set_cpu_affinity_from_params(extra_params):
                 affinity_list, exc))
 
 
+# Alignment of out-of-band buffers in cache.buffers
+SETUP_CACHE_BUFFER_ALIGNMENT = 64
+
+
+def save_setup_cache(cache, cache_dir, use_mmap=False):
+    """
+    Pickle a setup_cache result to ``cache.pickle`` in `cache_dir`.
+
+    If `use_mmap` is True and pickle protocol 5 is available, buffers
+    supporting out-of-band pickling (e.g. Numpy arrays) are written
+    to a separate ``cache.buffers`` file, so that `load_setup_cache`
+    can memory-map them instead of copying.
+    """
+    pickle_file = os.path.join(cache_dir, "cache.pickle")
+
+    if not use_mmap or sys.version_info < (3, 8):
+        with open(pickle_file, "wb") as fd:
+            pickle.dump(cache, fd)
+        return
+
+    buffers = []
+
+    def buffer_callback(buf):
+        try:
+            buffers.append(buf.raw())
+        except BufferError:
+            # Non-contiguous: serialize in-band
+            return True
+
+    data = pickle.dumps(cache, protocol=5, buffer_callback=buffer_callback)
+
+    layout = []
+    offset = 0
+    with open(os.path.join(cache_dir, "cache.buffers"), "wb") as fd:
+        for buf in buffers:
+            padding = -offset % SETUP_CACHE_BUFFER_ALIGNMENT
+            fd.write(b'\0' * padding)
+            offset += padding
+            layout.append((offset, buf.nbytes))
+            fd.write(buf)
+            offset += buf.nbytes
+
+    with open(pickle_file, "wb") as fd:
+        pickle.dump(layout, fd, protocol=5)
+        fd.write(data)
+
+
+def load_setup_cache(cache_dir):
+    """
+    Load a setup_cache result saved by `save_setup_cache`.
+
+    Out-of-band buffers are memory-mapped copy-on-write: they are
+    shared via the page cache, and modifications are not written back.
+    """
+    buffers_file = os.path.join(cache_dir, "cache.buffers")
+
+    with open(os.path.join(cache_dir, "cache.pickle"), "rb") as fd:
+        if not os.path.exists(buffers_file):
+            return pickle.load(fd)
+
+        layout = pickle.load(fd)
+
+        if os.path.getsize(buffers_file) > 0:
+            with open(buffers_file, "rb") as bfd:
+                view = memoryview(mmap.mmap(bfd.fileno(), 0, access=mmap.ACCESS_COPY))
+        else:
+            view = memoryview(bytearray())
+
+        buffers = [view[offset:offset + size] for offset, size in layout]
+        return pickle.load(fd, buffers=buffers)
+
+
 def main_setup_cache(args):
     (benchmark_dir, benchmark_id, params_str) = args
 
@@ -1128,17 +1497,35 @@ def main_setup_cache(args):
 
     benchmark = get_benchmark_from_name(benchmark_dir, benchmark_id)
     cache = benchmark.do_setup_cache()
-    with open("cache.pickle", "wb") as fd:
-        pickle.dump(cache, fd)
+    save_setup_cache(cache, ".", use_mmap=benchmark._setup_cache_mmap)
 
 
 def main_run(args):
     (benchmark_dir, benchmark_id, params_str, profile_path, result_file) = args
 
+    result = run_benchmark(benchmark_dir, benchmark_id, params_str, profile_path)
+
+    # Write the output value
+    with open(result_file, 'w') as fp:
+        json.dump(result, fp)
+
+
+# Marker for setup_cache results not loaded in advance
+_NOT_LOADED = object()
+
+
+def run_benchmark(benchmark_dir, benchmark_id, params_str, profile_path,
+                  setup_cache=_NOT_LOADED):
+    """
+    Run a given benchmark in the current process, and return its result.
+    If `setup_cache` is not given, the setup_cache result (if any) is
+    loaded from the current directory.
+    """
     extra_params = json.loads(params_str)
 
     set_cpu_affinity_from_params(extra_params)
     extra_params.pop('cpu_affinity', None)
+    profiler = extra_params.pop('profiler', 'cprofile')
 
     if profile_path == 'None':
         profile_path = None
@@ -1147,8 +1534,9 @@ def main_run(args):
         benchmark_dir, benchmark_id, extra_params=extra_params)
 
     if benchmark.setup_cache_key is not None:
-        with open("cache.pickle", "rb") as fd:
-            cache = pickle.load(fd)
+        cache = setup_cache
+        if cache is _NOT_LOADED:
+            cache = load_setup_cache(".")
         if cache is not None:
             benchmark.insert_param(cache)
 
@@ -1160,19 +1548,21 @@ def main_run(args):
         else:
             result = benchmark.do_run()
             if profile_path is not None:
-                benchmark.do_profile(profile_path)
+                benchmark.do_profile(profile_path, profiler=profiler)
     finally:
         benchmark.do_teardown()
 
-    # Write the output value
-    with open(result_file, 'w') as fp:
-        json.dump(result, fp)
+    return result
 
 
 @contextlib.contextmanager
-def posix_redirect_output(filename=None, permanent=True):
+def posix_redirect_output(filename=None, permanent=True, out_fd=None):
     """
     Redirect stdout/stderr to a file, using posix dup2.
+
+    If `out_fd` is given, output is redirected to the given file
+    descriptor (e.g. a pipe) instead, and the descriptor is closed
+    afterward.
     """
     sys.stdout.flush()
     sys.stderr.flush()
@@ -1184,7 +1574,9 @@ def posix_redirect_output(filename=None, permanent=True):
         stdout_fd_copy = os.dup(stdout_fd)
         stderr_fd_copy = os.dup(stderr_fd)
 
-    if filename is None:
+    if out_fd is not None:
+        pass
+    elif filename is None:
         out_fd, filename = tempfile.mkstemp()
     else:
         out_fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
@@ -1207,9 +1599,140 @@ def posix_redirect_output(filename=None, permanent=True):
             os.close(stderr_fd_copy)
 
 
+def _send_message(conn, msg):
+    """
+    Send a length-prefixed JSON message through a socket connection.
+    """
+    text = json.dumps(msg)
+    if sys.version_info[0] >= 3:
+        text = text.encode('utf-8')
+    conn.sendall(struct.pack('<Q', len(text)) + text)
+
+
+def _recv_message(conn):
+    """
+    Receive a length-prefixed JSON message from a socket connection.
+    Returns None if the connection was closed.
+    """
+    header = b""
+    while len(header) < 8:
+        s = conn.recv(8 - len(header))
+        if not s:
+            if not header:
+                return None
+            raise RuntimeError("did not receive data from socket "
+                               "(size 8, got only {!r})".format(header))
+        header += s
+
+    read_size, = struct.unpack('<Q', header)
+    text = recvall(conn, read_size)
+    if sys.version_info[0] >= 3:
+        text = text.decode('utf-8')
+    return json.loads(text)
+
+
+def _write_all(fd, data):
+    while data:
+        n = os.write(fd, data)
+        data = data[n:]
+
+
+def _wait_child(pid, fds, timeout):
+    """
+    Wait for a forked child to exit, while reading everything it
+    writes to the given pipes. Kill the child on timeout.
+
+    Returns
+    -------
+    data : list of bytes
+        Data read from each pipe.
+    status : int
+        Exit status, as returned by os.waitpid.
+    is_timeout : bool
+        Whether the child was killed due to timeout.
+    elapsed : float
+        Lifetime of the child process in seconds.
+
+    """
+    import select
+    import signal
+
+    chunks = dict((fd, []) for fd in fds)
+    open_fds = list(fds)
+
+    start_time = wall_timer()
+    is_timeout = False
+    status = None
+    elapsed = None
+
+    while True:
+        if open_fds:
+            try:
+                ready, _, _ = select.select(open_fds, [], [],
+                                            0.05 if status is None else 0)
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd in ready:
+                data = os.read(fd, 65536)
+                if data:
+                    chunks[fd].append(data)
+                else:
+                    open_fds.remove(fd)
+                    os.close(fd)
+        else:
+            # All pipes closed: the child is exiting, so poll
+            # for it more often
+            ready = []
+            if status is None:
+                time.sleep(0.001)
+
+        if status is not None:
+            # Child has exited; stop once the pipes are drained (the
+            # write ends may still be held open by grandchildren)
+            if not ready:
+                break
+            continue
+
+        res, st = os.waitpid(pid, os.WNOHANG)
+        if res != 0:
+            status = st
+            elapsed = wall_timer() - start_time
+            continue
+
+        if timeout is not None and wall_timer() > start_time + timeout:
+            # Timeout
+            if is_timeout:
+                os.kill(pid, signal.SIGKILL)
+            else:
+                os.kill(pid, signal.SIGTERM)
+            is_timeout = True
+
+    for fd in open_fds:
+        os.close(fd)
+
+    return [b"".join(chunks[fd]) for fd in fds], status, is_timeout, elapsed
+
+
+def _freeze_gc(preloaded_caches):
+    """
+    Keep preloaded objects out of garbage collection, so that the
+    collector does not touch (and copy) their memory pages in forked
+    children.
+    """
+    if not hasattr(gc, 'freeze'):
+        return
+
+    gc.unfreeze()
+    if preloaded_caches:
+        gc.collect()
+        gc.freeze()
+
+
 def main_run_server(args):
     import io
-    import signal
     import socket
 
     benchmark_dir, socket_name, = args
@@ -1221,126 +1744,137 @@ def main_run_server(args):
     s.bind(socket_name)
     s.listen(1)
 
-    # Read and act on commands from socket
-    while True:
-        stdout_file = None
+    # Setup_cache results loaded before forking, by cache directory.
+    # Children inherit them copy-on-write, instead of unpickling.
+    preloaded_caches = {}
 
+    # Serve connections. Each connection is long-lived, and carries
+    # a stream of length-prefixed commands, which are answered in
+    # order. Clients can pipeline several run commands, without
+    # waiting for the previous ones to complete.
+    while True:
         try:
             conn, addr = s.accept()
         except KeyboardInterrupt:
             break
 
         try:
-            fd, stdout_file = tempfile.mkstemp()
-            os.close(fd)
-
-            # Read command
-            read_size, = struct.unpack('<Q', recvall(conn, 8))
-            command_text = recvall(conn, read_size)
-            if sys.version_info[0] >= 3:
-                command_text = command_text.decode('utf-8')
-
-            # Parse command
-            command = json.loads(command_text)
-            action = command.pop('action')
-
-            if action == 'quit':
-                break
-            elif action == 'preimport':
-                # Import benchmark suite before forking.
-                # Capture I/O to a file during import.
-                with posix_redirect_output(stdout_file, permanent=False):
-                    for benchmark in disc_benchmarks(benchmark_dir, ignore_import_errors=True):
-                        pass
-
-                # Report result
-                with io.open(stdout_file, 'r', errors='replace') as f:
-                    out = f.read()
-                out = json.dumps(out)
-                if sys.version_info[0] >= 3:
-                    out = out.encode('utf-8')
-                conn.sendall(struct.pack('<Q', len(out)))
-                conn.sendall(out)
-                continue
-
-            benchmark_id = command.pop('benchmark_id')
-            params_str = command.pop('params_str')
-            profile_path = command.pop('profile_path')
-            result_file = command.pop('result_file')
-            timeout = command.pop('timeout')
-            cwd = command.pop('cwd')
-
-            if command:
-                raise RuntimeError('Command contained unknown data: {!r}'.format(command_text))
-
-            # Spawn benchmark
-            run_args = (benchmark_dir, benchmark_id, params_str, profile_path, result_file)
-            pid = os.fork()
-            if pid == 0:
-                conn.close()
-                sys.stdin.close()
-                exitcode = 1
-                try:
-                    with posix_redirect_output(stdout_file, permanent=True):
-                        try:
-                            os.chdir(cwd)
-                            main_run(run_args)
-                            exitcode = 0
-                        except BaseException as ec:
-                            import traceback
-                            traceback.print_exc()
-                finally:
-                    os._exit(exitcode)
-
-            # Wait for results
-            # (Poll in a loop is simplest --- also used by subprocess.py)
-            start_time = wall_timer()
-            is_timeout = False
             while True:
-                res, status = os.waitpid(pid, os.WNOHANG)
-                if res != 0:
+                command = _recv_message(conn)
+                if command is None:
+                    # Connection closed by client
                     break
 
-                if timeout is not None and wall_timer() > start_time + timeout:
-                    # Timeout
-                    if is_timeout:
-                        os.kill(pid, signal.SIGKILL)
-                    else:
-                        os.kill(pid, signal.SIGTERM)
-                    is_timeout = True
-
-                time.sleep(0.05)
-
-            # Report result
-            with io.open(stdout_file, 'r', errors='replace') as f:
-                out = f.read()
-
-            # Emulate subprocess
-            if os.WIFSIGNALED(status):
-                retcode = -os.WTERMSIG(status)
-            elif os.WIFEXITED(status):
-                retcode = os.WEXITSTATUS(status)
-            elif os.WIFSTOPPED(status):
-                retcode = -os.WSTOPSIG(status)
-            else:
-                # shouldn't happen, but fail silently
-                retcode = -128
+                action = command.pop('action')
 
-            info = {'out': out,
-                    'errcode': -256 if is_timeout else retcode}
+                if action == 'quit':
+                    return
+                elif action == 'preimport':
+                    # Import benchmark suite before forking.
+                    # Capture I/O to a file during import.
+                    fd, stdout_file = tempfile.mkstemp()
+                    os.close(fd)
+                    try:
+                        with posix_redirect_output(stdout_file, permanent=False):
+                            for benchmark in disc_benchmarks(benchmark_dir,
+                                                             ignore_import_errors=True):
+                                if isinstance(benchmark, MemBenchmark):
+                                    # Load once, instead of in each child
+                                    _load_asizeof()
+
+                        # Report result
+                        with io.open(stdout_file, 'r', errors='replace') as f:
+                            out = f.read()
+                    finally:
+                        os.unlink(stdout_file)
+
+                    _send_message(conn, out)
+                    continue
+                elif action == 'load_cache':
+                    cache_dir = command.pop('cache_dir')
+                    try:
+                        preloaded_caches[cache_dir] = load_setup_cache(cache_dir)
+                        out = None
+                    except Exception:
+                        import traceback
+                        out = traceback.format_exc()
+                    _freeze_gc(preloaded_caches)
+                    _send_message(conn, out)
+                    continue
+                elif action == 'unload_cache':
+                    preloaded_caches.pop(command.pop('cache_dir'), None)
+                    _freeze_gc(preloaded_caches)
+                    _send_message(conn, None)
+                    continue
+
+                benchmark_id = command.pop('benchmark_id')
+                params_str = command.pop('params_str')
+                profile_path = command.pop('profile_path')
+                timeout = command.pop('timeout')
+                cwd = command.pop('cwd')
+
+                if command:
+                    raise RuntimeError('Command contained unknown data: {!r}'.format(command))
+
+                # Spawn benchmark. Its output and result are sent
+                # back through pipes, instead of temporary files.
+                out_r, out_w = os.pipe()
+                result_r, result_w = os.pipe()
+
+                pid = os.fork()
+                if pid == 0:
+                    conn.close()
+                    s.close()
+                    os.close(out_r)
+                    os.close(result_r)
+                    sys.stdin.close()
+                    exitcode = 1
+                    try:
+                        with posix_redirect_output(permanent=True, out_fd=out_w):
+                            try:
+                                os.chdir(cwd)
+                                result = run_benchmark(
+                                    benchmark_dir, benchmark_id, params_str, profile_path,
+                                    setup_cache=preloaded_caches.get(cwd, _NOT_LOADED))
+                                result_text = json.dumps(result)
+                                if sys.version_info[0] >= 3:
+                                    result_text = result_text.encode('utf-8')
+                                _write_all(result_w, result_text)
+                                exitcode = 0
+                            except BaseException as ec:
+                                import traceback
+                                traceback.print_exc()
+                    finally:
+                        os._exit(exitcode)
+
+                os.close(out_w)
+                os.close(result_w)
+
+                # Wait for results
+                (out, result_text), status, is_timeout, elapsed = _wait_child(
+                    pid, [out_r, result_r], timeout)
+
+                # Emulate subprocess
+                if os.WIFSIGNALED(status):
+                    retcode = -os.WTERMSIG(status)
+                elif os.WIFEXITED(status):
+                    retcode = os.WEXITSTATUS(status)
+                elif os.WIFSTOPPED(status):
+                    retcode = -os.WSTOPSIG(status)
+                else:
+                    # shouldn't happen, but fail silently
+                    retcode = -128
 
-            result_text = json.dumps(info)
-            if sys.version_info[0] >= 3:
-                result_text = result_text.encode('utf-8')
+                info = {'out': out.decode('utf-8', 'replace'),
+                        'errcode': -256 if is_timeout else retcode,
+                        'result': result_text.decode('utf-8', 'replace') or None,
+                        'elapsed': elapsed}
 
-            conn.sendall(struct.pack('<Q', len(result_text)))
-            conn.sendall(result_text)
+                _send_message(conn, info)
         except KeyboardInterrupt:
             break
         finally:
             conn.close()
-            if stdout_file is not None:
-                os.unlink(stdout_file)
 
 
 def main_timing(argv):
@@ -111,6 +111,33 @@ class DictionaryArgAction(argparse.Action):
         setattr(namespace, self.dest, result)
 
 
+def parse_affinity(value):
+    """
+    Parse a list of CPUs, in format 0 or 0,1,2 or 0-3
+    """
+    if "," in value:
+        value = value.split(",")
+    else:
+        value = [value]
+
+    affinity_list = []
+    for v in value:
+        if "-" in v:
+            a, b = v.split("-", 1)
+            a = int(a)
+            b = int(b)
+            affinity_list.extend(range(a, b + 1))
+        else:
+            affinity_list.append(int(v))
+
+    num_cpu = multiprocessing.cpu_count()
+    for n in affinity_list:
+        if not (0 <= n < num_cpu):
+            raise ValueError("CPU {!r} not in range 0-{!r}".format(n, num_cpu-1))
+
+    return affinity_list
+
+
 def add_bench(parser):
     parser.add_argument(
         "--bench", "-b", type=str, action="append",
@@ -127,29 +154,6 @@ def add_bench(parser):
         value = (int(min_repeat), int(max_repeat), float(max_time))
         return value
 
-    def parse_affinity(value):
-        if "," in value:
-            value = value.split(",")
-        else:
-            value = [value]
-
-        affinity_list = []
-        for v in value:
-            if "-" in v:
-                a, b = v.split("-", 1)
-                a = int(a)
-                b = int(b)
-                affinity_list.extend(range(a, b + 1))
-            else:
-                affinity_list.append(int(v))
-
-        num_cpu = multiprocessing.cpu_count()
-        for n in affinity_list:
-            if not (0 <= n < num_cpu):
-                raise ValueError("CPU {!r} not in range 0-{!r}".format(n, num_cpu-1))
-
-        return affinity_list
-
     converters = {
         'timeout': float,
         'version': str,
@@ -158,6 +162,7 @@ def add_bench(parser):
         'number': int,
         'processes': int,
         'sample_time': float,
+        'ci_target': float,
         'cpu_affinity': parse_affinity
     }
 
@@ -243,6 +248,24 @@ def add_launch_method(parser):
         help="How to launch benchmarks. Choices: auto, spawn, forkserver")
 
 
+def add_benchmark_workers(parser):
+    def parse_cores(value):
+        try:
+            return parse_affinity(value)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc))
+
+    parser.add_argument(
+        "--benchmark-workers", type=positive_int, default=1, metavar="N",
+        help="""Run benchmarks in N parallel worker processes, each
+        pinned to its own set of CPUs. Benchmarks sharing a setup_cache
+        run in the same worker. Default: 1""")
+    parser.add_argument(
+        "--cores", type=parse_cores, default=None,
+        help="""CPUs to divide between the benchmark workers, in format:
+        0 or 0,1,2 or 0-3. Default: all available CPUs""")
+
+
 def add_parallel(parser):
     parser.add_argument(
         "--parallel", "-j", nargs='?', type=int, default=1, const=-1,
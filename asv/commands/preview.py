@@ -7,7 +7,9 @@ from __future__ import (absolute_import, division, print_function,
 from six.moves import SimpleHTTPServer, socketserver
 
 import errno
+import io
 import os
+import re
 import random
 import socket
 
@@ -56,6 +58,40 @@ def create_httpd(handler_cls, port=0):
     return httpd, base_url
 
 
+class RangeRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """
+    Request handler serving files, with support for single byte range
+    requests, as used for the graph packs (see asv.graph.GraphPacks).
+    """
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if range_header is None or not os.path.isfile(path):
+            return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+
+        m = re.match(r'^bytes=(\d+)-(\d*)$', range_header.strip())
+        if m is None:
+            # Unsupported range, send the whole file
+            return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            if start > end:
+                self.send_error(416, "Requested range not satisfiable")
+                return None
+            f.seek(start)
+            data = f.read(end - start + 1)
+
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(start, end, size))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+
 class Preview(Command):
     @classmethod
     def setup_arguments(cls, subparsers):
@@ -88,10 +124,9 @@ class Preview(Command):
     def run(cls, conf, port=0, browser=False):
         os.chdir(conf.html_dir)
 
-        class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+        class Handler(RangeRequestHandler):
             def translate_path(self, path):
-                path = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(
-                    self, path)
+                path = RangeRequestHandler.translate_path(self, path)
                 return util.long_path(path)
 
         httpd, base_url = create_httpd(Handler, port=port)
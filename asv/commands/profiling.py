@@ -16,7 +16,7 @@ from ..benchmarks import Benchmarks
 from ..console import log, color_print
 from ..environment import get_environments, is_existing_only
 from ..machine import Machine
-from ..profiling import ProfilerGui
+from ..profiling import ProfilerGui, render_flamegraph_svg
 from ..repo import get_repo, NoSuchNameError
 from ..results import iter_results_for_machine
 from ..runner import run_benchmarks
@@ -66,7 +66,14 @@ class Profile(Command):
             help="""Save the profiling information to the given file.
             This file is in the format written by the `cProfile`
             standard library module.  If not provided, prints a simple
-            text-based profiling report to the console.""")
+            text-based profiling report to the console.  With
+            --sampler, the file contains collapsed stacks, or a flame
+            graph image if the file name ends with .svg.""")
+        parser.add_argument(
+            '--sampler', action='store_true',
+            help="""Use the low-overhead sampling profiler instead of
+            `cProfile`.  The profile is collapsed stacks, which can be
+            rendered by flame graph tools.""")
         parser.add_argument(
             '--force', '-f', action='store_true',
             help="""Forcibly re-run the profile, even if the data
@@ -91,12 +98,12 @@ class Profile(Command):
             conf=conf, benchmark=args.benchmark, revision=args.revision,
             gui=args.gui, output=args.output, force=args.force,
             env_spec=args.env_spec, launch_method=args.launch_method,
-            **kwargs)
+            sampler=args.sampler, **kwargs)
 
     @classmethod
     def run(cls, conf, benchmark, revision=None, gui=None, output=None,
             force=False, env_spec=None, launch_method=None,
-            _machine_file=None):
+            sampler=False, _machine_file=None):
         cls.find_guis()
 
         if gui == 'list':
@@ -110,6 +117,12 @@ class Profile(Command):
             raise util.UserError(
                 "Unknown profiler GUI {0}".format(gui))
 
+        if gui is not None and sampler:
+            raise util.UserError(
+                "Profiler GUIs cannot display sampling profiler data")
+
+        profile_format = 'collapsed' if sampler else 'pstats'
+
         if benchmark is None:
             raise util.UserError(
                 "Must specify benchmark to run")
@@ -143,7 +156,8 @@ class Profile(Command):
             for result in iter_results_for_machine(
                     conf.results_dir, machine_name):
                 if hash_equal(commit_hash, result.commit_hash):
-                    if result.has_profile(benchmark):
+                    if (result.has_profile(benchmark) and
+                            result.get_profile_format(benchmark) == profile_format):
                         env_matched = any(result.env.name == env.name
                                           for env in environments)
                         if env_matched:
@@ -201,14 +215,31 @@ class Profile(Command):
                 env.install_project(conf, repo, commit_hash)
 
                 results = run_benchmarks(
-                    benchmarks, env, show_stderr=True, quick=False, profile=True,
+                    benchmarks, env, show_stderr=True, quick=False,
+                    profile='sampler' if sampler else True,
                     launch_method=launch_method)
 
-                profile_data = results.get_profile(benchmark_name)
+                if results.has_profile(benchmark_name):
+                    profile_data = results.get_profile(benchmark_name)
+                elif sampler:
+                    # Function too fast to get any samples
+                    profile_data = b''
+                else:
+                    raise util.UserError("Profiling failed")
 
         log.flush()
 
-        if gui is not None:
+        if sampler:
+            if output is not None and output.lower().endswith('.svg'):
+                svg = render_flamegraph_svg(profile_data, title=benchmark)
+                with io.open(output, 'w', encoding='utf-8') as fd:
+                    fd.write(svg)
+            elif output is not None:
+                with io.open(output, 'wb') as fd:
+                    fd.write(profile_data)
+            else:
+                color_print(profile_data.decode('utf-8'), end='')
+        elif gui is not None:
             log.debug("Opening gui {0}".format(gui))
             with temp_profile(profile_data) as profile_path:
                 return cls.guis[gui].open_profiler_gui(profile_path)
@@ -5,26 +5,274 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import os
+import json
 import shutil
-import multiprocessing
+import hashlib
 import datetime
-from collections import defaultdict
 
 import six
 
 from . import Command
 from ..benchmarks import Benchmarks
 from ..console import log
-from ..graph import GraphSet
+from ..graph import Graph, GraphSet, GraphPacks
 from ..machine import iter_machine_files
 from ..repo import get_repo
-from ..results import iter_results
+from ..results import Results, iter_results_info
+from ..steps_cache import StepsCache
 from ..publishing import OutputPublisher
 from .. import statistics
 from .. import util
 from .. import __version__
 
 
+MANIFEST_FILENAME = 'publish-manifest.json'
+
+# Bump when the content of the manifest changes
+MANIFEST_VERSION = 3
+
+# Minimum number of results files to load, for loading them in
+# parallel processes
+PARALLEL_LOAD_MIN_FILES = 16
+
+
+def get_results_entry(results, benchmarks):
+    """
+    Extract the data published from a results file: its metadata,
+    and the (benchmark name, value, weight) of each of its results.
+    """
+    points = []
+    for key in sorted(results.get_result_keys(benchmarks)):
+        b_params = benchmarks[key]['params']
+
+        result = results.get_result_value(key, b_params)
+        weight = [statistics.get_weight(s)
+                  for s in results.get_result_stats(key, b_params)]
+        if not b_params:
+            result = result[0]
+            weight = weight[0]
+
+        points.append((key, result, weight))
+
+    return {
+        'commit_hash': results.commit_hash,
+        'date': results.date,
+        'params': results.params,
+        'env_vars': results.env_vars,
+        'started_at': results.started_at,
+        'points': points,
+    }
+
+
+def _load_results_entry(args):
+    path, machine_name, benchmarks = args
+    try:
+        results = Results.load(path, machine_name=machine_name)
+    except util.UserError as exc:
+        return None, six.text_type(exc)
+    if results.incomplete:
+        # Partial results of a run in progress or interrupted
+        return None, None
+    return get_results_entry(results, benchmarks), None
+
+
+class ResultsTable(object):
+    """
+    Columnar table of the published results, with a row for each
+    benchmark result in each results file.
+
+    The rows are stored as parallel lists `benchmark`, `param_set`,
+    `commit`, `value`, `weight` and `started_at`.  Values shared by
+    many rows are stored once: `param_set` indexes `param_sets`, the
+    parameters of the results (with the environment variables
+    prefixed by ``env-``), and `commit` indexes `commit_hashes` and
+    `commit_dates`.
+    """
+
+    def __init__(self):
+        self.param_sets = []
+        self.commit_hashes = []
+        self.commit_dates = []
+
+        self.benchmark = []
+        self.param_set = []
+        self.commit = []
+        self.value = []
+        self.weight = []
+        self.started_at = []
+
+        self._param_set_index = {}
+        self._commit_index = {}
+
+    def __len__(self):
+        return len(self.benchmark)
+
+    def add_entry(self, entry):
+        """
+        Add the rows of an entry from `get_results_entry`.
+        """
+        cur_params = dict(entry['params'])
+        for name, val in six.iteritems(entry['env_vars']):
+            # Prefix them in case of name collision
+            cur_params['env-{}'.format(name)] = val
+
+        key = json.dumps(cur_params, sort_keys=True)
+        param_set = self._param_set_index.get(key)
+        if param_set is None:
+            param_set = self._param_set_index[key] = len(self.param_sets)
+            self.param_sets.append(cur_params)
+
+        commit = self._commit_index.get(entry['commit_hash'])
+        if commit is None:
+            commit = self._commit_index[entry['commit_hash']] = len(self.commit_hashes)
+            self.commit_hashes.append(entry['commit_hash'])
+            self.commit_dates.append(entry['date'])
+        else:
+            self.commit_dates[commit] = entry['date']
+
+        started_at = entry['started_at']
+        n = len(entry['points'])
+        self.param_set.extend([param_set] * n)
+        self.commit.extend([commit] * n)
+        for key, value, weight in entry['points']:
+            self.benchmark.append(key)
+            self.value.append(value)
+            self.weight.append(weight)
+            self.started_at.append(started_at.get(key))
+
+
+class PublishManifest(object):
+    """
+    Record of the inputs and outputs of a previous ``asv publish``,
+    for incremental publishing.  It is stored in the per-user cache of
+    the html directory (see `util.get_user_cache_path`), so that it is
+    not deployed with the website.
+
+    For each results file, it keeps the file modification time and
+    size and the data extracted by `get_results_entry`, so that
+    unchanged files are not loaded again.  For each graph, grouped by
+    benchmark name, it keeps a hash of the graph data, so that
+    unchanged graphs are not written again.  Their step detection
+    results are reused from the `StepsCache`.
+
+    The manifest is valid only for the same asv version,
+    configuration and benchmarks, identified by `key`.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.files = {}
+        self.graphs = {}
+
+    @staticmethod
+    def get_path(html_dir):
+        return util.get_user_cache_path(html_dir, MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, html_dir, key):
+        """
+        Load the manifest of the html directory, or return None if it
+        is missing or not valid for the given key, or if the html
+        directory has no published website.
+        """
+        if not os.path.isfile(os.path.join(html_dir, "index.json")):
+            return None
+
+        try:
+            d = util.load_json(cls.get_path(html_dir), api_version=MANIFEST_VERSION)
+        except (IOError, OSError, util.UserError):
+            return None
+
+        if d.get('key') != key:
+            return None
+
+        obj = cls(key)
+        obj.files = d['files']
+        obj.graphs = d['graphs']
+        return obj
+
+    def save(self, html_dir):
+        path = self.get_path(html_dir)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        util.write_json(path, {'key': self.key, 'files': self.files, 'graphs': self.graphs},
+                        api_version=MANIFEST_VERSION, compact=True)
+
+    @classmethod
+    def remove(cls, html_dir):
+        """
+        Remove the manifest of the html directory, if any.
+        """
+        path = cls.get_path(html_dir)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    @staticmethod
+    def get_key(conf, benchmarks, range_spec):
+        data = {
+            'asv-version': __version__,
+            'benchmarks': dict(benchmarks),
+            'range': range_spec,
+            'results_dir': os.path.abspath(conf.results_dir),
+        }
+        for name in ('project', 'project_url', 'show_commit_url', 'hash_length',
+                     'branches', 'regressions_first_commits', 'regressions_thresholds',
+                     'graph_packs'):
+            data[name] = getattr(conf, name)
+        data = json.dumps(data, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def iter_entries(self, results_dir, benchmarks, parallel=-1):
+        """
+        Iterate over the results entries, loading only the results
+        files changed since the previous publish.  Many files are
+        loaded in parallel processes, unless `parallel` is 1.
+        """
+        items = []
+        to_load = []
+        for root, filename, machine_name, info in iter_results_info(results_dir):
+            path = os.path.join(root, filename)
+            rel_path = os.path.relpath(path, results_dir).replace(os.sep, '/')
+            st = os.stat(path)
+            stamp = [getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size]
+
+            item = self.files.get(rel_path)
+            if item is None or item['stamp'] != stamp:
+                item = {'stamp': stamp, 'entry': None}
+                to_load.append((item, path, machine_name))
+            items.append((rel_path, item))
+
+        # Only the benchmark versions and params are needed
+        benchmarks = dict((name, {'version': b.get('version'), 'params': b['params']})
+                          for name, b in six.iteritems(benchmarks))
+        args = [(path, machine_name, benchmarks) for item, path, machine_name in to_load]
+
+        n_processes, multiprocessing = util.get_multiprocessing(parallel)
+        if multiprocessing is not None and len(to_load) >= PARALLEL_LOAD_MIN_FILES:
+            pool = util.get_multiprocessing_pool(n_processes)
+            try:
+                loaded = pool.map(_load_results_entry, args, chunksize=16)
+                pool.close()
+                pool.join()
+            finally:
+                pool.terminate()
+        else:
+            loaded = [_load_results_entry(x) for x in args]
+
+        for (item, path, machine_name), (entry, error) in zip(to_load, loaded):
+            if error is not None:
+                log.warning(error)
+            item['entry'] = entry
+
+        # Forget removed files
+        self.files = dict((rel_path, item) for rel_path, item in items
+                          if item['entry'] is not None)
+
+        for rel_path, item in items:
+            if item['entry'] is not None:
+                yield item['entry']
+
+
 def check_benchmark_params(name, benchmark):
     """
     Check benchmark params and param_keys items, so that the javascript can
@@ -68,6 +316,16 @@ class Publish(Command):
             '--html-dir', '-o', default=None, help=(
                 "Optional output directory. Default is 'html_dir' "
                 "from asv config"))
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help="""Update the existing website, reading only the results
+            files changed since the last publish, and regenerating only
+            the graphs whose data changed.""")
+        parser.add_argument(
+            "--parallel", "-j", nargs='?', type=int, default=-1, const=-1,
+            help="""Number of processes to use for step detection.  If no
+            number is provided, or by default, use the number of cores
+            on this machine.""")
 
         parser.set_defaults(func=cls.run_from_args)
 
@@ -77,10 +335,11 @@ class Publish(Command):
     def run_from_conf_args(cls, conf, args):
         if args.html_dir is not None:
             conf.html_dir = args.html_dir
-        return cls.run(conf=conf, range_spec=args.range, pull=not args.no_pull)
+        return cls.run(conf=conf, range_spec=args.range, pull=not args.no_pull,
+                       incremental=args.incremental, parallel=args.parallel)
 
     @staticmethod
-    def iter_results(conf, repo, range_spec=None):
+    def iter_results(conf, repo, manifest, benchmarks, range_spec=None, parallel=-1):
         if range_spec is not None:
             if isinstance(range_spec, list):
                 hashes = range_spec
@@ -88,26 +347,34 @@ class Publish(Command):
                 hashes = repo.get_hashes_from_range(range_spec)
         else:
             hashes = None
-        for result in iter_results(conf.results_dir):
-            if hashes is None or result.commit_hash in hashes:
-                yield result
+        for entry in manifest.iter_entries(conf.results_dir, benchmarks, parallel):
+            if hashes is None or entry['commit_hash'] in hashes:
+                yield entry
 
     @classmethod
-    def run(cls, conf, range_spec=None, pull=True):
+    def run(cls, conf, range_spec=None, pull=True, incremental=False, parallel=-1):
         params = {}
-        env_vars = defaultdict(set)
         graphs = GraphSet()
         machines = {}
-        benchmark_names = set()
 
         log.set_nitems(6 + len(list(util.iter_subclasses(OutputPublisher))))
 
-        if os.path.exists(conf.html_dir):
-            util.long_path_rmtree(conf.html_dir)
-
         repo = get_repo(conf)
         benchmarks = Benchmarks.load(conf)
 
+        manifest_key = PublishManifest.get_key(conf, benchmarks, range_spec)
+        manifest = None
+        if incremental:
+            manifest = PublishManifest.load(conf.html_dir, manifest_key)
+            if manifest is None:
+                log.info("No previous publish to update, publishing all results")
+
+        if manifest is None:
+            manifest = PublishManifest(manifest_key)
+            PublishManifest.remove(conf.html_dir)
+            if os.path.exists(conf.html_dir):
+                util.long_path_rmtree(conf.html_dir)
+
         def copy_ignore(src, names):
             # Copy only *.js and *.css in vendor dir
             ignore = [fn for fn in names
@@ -118,7 +385,7 @@ class Publish(Command):
 
         template_dir = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), '..', 'www')
-        shutil.copytree(template_dir, conf.html_dir, ignore=copy_ignore)
+        _copy_tree(template_dir, conf.html_dir, ignore=copy_ignore)
 
         # Ensure html_dir is writable even if template_dir is on a read-only FS
         os.chmod(conf.html_dir, 0o755)
@@ -138,11 +405,15 @@ class Publish(Command):
         log.step()
         log.info("Getting params, commits, tags and branches")
         with log.indent():
-            # Determine first the set of all parameters and all commits
-            hash_to_date = {}
-            for results in cls.iter_results(conf, repo, range_spec):
-                hash_to_date[results.commit_hash] = results.date
-                for key, val in six.iteritems(results.params):
+            # Load all results in a table, and determine first the
+            # set of all parameters and all commits
+            table = ResultsTable()
+            for entry in cls.iter_results(conf, repo, manifest, benchmarks, range_spec,
+                                          parallel):
+                table.add_entry(entry)
+
+            for param_set in table.param_sets:
+                for key, val in six.iteritems(param_set):
                     if val is None:
                         # Backward compatibility -- null means ''
                         val = ''
@@ -150,11 +421,7 @@ class Publish(Command):
                     params.setdefault(key, set())
                     params[key].add(val)
 
-                for name, val in six.iteritems(results.env_vars):
-                    # Prefix them in case of name collision
-                    env_vars["env-{}".format(name)].add(val)
-
-            params.update(env_vars)
+            hash_to_date = dict(zip(table.commit_hashes, table.commit_dates))
 
             if pull:
                 repo.pull()
@@ -169,59 +436,63 @@ class Publish(Command):
             revision_to_date = dict((r, hash_to_date[h]) for h, r in six.iteritems(revisions))
 
             branches = dict(
-                (branch, repo.get_branch_commits(branch))
+                (branch, set(repo.get_branch_commits(branch)))
                 for branch in conf.branches)
 
         log.step()
         log.info("Loading results")
         with log.indent():
-            # Generate all graphs
-            for results in cls.iter_results(conf, repo, range_spec):
+            # Branches and revision of each commit
+            commit_branches = []
+            for commit_hash in table.commit_hashes:
                 log.dot()
 
                 branches_for_commit = [branch for branch, commits in branches.items() if
-                                       results.commit_hash in commits]
+                                       commit_hash in commits]
 
                 # Print a warning message if we couldn't find the branch of a commit
                 if not len(branches_for_commit):
                     msg = "Couldn't find {} in branches ({})"
-                    log.warning(msg.format(results.commit_hash[:conf.hash_length],
+                    log.warning(msg.format(commit_hash[:conf.hash_length],
                                            ", ".join(str(branch) for branch in branches.keys())))
 
-                for key in results.get_result_keys(benchmarks):
-                    b = benchmarks[key]
-                    b_params = b['params']
-
-                    result = results.get_result_value(key, b_params)
-                    weight = [statistics.get_weight(s)
-                              for s in results.get_result_stats(key, b_params)]
-                    if not b_params:
-                        result = result[0]
-                        weight = weight[0]
-
-                    benchmark_names.add(key)
-
-                    for branch in branches_for_commit:
-                        cur_params = dict(results.params)
-                        cur_env = {'env-{}'.format(name): val
-                                   for name, val in six.iteritems(results.env_vars)}
-                        cur_params.update(cur_env)
-                        cur_params['branch'] = repo.get_branch_name(branch)
-
-                        # Backward compatibility, see above
-                        for param_key, param_value in list(cur_params.items()):
-                            if param_value is None:
-                                cur_params[param_key] = ''
-
-                        # Fill in missing params
-                        for param_key in params.keys():
-                            if param_key not in cur_params:
-                                cur_params[param_key] = None
-                                params[param_key].add(None)
+                commit_branches.append(branches_for_commit)
+
+            commit_revisions = [revisions[commit_hash] for commit_hash in table.commit_hashes]
+
+            # Generate all graphs
+            graph_params = {}
+            graph_index = {}
+            for key, param_set, commit, result, weight in six.moves.zip(
+                    table.benchmark, table.param_set, table.commit, table.value, table.weight):
+                for branch in commit_branches[commit]:
+                    graph = graph_index.get((key, param_set, branch))
+                    if graph is None:
+                        cur_params = graph_params.get((param_set, branch))
+                        if cur_params is None:
+                            cur_params = dict(table.param_sets[param_set])
+                            cur_params['branch'] = repo.get_branch_name(branch)
+
+                            # Backward compatibility, see above
+                            for param_key, param_value in list(cur_params.items()):
+                                if param_value is None:
+                                    cur_params[param_key] = ''
+
+                            # Fill in missing params
+                            for param_key in params.keys():
+                                if param_key not in cur_params:
+                                    cur_params[param_key] = None
+                                    params[param_key].add(None)
+
+                            graph_params[(param_set, branch)] = cur_params
 
                         # Create graph
                         graph = graphs.get_graph(key, cur_params)
-                        graph.add_data_point(revisions[results.commit_hash], result, weight)
+                        graph_index[(key, param_set, branch)] = graph
+
+                    graph.add_data_point(commit_revisions[commit], result, weight)
+
+            graphs.results_table = table
 
             # Get the parameter sets for all graphs
             graph_param_list = []
@@ -230,24 +501,53 @@ class Publish(Command):
                     if graph.params not in graph_param_list:
                         graph_param_list.append(graph.params)
 
+            # Find the graphs unchanged since the last publish
+            graphs.load_digests(manifest.graphs)
+
         log.step()
         log.info("Detecting steps")
         with log.indent():
-            n_processes = multiprocessing.cpu_count()
-            pool = util.get_multiprocessing_pool(n_processes)
+            n_processes, multiprocessing = util.get_multiprocessing(parallel)
+            pool = None
+            if multiprocessing is not None:
+                pool = util.get_multiprocessing_pool(n_processes)
+            steps_cache = StepsCache.from_conf(conf)
             try:
-                graphs.detect_steps(pool, dots=log.dot)
-                pool.close()
-                pool.join()
+                graphs.detect_steps(pool, dots=log.dot, cache=steps_cache,
+                                    n_processes=n_processes)
+                if pool is not None:
+                    pool.close()
+                    pool.join()
             finally:
-                pool.terminate()
+                if pool is not None:
+                    pool.terminate()
+                if steps_cache is not None:
+                    steps_cache.close()
+
+            if steps_cache is not None:
+                log.info("Step detection cache: {0} hits, {1} misses".format(
+                    steps_cache.hits, steps_cache.misses))
 
         log.step()
         log.info("Generating graphs")
         with log.indent():
             # Save files
+            if conf.graph_packs:
+                graphs.packs = GraphPacks(conf.html_dir)
             graphs.save(conf.html_dir, dots=log.dot)
 
+            # Remove graphs no longer present
+            for benchmark_name, old_graphs in six.iteritems(manifest.graphs):
+                group = graphs.get_graph_group(benchmark_name)
+                filenames = set(old_graphs) - set(graph.path for graph in group)
+                if not group:
+                    filenames.add(Graph.get_file_path({'summary': ''}, benchmark_name))
+                    if graphs.packs is not None:
+                        graphs.packs.remove(benchmark_name)
+                for filename in filenames:
+                    Graph.remove_files(conf.html_dir, filename)
+            manifest.graphs = graphs.get_digests()
+
         pages = []
         classes = sorted(util.iter_subclasses(OutputPublisher),
                          key=lambda cls: cls.order)
@@ -258,6 +558,9 @@ class Publish(Command):
                 cls.publish(conf, repo, benchmarks, graphs, revisions)
                 pages.append([cls.name, cls.button_label, cls.description])
 
+        if graphs.packs is not None:
+            graphs.packs.write()
+
         log.step()
         log.info("Writing index")
         benchmark_map = dict(benchmarks)
@@ -278,6 +581,9 @@ class Publish(Command):
             'revision_to_date': revision_to_date,
             'params': params,
             'graph_param_list': graph_param_list,
+            'graph_lod': sorted(path.replace(os.sep, '/') for path, graph in graphs
+                                if graph.has_lod_data()),
+            'graph_packs': graphs.packs is not None,
             'benchmarks': benchmark_map,
             'machines': machines,
             'tags': tags,
@@ -288,3 +594,27 @@ class Publish(Command):
             'asv-version': __version__,
             'timestamp': util.datetime_to_js_timestamp(datetime.datetime.utcnow())
         })
+
+        manifest.save(conf.html_dir)
+
+
+def _copy_tree(src, dst, ignore=None):
+    """
+    Copy a directory tree, like `shutil.copytree`, but also into an
+    existing destination directory.
+    """
+    names = os.listdir(src)
+    ignored = set(ignore(src, names)) if ignore is not None else set()
+
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+
+    for name in names:
+        if name in ignored:
+            continue
+        src_name = os.path.join(src, name)
+        dst_name = os.path.join(dst, name)
+        if os.path.isdir(src_name):
+            _copy_tree(src_name, dst_name, ignore=ignore)
+        else:
+            shutil.copy2(src_name, dst_name)
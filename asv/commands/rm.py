@@ -7,12 +7,13 @@ from __future__ import (absolute_import, division, print_function,
 import six
 
 from fnmatch import fnmatchcase
+import os
 import sys
 
 from . import Command
 from .. import console
 from ..console import log
-from ..results import iter_results
+from ..results import Results, iter_results_info, sweep_profiles
 from . import util
 
 
@@ -65,19 +66,33 @@ class Rm(Command):
                         "'{0}' appears more than once".format(parts[0]))
                 global_patterns[parts[0]] = parts[1]
 
-        for result in iter_results(conf.results_dir):
+        for root, filename, machine_name, info in iter_results_info(conf.results_dir, details=True):
+            path = os.path.join(root, filename)
+            result = None
+
+            if info is None or info['commit_hash'] is None:
+                # Not in the results catalog
+                try:
+                    result = Results.load(path, machine_name=machine_name, lazy=True)
+                except util.UserError as exc:
+                    log.warning(six.text_type(exc))
+                    continue
+                info = dict(commit_hash=result.commit_hash, python=result._python,
+                            params=result.params,
+                            benchmarks=list(result.get_all_result_keys()))
+
             found = True
             for key, val in six.iteritems(global_patterns):
                 if key == 'commit_hash':
-                    if not util.hash_equal(result.commit_hash, val):
+                    if not util.hash_equal(info['commit_hash'], val):
                         found = False
                         break
                 elif key == 'python':
-                    if not fnmatchcase(result.env.python, val):
+                    if not fnmatchcase(info['python'], val):
                         found = False
                         break
                 else:
-                    if not fnmatchcase(result.params.get(key), val):
+                    if not fnmatchcase(info['params'].get(key), val):
                         found = False
                         break
 
@@ -85,14 +100,24 @@ class Rm(Command):
                 continue
 
             if single_benchmark is not None:
-                found = False
-                for benchmark in list(result.get_all_result_keys()):
-                    if fnmatchcase(benchmark, single_benchmark):
-                        count += 1
-                        files_to_remove.add(result)
-                        result.remove_result(benchmark)
+                benchmarks = [benchmark for benchmark in info['benchmarks']
+                              if fnmatchcase(benchmark, single_benchmark)]
+                if not benchmarks:
+                    continue
             else:
-                files_to_remove.add(result)
+                benchmarks = []
+
+            if result is None:
+                try:
+                    result = Results.load(path, machine_name=machine_name, lazy=True)
+                except util.UserError as exc:
+                    log.warning(six.text_type(exc))
+                    continue
+
+            files_to_remove.add(result)
+            for benchmark in benchmarks:
+                count += 1
+                result.remove_result(benchmark)
 
         if single_benchmark is not None:
             log.info("Removing {0} benchmarks in {1} files".format(
@@ -111,3 +136,9 @@ class Rm(Command):
         else:
             for result in files_to_remove:
                 result.rm(conf.results_dir)
+
+        # Drop the profiles only the removed results referred to
+        machine_dirs = set(os.path.join(conf.results_dir, os.path.dirname(result._filename))
+                           for result in files_to_remove)
+        for machine_dir in sorted(machine_dirs):
+            sweep_profiles(machine_dir)
@@ -21,9 +21,11 @@ from ..benchmarks import Benchmarks
 from ..console import log
 from ..machine import Machine
 from ..repo import get_repo, NoSuchNameError
-from ..results import (Results, get_existing_hashes,
-                       iter_results_for_machine_and_hash)
+from ..results import (Results, SAMPLES_FORMATS, get_existing_hashes,
+                       iter_results_for_machine, iter_results_for_machine_and_hash)
 from ..runner import run_benchmarks, skip_benchmarks
+from ..setup_cache_store import SetupCacheStore
+from ..planner import DurationHistory, TimeBudgetPlan
 from .. import environment
 from .. import util
 
@@ -107,6 +109,11 @@ class Run(Command):
             "--profile", "-p", action="store_true",
             help="""In addition to timing, run the benchmarks through
             the `cProfile` profiler and store the results.""")
+        parser.add_argument(
+            "--sampler", action="store_true",
+            help="""With --profile, use the low-overhead sampling
+            profiler instead of `cProfile`, and store the results as
+            collapsed stacks.""")
         common_args.add_parallel(parser)
         common_args.add_show_stderr(parser)
         parser.add_argument(
@@ -126,6 +133,14 @@ class Run(Command):
             results. This makes results to be saved also when using an
             existing environment.""")
         common_args.add_launch_method(parser)
+        common_args.add_benchmark_workers(parser)
+        parser.add_argument(
+            "--time-budget", type=lambda value: common_args.time_period(value, 'h'),
+            default=None, metavar="TIME",
+            help="""Run only the benchmarks predicted to fit in the given
+            time (e.g. 30m, 2h), based on their durations in previous
+            results. The newest commits and the least stable benchmarks
+            are prioritized.""")
         parser.add_argument(
             "--dry-run", "-n", action="store_true",
             default=None,
@@ -165,11 +180,14 @@ class Run(Command):
 
     @classmethod
     def run_from_conf_args(cls, conf, args, **kwargs):
+        if args.sampler and not args.profile:
+            raise util.UserError("--sampler can only be used together with --profile")
         return cls.run(
             conf=conf, range_spec=args.range, steps=args.steps, date_period=args.date_period,
             bench=args.bench, attribute=args.attribute, parallel=args.parallel,
             show_stderr=args.show_stderr, quick=args.quick,
-            profile=args.profile, env_spec=args.env_spec, set_commit_hash=args.set_commit_hash,
+            profile=('sampler' if args.profile and args.sampler else args.profile),
+            env_spec=args.env_spec, set_commit_hash=args.set_commit_hash,
             dry_run=args.dry_run, machine=args.machine,
             skip_successful=args.skip_existing_successful or args.skip_existing,
             skip_failed=args.skip_existing_failed or args.skip_existing,
@@ -177,6 +195,8 @@ class Run(Command):
             record_samples=args.record_samples, append_samples=args.append_samples,
             pull=not args.no_pull, interleave_processes=args.interleave_processes,
             launch_method=args.launch_method, durations=args.durations,
+            benchmark_workers=args.benchmark_workers, cores=args.cores,
+            time_budget=args.time_budget,
             **kwargs
         )
 
@@ -187,7 +207,11 @@ class Run(Command):
             dry_run=False, machine=None, _machine_file=None, skip_successful=False,
             skip_failed=False, skip_existing_commits=False, record_samples=False,
             append_samples=False, pull=True, interleave_processes=False,
-            launch_method=None, durations=0, _returns={}):
+            launch_method=None, durations=0, benchmark_workers=1, cores=None,
+            time_budget=None, _returns={}):
+        if cores is not None and benchmark_workers <= 1:
+            raise util.UserError("--cores can only be used together with --benchmark-workers")
+
         machine_params = Machine.load(
             machine_name=machine,
             _path=_machine_file, interactive=True)
@@ -215,6 +239,12 @@ class Run(Command):
         if append_samples:
             record_samples = True
 
+        samples_format = conf.samples_format
+        if samples_format is not None and samples_format not in SAMPLES_FORMATS:
+            raise util.UserError(
+                "Invalid samples_format {0!r} in config file: must be one of {1}".format(
+                    samples_format, ", ".join(SAMPLES_FORMATS)))
+
         repo = get_repo(conf)
         if pull:
             repo.pull()
@@ -321,9 +351,13 @@ class Run(Command):
             if skip_successful or skip_failed or skip_existing_commits:
                 try:
                     for result in iter_results_for_machine_and_hash(
-                            conf.results_dir, machine_params.machine, commit_hash):
+                            conf.results_dir, machine_params.machine, commit_hash,
+                            lazy=skip_existing_commits):
 
                         if skip_existing_commits:
+                            # Interrupted runs are not skipped
+                            if result.incomplete:
+                                continue
                             skipped_benchmarks[commit_hash] = True
                             break
 
@@ -342,6 +376,15 @@ class Run(Command):
                 except IOError:
                     pass
 
+        if time_budget is not None:
+            plan = cls._plan_time_budget(conf, repo, machine_params.machine,
+                                         commit_hashes, environments, benchmarks,
+                                         skipped_benchmarks, time_budget)
+        else:
+            plan = None
+
+        setup_cache_store = SetupCacheStore.from_conf(conf)
+
         if interleave_processes:
             run_round_set = [[j] for j in range(max_processes, 0, -1)]
         else:
@@ -357,6 +400,7 @@ class Run(Command):
                         yield run_rounds, commit_hash
 
         build_durations = defaultdict(lambda: 0)
+        started_at = time.time()
 
         for run_rounds, commit_hash in iter_rounds_commits():
             if commit_hash in skipped_benchmarks:
@@ -472,6 +516,7 @@ class Run(Command):
 
                         if not skip_save:
                             result.load_data(conf.results_dir)
+                            result.open_journal(conf.results_dir)
 
                         if build_duration != 0:
                             result.set_build_duration(build_duration)
@@ -493,17 +538,56 @@ class Run(Command):
                                 record_samples=(record_samples or force_record_samples),
                                 append_samples=(append_samples or force_append_samples),
                                 run_rounds=run_rounds,
-                                launch_method=launch_method)
+                                launch_method=launch_method,
+                                benchmark_workers=benchmark_workers,
+                                cores=cores,
+                                setup_cache_store=setup_cache_store,
+                                expected_durations=(plan.expected_durations[env.name]
+                                                    if plan is not None else None))
                         else:
                             skip_benchmarks(benchmark_set, env, results=result)
 
                         if not skip_save:
-                            result.save(conf.results_dir)
+                            result.save(conf.results_dir, samples_format=samples_format)
 
                         if durations > 0:
                             duration_set = Show._get_durations([(machine, result)], benchmark_set)
                             log.info(cls.format_durations(duration_set[(machine, env.name)], durations))
 
+        if plan is not None:
+            log.info("Time budget {0}: predicted {1}, actual {2}".format(
+                util.human_time(plan.budget), util.human_time(plan.predicted),
+                util.human_time(time.time() - started_at)))
+
+    @classmethod
+    def _plan_time_budget(cls, conf, repo, machine, commit_hashes, environments,
+                          benchmarks, skipped_benchmarks, time_budget):
+        """
+        Select the benchmarks to run within the time budget, and add
+        the others to `skipped_benchmarks`.
+        """
+        history = DurationHistory(iter_results_for_machine(conf.results_dir, machine),
+                                  benchmarks)
+
+        # Newest commits first
+        commit_order = [commit_hash for commit_hash in commit_hashes
+                        if commit_hash not in skipped_benchmarks]
+        if len(commit_order) > 1:
+            commit_order.sort(key=repo.get_date, reverse=True)
+
+        env_names = [env.name for env in environments]
+        plan = TimeBudgetPlan(time_budget, commit_order, env_names, benchmarks, history,
+                              skip=skipped_benchmarks)
+        log.info(plan.get_summary())
+
+        for commit_hash in commit_order:
+            for env_name in env_names:
+                skipped_benchmarks[(commit_hash, env_name)].update(
+                    name for name in benchmarks
+                    if not plan.is_selected(commit_hash, env_name, name))
+
+        return plan
+
     @classmethod
     def format_durations(cls, durations, num_durations):
         items = list(durations.items())
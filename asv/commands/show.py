@@ -224,6 +224,7 @@ class Show(Command):
 
         samples = result.get_result_samples(benchmark['name'], benchmark['params'])
         if not all(x is None for x in samples):
+            samples = [list(x) if x is not None else None for x in samples]
             color_print("  samples: {}".format(samples))
 
         color_print("")
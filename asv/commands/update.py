@@ -7,10 +7,12 @@ from __future__ import (absolute_import, division, print_function,
 import os
 import re
 
+import six
+
 from . import Command
 from ..config import Config
 from ..machine import Machine, MachineCollection
-from ..results import Results, get_filename
+from ..results import Results, SAMPLES_FORMATS, get_filename
 from ..benchmarks import Benchmarks
 from ..console import log
 from .. import util
@@ -26,16 +28,23 @@ class Update(Command):
             description="Update the results and config files "
             "to the current version")
 
+        parser.add_argument(
+            "--samples-format", choices=SAMPLES_FORMATS, default=None,
+            help="""Convert the samples stored in the results files to
+            the given format: 'json' for lists of numbers, 'binary' for
+            a compact encoding of floating point arrays.""")
+
         parser.set_defaults(func=cls.run_from_args)
 
         return parser
 
     @classmethod
     def run_from_args(cls, args, _machine_file=None):
-        return cls.run(args.config, _machine_file=_machine_file)
+        return cls.run(args.config, samples_format=args.samples_format,
+                       _machine_file=_machine_file)
 
     @classmethod
-    def run(cls, config_path, _machine_file=None):
+    def run(cls, config_path, samples_format=None, _machine_file=None):
         MachineCollection.update(_path=_machine_file)
 
         conf = Config.load(config_path)
@@ -52,6 +61,14 @@ class Update(Command):
                 elif filename.endswith('.json'):
                     Results.update(path)
 
+                    if samples_format is not None:
+                        try:
+                            result = Results.load(path)
+                        except util.UserError as exc:
+                            log.warning(six.text_type(exc))
+                        else:
+                            result.save(os.path.dirname(root), samples_format=samples_format)
+
                     # Rename files if necessary
                     m = re.match(r'^([0-9a-f]+)-(.*)\.json$', os.path.basename(path), re.I)
                     if m:
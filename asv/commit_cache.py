@@ -0,0 +1,224 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import os
+import json
+import tempfile
+
+import six
+
+from .console import log
+from . import util
+
+
+COMMIT_CACHE_FILENAME = 'asv-commit-cache.json'
+
+# Bump when the content of the cache file changes
+COMMIT_CACHE_VERSION = 1
+
+# Above this many known ref tips, new commits are looked up without
+# excluding the known history, to keep command lines short
+MAX_EXCLUDED_TIPS = 200
+
+
+class CommitCache(object):
+    """
+    Metadata of the commits in a repository: the ref tips, and for
+    each commit reachable from them, the date and parent hashes.
+
+    The cache is stored as JSON in ``asv-commit-cache.json`` in the
+    repository metadata directory (``.git`` or ``.hg``)::
+
+        {"version": 1,
+         "refs": {ref_name: commit_hash, ...},
+         "commits": {commit_hash: [js_date, [parent_hash, ...]], ...},
+         "revisions": [commit_hash, ...] or null}
+
+    Ref names are ``refs/heads/<branch>`` and ``refs/tags/<tag>``, as
+    in git.  Commits are immutable, so the cache is brought up to date
+    by `update` comparing the current ref tips with the recorded ones,
+    and loading only the commits not reachable from the recorded tips.
+    ``revisions`` is the order of all commits used for
+    `Repo.get_revisions`, and is maintained by the repository plugin.
+
+    If `path` is None, or the file cannot be written, the cache is
+    kept in memory only.
+
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self.refs = None
+        self.commits = {}
+        self.revisions = None
+        self._revision_index = None
+        self._load()
+
+    def _load(self):
+        if self._path is None or not os.path.isfile(self._path):
+            return
+
+        try:
+            data = util.load_json(self._path, api_version=COMMIT_CACHE_VERSION)
+            refs = data['refs']
+            commits = dict((key, (value[0], tuple(value[1])))
+                           for key, value in six.iteritems(data['commits']))
+            revisions = data['revisions']
+        except (IOError, ValueError, KeyError, TypeError, IndexError,
+                util.UserError) as exc:
+            log.debug("Commit cache {0} not usable: {1}".format(self._path, exc))
+            return
+
+        self.refs = refs
+        self.commits = commits
+        self.revisions = revisions
+
+    def save(self):
+        if self._path is None:
+            return
+
+        data = {'version': COMMIT_CACHE_VERSION,
+                'refs': self.refs,
+                'commits': dict((key, [value[0], list(value[1])])
+                                for key, value in six.iteritems(self.commits)),
+                'revisions': self.revisions}
+
+        # Write atomically, as several asv processes may share the
+        # repository
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path),
+                                            suffix='.tmp')
+        except (IOError, OSError) as exc:
+            log.debug("Commit cache {0} not writable: {1}".format(self._path, exc))
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            if os.path.exists(self._path):
+                os.remove(self._path)
+            os.rename(tmp_path, self._path)
+        except (IOError, OSError) as exc:
+            log.debug("Commit cache {0} not writable: {1}".format(self._path, exc))
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def update(self, refs, load_commits):
+        """
+        Bring the cache up to date with the given ref tips.
+
+        Parameters
+        ----------
+        refs : dict
+            Map from ref names to commit hashes.
+        load_commits : callable
+            ``load_commits(exclude)`` returns an iterable of
+            ``(commit_hash, js_date, parent_hashes)`` of the commits
+            reachable from the refs but not from `exclude` (a list of
+            commit hashes).
+
+        Returns
+        -------
+        changed : bool
+            Whether the ref tips differ from the recorded ones.
+
+        """
+        if refs == self.refs:
+            return False
+
+        if any(commit not in self.commits for commit in six.itervalues(refs)):
+            exclude = sorted(set(commit for commit in six.itervalues(self.refs or {})
+                                 if commit in self.commits))
+            if len(exclude) > MAX_EXCLUDED_TIPS:
+                exclude = []
+            for commit_hash, date, parents in load_commits(exclude):
+                self.commits[commit_hash] = (date, tuple(parents))
+
+        self.refs = dict(refs)
+        self.revisions = None
+        self._revision_index = None
+        return True
+
+    def resolve(self, name):
+        """
+        Return the commit hash for a full commit hash, tag or branch
+        name, or None if it is not in the cache.
+        """
+        if name in self.commits:
+            return name
+
+        # Same precedence as git-rev-parse
+        for fmt in ('refs/{0}', 'refs/tags/{0}', 'refs/heads/{0}',
+                    'refs/remotes/{0}', 'refs/remotes/{0}/HEAD'):
+            commit = self.refs.get(fmt.format(name))
+            if commit is not None:
+                return commit
+
+        return None
+
+    def get_date(self, commit_hash):
+        """
+        Return the JavaScript timestamp of a commit, or None if it is
+        not in the cache.
+        """
+        item = self.commits.get(commit_hash)
+        if item is None:
+            return None
+        return item[0]
+
+    def get_tags(self):
+        """
+        Return a dict of tag names and their commit hashes.
+        """
+        prefix = 'refs/tags/'
+        return dict((name[len(prefix):], commit)
+                    for name, commit in six.iteritems(self.refs)
+                    if name.startswith(prefix))
+
+    def get_revisions(self, commits):
+        """
+        Return a dict of the positions of the given commits in
+        ``revisions``.
+        """
+        if self._revision_index is None:
+            self._revision_index = dict((commit, i) for i, commit in enumerate(self.revisions))
+        index = self._revision_index
+        return dict((commit, index[commit]) for commit in commits if commit in index)
+
+    def get_first_parents(self, commit_hash):
+        """
+        Return the commit and its first-parent ancestors, newest first,
+        or None if the history is not fully in the cache.
+        """
+        commits = []
+        while commit_hash is not None:
+            item = self.commits.get(commit_hash)
+            if item is None:
+                return None
+            commits.append(commit_hash)
+            commit_hash = item[1][0] if item[1] else None
+        return commits
+
+    def get_first_parent_range(self, commit_a, commit_b, linear=False):
+        """
+        Return the first-parent ancestors of `commit_b` (inclusive)
+        after `commit_a`, newest first, or None if `commit_a` is not
+        a first-parent ancestor of `commit_b` in the cache.
+
+        If `linear` is True, return None also if there are merge
+        commits in the range.
+        """
+        commits = []
+        commit_hash = commit_b
+        while commit_hash is not None and commit_hash != commit_a:
+            item = self.commits.get(commit_hash)
+            if item is None or (linear and len(item[1]) > 1):
+                return None
+            commits.append(commit_hash)
+            commit_hash = item[1][0] if item[1] else None
+        if commit_hash is None:
+            return None
+        return commits
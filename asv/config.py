@@ -46,6 +46,11 @@ class Config(object):
         self.build_command = None
         self.install_command = None
         self.uninstall_command = None
+        self.samples_format = None
+        self.setup_cache_store_size = 0
+        self.setup_cache_store_by_build = False
+        self.steps_cache_size = 64
+        self.graph_packs = False
 
     @classmethod
     def load(cls, path=None):
@@ -579,6 +579,28 @@ class Environment(object):
     def installed_commit_hash(self):
         return self._get_installed_commit_hash()
 
+    def get_installed_build_hash(self):
+        """
+        Return a hash identifying the installed build of the project:
+        the sha256 of the cached wheel if there is one, otherwise the
+        installed commit hash. Returns None if nothing is installed.
+        """
+        commit_hash = self.installed_commit_hash
+        if commit_hash is None:
+            return None
+
+        cache_dir = self._cache.get_cache_dir(commit_hash)
+        if cache_dir is not None:
+            wheels = [fn for fn in os.listdir(cache_dir) if fn.lower().endswith('.whl')]
+            if len(wheels) == 1:
+                h = hashlib.sha256()
+                with open(os.path.join(cache_dir, wheels[0]), 'rb') as f:
+                    for block in iter(lambda: f.read(1024**2), b''):
+                        h.update(block)
+                return h.hexdigest()
+
+        return commit_hash
+
     @classmethod
     def matches(self, python):
         """
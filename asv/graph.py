@@ -5,6 +5,13 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import os
+import re
+import math
+import json
+import heapq
+import array
+import multiprocessing
+import hashlib
 import traceback
 
 import six
@@ -12,6 +19,7 @@ from six.moves import xrange
 
 from . import util
 from . import step_detect
+from .steps_cache import get_steps_key
 
 from .util import is_na, mean_na, geom_mean_na
 
@@ -23,6 +31,24 @@ from .util import is_na, mean_na, geom_mean_na
 # for width of the line).
 RESAMPLED_POINTS = (3840 / 5 / 2)
 
+# Graphs with more data points than this also get reduced resolution
+# versions of their data (see Graph.get_lod_data).  Each level of
+# detail combines LOD_FACTOR points of the previous one, up to a level
+# with at most LOD_MAX_POINTS points.  The levels, and the full
+# resolution data, are written in chunks of LOD_MAX_POINTS points
+# (see Graph.get_lod_files).
+LOD_MAX_POINTS = 1000
+LOD_FACTOR = 4
+
+# Names of the files of reduced resolution data, replacing ".json" in
+# the path of the graph: the index, and the chunks of each level
+LOD_INDEX_EXT = ".lod.json"
+_lod_file_re = re.compile(r'\.lod([0-9]+-[0-9]+)?\.json$')
+
+# Number of step detection batches to make for each worker process.
+# More batches than processes even out errors in the cost estimates.
+STEPS_BATCHES_PER_PROCESS = 4
+
 
 class GraphSet(object):
     """Manage multiple `Graph`"""
@@ -30,6 +56,16 @@ class GraphSet(object):
     def __init__(self):
         self._graphs = {}
         self._groups = {}
+        self._unchanged = set()
+        self._cached_paths = {}
+
+        # Table of the results the graphs are made from, if available
+        # (see asv.commands.publish.ResultsTable)
+        self.results_table = None
+
+        # GraphPacks to save the graphs to, instead of separate files
+        self.packs = None
+
         super(GraphSet, self).__init__()
 
     def get_graph(self, benchmark_name, params):
@@ -52,27 +88,102 @@ class GraphSet(object):
                     params[key].add(value)
         return params
 
-    def detect_steps(self, pool=None, dots=None):
-        for graph in six.itervalues(self._graphs):
-            graph.detect_steps(pool)
-            if dots is not None and pool is None:
-                dots()
+    def load_digests(self, digests):
+        """
+        Mark the graphs whose data is unchanged since `get_digests` of
+        a previous publish.  These graphs are considered already saved.
+        """
+        self._unchanged = set()
+        self._cached_paths = dict((benchmark_name, set(items))
+                                  for benchmark_name, items in six.iteritems(digests))
+        for benchmark_name, graphs in six.iteritems(self._groups):
+            items = digests.get(benchmark_name, {})
+            for graph in graphs:
+                if items.get(graph.path) == graph.get_digest():
+                    self._unchanged.add(graph.path)
+
+    def get_digests(self):
+        """
+        Return a hash of the data of all graphs, keyed by benchmark
+        name and graph path.
+        """
+        return dict((benchmark_name,
+                     dict((graph.path, graph.get_digest()) for graph in graphs))
+                    for benchmark_name, graphs in six.iteritems(self._groups))
+
+    def detect_steps(self, pool=None, dots=None, cache=None, n_processes=None):
+        """
+        Run step detection on all graphs.
+
+        Parameters
+        ----------
+        pool : multiprocessing.Pool, optional
+            Pool to use.  The series are sent to it in batches, see
+            `detect_graph_steps`.  If not given, run in serial.
+        dots : callable, optional
+            Called once for each graph done.
+        cache : asv.steps_cache.StepsCache, optional
+            Cache of step detection results to use and update.
+        n_processes : int, optional
+            Number of processes in the pool.  Default: number of CPUs.
+
+        """
+        detect_graph_steps(list(six.itervalues(self._graphs)), pool=pool,
+                           dots=dots, cache=cache, n_processes=n_processes)
 
-        # Wait for results to compute
         for graph in six.itervalues(self._graphs):
             graph.get_steps()
-            if dots is not None and pool is not None:
-                dots()
 
-    def get_summary_graphs(self, dots=None):
-        for graphs in six.itervalues(self._groups):
+    def get_summary_graphs(self, dots=None, html_dir=None):
+        """
+        Make the summary graphs of the benchmarks whose graphs changed,
+        were added or removed since `load_digests`.  If `html_dir`
+        is given, also those whose summary file is missing there.
+        """
+        for benchmark_name, graphs in six.iteritems(self._groups):
+            if self._is_unchanged(benchmark_name, graphs, html_dir):
+                continue
             yield make_summary_graph(graphs)
             if dots is not None:
                 dots()
 
+    def _is_unchanged(self, benchmark_name, graphs, html_dir):
+        if self._cached_paths.get(benchmark_name) != set(graph.path for graph in graphs):
+            return False
+        if not all(graph.path in self._unchanged for graph in graphs):
+            return False
+        if html_dir is not None and self.packs is None:
+            path = Graph.get_file_path({'summary': ''}, benchmark_name)
+            if not os.path.isfile(os.path.join(html_dir, path + ".json")):
+                return False
+        return True
+
     def save(self, html_dir, dots=None):
+        if self.packs is not None:
+            # A pack contains all graphs of a benchmark, so it is
+            # rewritten if any of them changed, or were added or removed
+            for benchmark_name, graphs in six.iteritems(self._groups):
+                paths = set(graph.path.replace(os.sep, '/') + ".json" for graph in graphs)
+                paths.add(Graph.get_file_path({'summary': ''}, benchmark_name).replace(
+                    os.sep, '/') + ".json")
+                old_paths = self.packs.get_paths(benchmark_name)
+                if old_paths is not None:
+                    old_paths = set(path for path in old_paths
+                                    if not _lod_file_re.search(path))
+                changed = (old_paths != paths or
+                           any(graph.path not in self._unchanged for graph in graphs))
+                for graph in graphs:
+                    if changed:
+                        self._unchanged.discard(graph.path)
+                        graph.save(html_dir, packs=self.packs)
+                    if dots is not None:
+                        dots()
+            return
+
         for graph in six.itervalues(self._graphs):
-            graph.save(html_dir)
+            if (graph.path not in self._unchanged or
+                    not os.path.isfile(os.path.join(html_dir, graph.path + ".json"))):
+                graph.save(html_dir)
             if dots is not None:
                 dots()
 
@@ -114,6 +225,9 @@ class Graph(object):
         self.n_series = None
         self.scalar_series = True
         self._steps = None
+        self._steps_keys = None
+        self._steps_cache = None
+        self._digest = None
 
     @classmethod
     def get_file_path(cls, params, benchmark_name):
@@ -154,6 +268,7 @@ class Graph(object):
             Missing estimates are indicated with None.
 
         """
+        self._digest = None
         self.data_points.setdefault(revision, [])
         self.data_weights.setdefault(revision, [])
         if not is_na(value):
@@ -219,7 +334,16 @@ class Graph(object):
 
         return val
 
-    def save(self, html_dir):
+    def get_digest(self):
+        """
+        Get a hash of the graph data, to identify unchanged graphs.
+        """
+        if self._digest is None:
+            data = json.dumps([self.scalar_series, self.get_data()])
+            self._digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        return self._digest
+
+    def save(self, html_dir, packs=None):
         """
         Save the graph to a .json file used by the frontend.
 
@@ -227,15 +351,178 @@ class Graph(object):
         ----------
         html_dir : str
             The root of the HTML tree.
+        packs : GraphPacks, optional
+            If given, add the data to the pack of the benchmark,
+            instead of writing files.
         """
         filename = os.path.join(html_dir, self.path + ".json")
 
         # Drop weights
         val = [v[:2] for v in self.get_data()]
+        lod_files = self.get_lod_files()
+
+        if packs is not None:
+            packs.add(self.benchmark_name, self.path + ".json", val)
+            for ext, data in lod_files:
+                packs.add(self.benchmark_name, self.path + ext, data)
+            return
+
+        # Remove the chunks of the previous version not overwritten
+        self.remove_files(html_dir, self.path,
+                          keep=[".json"] + [ext for ext, data in lod_files])
 
         util.write_json(filename, val, compact=True)
+        for ext, data in lod_files:
+            util.write_json(os.path.join(html_dir, self.path + ext), data, compact=True)
+
+    @staticmethod
+    def remove_files(html_dir, path, keep=()):
+        """
+        Remove the files of the graph with the given path from the
+        HTML tree, except those with the extensions in `keep`.  The
+        chunks of reduced resolution data are found from its index.
+        """
+        exts = [".json", LOD_INDEX_EXT]
+        try:
+            index = util.load_json(os.path.join(html_dir, path + LOD_INDEX_EXT))
+            for level, info in enumerate(index['levels']):
+                exts.extend(_get_lod_chunk_ext(level, k)
+                            for k in xrange(len(info['chunks'])))
+        except (IOError, OSError, util.UserError, KeyError, TypeError):
+            pass
+
+        for ext in exts:
+            filename = os.path.join(html_dir, path + ext)
+            if ext not in keep and os.path.isfile(filename):
+                os.remove(filename)
+
+    def has_lod_data(self):
+        """
+        Whether the graph has reduced resolution data, see `get_lod_data`.
+        """
+        return (len(self.data_points) > LOD_MAX_POINTS and
+                len(self.get_data()) > LOD_MAX_POINTS)
+
+    def get_lod_data(self):
+        """
+        Get reduced resolution versions of the graph data, for graphs
+        with more than `LOD_MAX_POINTS` data points.
+
+        Returns
+        -------
+        lod : dict or None
+            None if the graph is small.  Otherwise a dict with keys
+            ``n`` (the number of data points), ``max_points`` and
+            ``levels``.  Each level combines consecutive data points to
+            buckets of ``size`` points, with ``size`` increasing by
+            `LOD_FACTOR` for each level.  The last level has at most
+            ``max_points`` buckets.  A level contains the lists ``x``,
+            ``first`` and ``last``, the revisions of the middle, first
+            and last point of each bucket, and ``min``, ``mean`` and
+            ``max`` of the values in each bucket.
+            For graphs of several series, these are lists of lists,
+            one for each series.  Buckets without values are null.
+
+        """
+        if not self.has_lod_data():
+            return None
+
+        val = self.get_data()
+
+        if self.scalar_series:
+            series = [[v[1] for v in val]]
+        else:
+            series = [[v[1][j] for v in val] for j in range(self.n_series)]
+
+        levels = []
+        size = LOD_FACTOR
+        while True:
+            level = {'size': size, 'x': [], 'first': [], 'last': [],
+                     'min': [], 'mean': [], 'max': []}
+            for i in xrange(0, len(val), size):
+                level['x'].append(val[min(i + size//2, len(val) - 1)][0])
+                level['first'].append(val[i][0])
+                level['last'].append(val[min(i + size, len(val)) - 1][0])
+
+            for key, func in [('min', min), ('mean', mean_na), ('max', max)]:
+                for y in series:
+                    values = []
+                    for i in xrange(0, len(y), size):
+                        chunk = [v for v in y[i:i+size] if not is_na(v)]
+                        values.append(func(chunk) if chunk else None)
+                    level[key].append(values)
+                if self.scalar_series:
+                    level[key] = level[key][0]
+
+            levels.append(level)
+            if len(level['x']) <= LOD_MAX_POINTS:
+                break
+            size *= LOD_FACTOR
+
+        return {'n': len(val), 'max_points': LOD_MAX_POINTS, 'levels': levels}
+
+    def get_lod_files(self):
+        """
+        Get the files of reduced resolution data of the graph, so that
+        the web interface loads only the level of detail and the range
+        of data it shows.
+
+        Returns
+        -------
+        files : list of (ext, data)
+            Empty if the graph is small.  Otherwise, the extensions
+            replacing ``.json`` in the path of the graph, and the JSON
+            data of each file.  The first is the index ``.lod.json``,
+            with keys ``n``, ``max_points`` and ``levels``.  Level 0
+            is the full resolution data, the others the levels of
+            `get_lod_data`.  Each level is split into chunks of
+            `LOD_MAX_POINTS` points, in files ``.lodLEVEL-CHUNK.json``,
+            and its entry in the index has its bucket ``size`` and the
+            list of ``chunks``, with the first and last revisions and
+            the number of points of each one.  The chunks of level 0
+            contain ``[revision, value]`` pairs as the ``.json`` file,
+            those of the other levels the lists of `get_lod_data`.
+
+        """
+        lod = self.get_lod_data()
+        if lod is None:
+            return []
+
+        val = [v[:2] for v in self.get_data()]
+
+        index = {'n': lod['n'], 'max_points': lod['max_points'], 'levels': []}
+        files = [(LOD_INDEX_EXT, index)]
+
+        chunks = []
+        for i in xrange(0, len(val), LOD_MAX_POINTS):
+            chunk = val[i:i+LOD_MAX_POINTS]
+            chunks.append((chunk, [chunk[0][0], chunk[-1][0], len(chunk)]))
+        levels = [(1, chunks)]
+
+        for level in lod['levels']:
+            chunks = []
+            for i in xrange(0, len(level['x']), LOD_MAX_POINTS):
+                chunk = {}
+                for key, values in six.iteritems(level):
+                    if key == 'size':
+                        continue
+                    if self.scalar_series or key in ('x', 'first', 'last'):
+                        chunk[key] = values[i:i+LOD_MAX_POINTS]
+                    else:
+                        chunk[key] = [y[i:i+LOD_MAX_POINTS] for y in values]
+                chunks.append((chunk, [chunk['first'][0], chunk['last'][-1],
+                                       len(chunk['x'])]))
+            levels.append((level['size'], chunks))
+
+        for j, (size, chunks) in enumerate(levels):
+            index['levels'].append({'size': size,
+                                    'chunks': [info for chunk, info in chunks]})
+            for k, (chunk, info) in enumerate(chunks):
+                files.append((_get_lod_chunk_ext(j, k), chunk))
 
-    def detect_steps(self, pool=None):
+        return files
+
+    def detect_steps(self, pool=None, cache=None):
         """
         Run step detection algorithm on the graph data.
 
@@ -246,28 +533,74 @@ class Graph(object):
         pool : multiprocessing.Pool, optional
             Pool to use for asynchronous jobs.
             If not given, run in serial.
+        cache : asv.steps_cache.StepsCache, optional
+            Cache of step detection results to use and update.  If the
+            data of a series is an extension of the data of its last
+            cached result, step detection is done incrementally (see
+            `step_detect.detect_steps_incremental`).
 
+        """
+        detect_graph_steps([self], pool=pool, cache=cache)
+
+    def _get_steps_tasks(self, cache=None):
+        """
+        Look up the cached step detection results, and return the
+        series remaining to compute, as a list of ``(j, item, state)``
+        for each series `j`, with data `item` and the state for
+        incremental step detection `state`.  The results are to be
+        stored as ``(steps, state)`` in ``self._steps[j]``.
         """
         if self._steps is not None:
             # Already computed
-            return
+            return []
 
         val = self.get_data()
 
         if not val:
             # Nothing to compute
             self._steps = [[]]*self.n_series
-            return
+            return []
 
         if self.scalar_series:
             items = [val]
         else:
             items = [[(v[0], v[1][j], v[2][j]) for v in val] for j in range(self.n_series)]
 
-        if pool is None:
-            self._steps = [_compute_graph_steps(item, reraise=False) for item in items]
-        else:
-            self._steps = [pool.apply_async(_compute_graph_steps, (item,)) for item in items]
+        self._steps = []
+        self._steps_keys = []
+        self._steps_cache = cache
+        tasks = []
+        for j, item in enumerate(items):
+            key = None
+            steps = None
+            state = None
+            if cache is not None:
+                key = get_steps_key(item)
+                steps = cache.get(key)
+                if steps is not None:
+                    key = None
+                else:
+                    state = self._get_steps_state(cache, j, item)
+            if steps is None:
+                tasks.append((j, item, state))
+            self._steps.append(steps)
+            self._steps_keys.append(key)
+
+        return tasks
+
+    def _get_steps_state(self, cache, j, item):
+        """
+        Return the state of incremental step detection for series `j`,
+        if its data is an extension of the data the state was computed
+        for.
+        """
+        series_state = cache.get_state('{0}:{1}'.format(self.path, j))
+        if series_state is None:
+            return None
+        state = series_state['state']
+        if get_steps_key(item[:state['n']]) != series_state['key']:
+            return None
+        return state
 
     def get_steps(self):
         """
@@ -288,8 +621,15 @@ class Graph(object):
             self.detect_steps()
 
         for j, item in enumerate(self._steps):
-            if not isinstance(item, list):
-                self._steps[j] = item.get()
+            if isinstance(item, list):
+                continue
+            steps, state = item
+            self._steps[j] = steps
+            key = self._steps_keys[j]
+            if key is not None:
+                self._steps_cache.put(key, steps)
+                self._steps_cache.put_state('{0}:{1}'.format(self.path, j),
+                                            dict(key=key, state=state))
 
         if self.scalar_series:
             return self._steps[0]
@@ -297,19 +637,209 @@ class Graph(object):
             return self._steps
 
 
-def _compute_graph_steps(data, reraise=True):
+def _get_lod_chunk_ext(level, chunk):
+    """
+    Get the extension of a chunk of reduced resolution data, see
+    `Graph.get_lod_files`.  Must match asv.js:graph_lod_url.
+    """
+    return ".lod{0}-{1}.json".format(level, chunk)
+
+
+class GraphPacks(object):
+    """
+    Graph data packed into one file per benchmark, instead of a file
+    per graph.
+
+    ``graph_packs/BENCHMARK_NAME.pack`` contains the JSON data of the
+    graph files of the benchmark, concatenated.
+    ``graph_packs/BENCHMARK_NAME.index.json`` maps the paths of the
+    files, as in ``graphs/``, to the ``[offset, length]`` of their data
+    in the pack, in bytes.  The web interface reads the data of a graph
+    with an HTTP range request.
+    """
+    dirname = 'graph_packs'
+
+    def __init__(self, html_dir):
+        self.html_dir = html_dir
+        self._packs = {}
+
+    @classmethod
+    def get_file_path(cls, benchmark_name):
+        """
+        Get the path of the pack of a benchmark, without the extension.
+        """
+        return os.path.join(cls.dirname, util.sanitize_filename(benchmark_name))
+
+    def get_paths(self, benchmark_name):
+        """
+        Get the set of file paths in the written pack of a benchmark,
+        or None if there is no pack.
+        """
+        filename = os.path.join(self.html_dir, self.get_file_path(benchmark_name))
+        if not os.path.isfile(filename + ".pack"):
+            return None
+        try:
+            index = util.load_json(filename + ".index.json")
+        except (IOError, OSError, util.UserError):
+            return None
+        return set(index)
+
+    def add(self, benchmark_name, path, data):
+        """
+        Add the data of the file `path` to the pack of a benchmark.
+        """
+        # The offsets are the same in bytes and characters
+        data = json.dumps(data, separators=(',', ':'), ensure_ascii=True)
+        self._packs.setdefault(benchmark_name, []).append(
+            (path.replace(os.sep, '/'), data))
+
+    def write(self):
+        """
+        Write the packs of the benchmarks with data added.
+        """
+        for benchmark_name, items in six.iteritems(self._packs):
+            filename = os.path.join(self.html_dir, self.get_file_path(benchmark_name))
+            dirname = util.long_path(os.path.dirname(filename))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            index = {}
+            offset = 0
+            with util.long_path_open(filename + ".pack", 'wb') as f:
+                for path, data in items:
+                    data = data.encode('ascii')
+                    f.write(data)
+                    index[path] = [offset, len(data)]
+                    offset += len(data)
+
+            util.write_json(filename + ".index.json", index, compact=True)
+
+        self._packs = {}
+
+    def remove(self, benchmark_name):
+        """
+        Remove the pack of a benchmark.
+        """
+        filename = os.path.join(self.html_dir, self.get_file_path(benchmark_name))
+        for ext in (".pack", ".index.json"):
+            if os.path.isfile(filename + ext):
+                os.remove(filename + ext)
+
+
+def detect_graph_steps(graphs, pool=None, dots=None, cache=None, n_processes=None):
+    """
+    Run step detection on the series of several graphs.
+
+    With a pool, the series are grouped into batches of about equal
+    estimated cost, ``n*log(n)`` for ``n`` data points, and each batch
+    is sent to a worker process as packed arrays in a single task.
+    The results of a batch are returned together.
+
+    Parameters
+    ----------
+    graphs : list of Graph
+        Graphs to compute.  The results are stored in the graphs, and
+        can be obtained via `Graph.get_steps`.
+    pool : multiprocessing.Pool, optional
+        Pool to use.  If not given, run in serial.
+    dots : callable, optional
+        Called once for each graph done.
+    cache : asv.steps_cache.StepsCache, optional
+        Cache of step detection results to use and update.
+    n_processes : int, optional
+        Number of processes in the pool.  Default: number of CPUs.
+
+    """
+    tasks = []
+    remaining = []
+    for k, graph in enumerate(graphs):
+        graph_tasks = graph._get_steps_tasks(cache)
+        tasks.extend((k, j, item, state) for j, item, state in graph_tasks)
+        remaining.append(len(graph_tasks))
+        if not graph_tasks and dots is not None:
+            dots()
+
+    def store(task, result):
+        k, j = task[:2]
+        graphs[k]._steps[j] = result
+        remaining[k] -= 1
+        if remaining[k] == 0 and dots is not None:
+            dots()
+
+    if pool is None:
+        for task in tasks:
+            k, j, item, state = task
+            store(task, _compute_graph_steps(item, reraise=False, state=state))
+        return
+
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+
+    batches = _get_steps_batches(tasks, n_processes * STEPS_BATCHES_PER_PROCESS)
+    args = [[_pack_graph_steps_data(tasks[i][2]) + (tasks[i][3],) for i in batch]
+            for batch in batches]
+
+    for k, results in pool.imap_unordered(_compute_graph_steps_batch, enumerate(args)):
+        for i, result in zip(batches[k], results):
+            store(tasks[i], result)
+
+
+def _get_steps_batches(tasks, n_batches):
+    """
+    Divide the step detection tasks into at most `n_batches` batches
+    of about equal estimated cost.  Returns lists of task indices,
+    the most costly batches first.
+    """
+    def cost(task):
+        n = len(task[2])
+        return n * math.log(n + 1)
+
+    n_batches = max(1, min(n_batches, len(tasks)))
+    heap = [(0, k) for k in range(n_batches)]
+    batches = [[] for k in range(n_batches)]
+
+    # Largest task first to the least loaded batch
+    for i in sorted(range(len(tasks)), key=lambda i: -cost(tasks[i])):
+        total, k = heapq.heappop(heap)
+        batches[k].append(i)
+        heapq.heappush(heap, (total + cost(tasks[i]), k))
+
+    totals = sorted(heap, reverse=True)
+    return [batches[k] for total, k in totals if batches[k]]
+
+
+def _pack_graph_steps_data(data):
+    """
+    Pack ``(x, y, w)`` data points to arrays, with missing values as nan.
+    """
+    nan = float('nan')
+    x = array.array('l', [d[0] for d in data])
+    y = array.array('d', [nan if d[1] is None else d[1] for d in data])
+    w = array.array('d', [nan if d[2] is None else d[2] for d in data])
+    return x, y, w
+
+
+def _compute_graph_steps_batch(args):
+    k, batch = args
+    results = []
+    for x, y, w, state in batch:
+        results.append(_compute_graph_steps(list(zip(x, y, w)), state=state))
+    return k, results
+
+
+def _compute_graph_steps(data, reraise=True, state=None):
     try:
         x = [d[0] for d in data]
         y = [d[1] for d in data]
         w = [d[2] for d in data]
 
-        steps = step_detect.detect_steps(y, w)
+        steps, state = step_detect.detect_steps_incremental(y, w, state=state)
         new_steps = []
 
         for left, right, cur_val, cur_min, cur_err in steps:
             new_steps.append((x[left], x[right-1] + 1, cur_val, cur_min, cur_err))
 
-        return new_steps
+        return new_steps, state
     except BaseException as exc:
         if reraise:
             raise util.ParallelFailure(str(exc), exc.__class__, traceback.format_exc())
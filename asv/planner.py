@@ -0,0 +1,213 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+
+"""
+Planning of benchmark runs within a time budget, based on the
+durations recorded in previous results.
+"""
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import math
+from collections import defaultdict
+
+import six
+
+from . import util
+
+
+class DurationHistory(object):
+    """
+    Durations and stability of benchmarks in previous results.
+
+    Parameters
+    ----------
+    result_iter : iterable of Results
+        Previous results to use.
+    benchmarks : Benchmarks
+        Benchmarks to consider.
+    max_results : int, optional
+        Number of most recent results per environment to use.
+
+    """
+
+    def __init__(self, result_iter, benchmarks, max_results=10):
+        # Retain the most recent results in each environment
+        by_env = defaultdict(list)
+        for result in result_iter:
+            by_env[result.env_name].append(result)
+
+        self._durations = defaultdict(lambda: defaultdict(list))
+        self._instability = defaultdict(lambda: defaultdict(list))
+
+        for env_name, results in six.iteritems(by_env):
+            results.sort(key=lambda result: result.date or 0, reverse=True)
+            for result in results[:max_results]:
+                for key, value in six.iteritems(result.duration):
+                    if value is not None:
+                        self._durations[env_name][key].append(value)
+
+                for key in result.get_result_keys(benchmarks):
+                    value = _get_instability(result, key, benchmarks[key])
+                    if value is not None:
+                        self._instability[env_name][key].append(value)
+
+    def get_duration(self, env_name, key):
+        """
+        Return the median previous duration of a benchmark (or of
+        ``<build>`` or ``<setup_cache ...>`` steps), or None if unknown.
+        """
+        values = self._durations[env_name].get(key)
+        if not values:
+            return None
+        return _median(values)
+
+    def get_instability(self, env_name, key):
+        """
+        Return the median relative width of the confidence interval of
+        previous results of a benchmark, or 0 if unknown.
+        """
+        values = self._instability[env_name].get(key)
+        if not values:
+            return 0
+        return _median(values)
+
+
+class TimeBudgetPlan(object):
+    """
+    Selection of benchmarks to run in each commit and environment,
+    so that the predicted total duration fits in a time budget.
+
+    Jobs are selected in order of priority: newest commits first, and
+    within a commit, the historically least stable benchmarks first.
+    Jobs that do not fit in the remaining budget are skipped, but
+    smaller ones may still be selected. The predicted duration of a
+    job includes the project build and the setup_cache it needs, the
+    first time they are needed.
+
+    Benchmarks without previous durations are assumed to take the
+    median duration of the others in the same environment, or their
+    timeout if there is none.
+
+    Parameters
+    ----------
+    budget : float
+        Time budget in seconds.
+    commit_hashes : list of str
+        Commits to consider, newest first.
+    env_names : list of str
+        Environments to consider.
+    benchmarks : Benchmarks
+        Benchmarks to consider.
+    history : DurationHistory
+        Previous durations.
+    skip : dict, optional
+        Benchmarks already skipped, as a dict mapping (commit_hash,
+        env_name) to a set of benchmark names.
+
+    """
+
+    def __init__(self, budget, commit_hashes, env_names, benchmarks, history, skip=None):
+        if skip is None:
+            skip = {}
+
+        self.budget = budget
+        self.expected_durations = {}
+
+        for env_name in env_names:
+            known = [history.get_duration(env_name, name) for name in benchmarks]
+            known = [value for value in known if value is not None]
+            fallback = _median(known) if known else None
+
+            expected = {}
+            for name, benchmark in six.iteritems(benchmarks):
+                value = history.get_duration(env_name, name)
+                if value is None:
+                    value = fallback if fallback is not None else benchmark['timeout']
+                expected[name] = value
+            self.expected_durations[env_name] = expected
+
+        jobs = []
+        for rank, commit_hash in enumerate(commit_hashes):
+            for env_name in env_names:
+                skipped = skip.get((commit_hash, env_name), ())
+                for name in benchmarks:
+                    if name in skipped:
+                        continue
+                    jobs.append((rank,
+                                 -history.get_instability(env_name, name),
+                                 -self.expected_durations[env_name][name],
+                                 name, commit_hash, env_name))
+        jobs.sort()
+
+        self.selected = defaultdict(set)
+        self.num_jobs = len(jobs)
+        self.predicted = 0
+        steps_started = set()
+
+        for _, _, _, name, commit_hash, env_name in jobs:
+            cost = self.expected_durations[env_name][name]
+            steps = []
+
+            step = (commit_hash, env_name, "<build>")
+            if step not in steps_started:
+                steps.append(step)
+                cost += history.get_duration(env_name, "<build>") or 0
+
+            setup_cache_key = benchmarks[name].get('setup_cache_key')
+            if setup_cache_key is not None:
+                key = "<setup_cache {}>".format(setup_cache_key)
+                step = (commit_hash, env_name, key)
+                if step not in steps_started:
+                    steps.append(step)
+                    cost += history.get_duration(env_name, key) or 0
+
+            if self.predicted + cost > budget:
+                continue
+
+            self.predicted += cost
+            steps_started.update(steps)
+            self.selected[(commit_hash, env_name)].add(name)
+
+    @property
+    def num_selected(self):
+        return sum(len(names) for names in six.itervalues(self.selected))
+
+    def is_selected(self, commit_hash, env_name, name):
+        return name in self.selected.get((commit_hash, env_name), ())
+
+    def get_summary(self):
+        commits = set(commit_hash for commit_hash, env_name in self.selected)
+        return ("Time budget {0}: selected {1} of {2} benchmark runs, in {3} "
+                "commits, predicted to take {4}".format(
+                    util.human_time(self.budget), self.num_selected, self.num_jobs,
+                    len(commits), util.human_time(self.predicted)))
+
+
+def _get_instability(result, key, benchmark):
+    try:
+        values = result.get_result_value(key, benchmark['params'])
+        stats = result.get_result_stats(key, benchmark['params'])
+    except KeyError:
+        return None
+
+    widths = []
+    for value, stat in zip(values, stats):
+        if not stat or 'ci_99' not in stat or not value:
+            continue
+        a, b = stat['ci_99']
+        if a is None or b is None:
+            continue
+        width = (b - a) / abs(value)
+        if not (math.isnan(width) or math.isinf(width)):
+            widths.append(width)
+
+    if not widths:
+        return None
+    return max(widths)
+
+
+def _median(values):
+    values = sorted(values)
+    n = len(values)
+    return (values[(n - 1) // 2] + values[n // 2]) / 2
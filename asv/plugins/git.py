@@ -14,6 +14,7 @@ import shlex
 
 from ..console import log
 from ..repo import Repo, NoSuchNameError
+from ..commit_cache import CommitCache, COMMIT_CACHE_FILENAME
 from .. import util
 
 
@@ -25,6 +26,7 @@ class Git(Repo):
         self._git = util.which("git")
         self._path = os.path.abspath(mirror_path)
         self._pulled = False
+        self._commit_cache = None
 
         if self.is_local_repo(url):
             # Local repository, no need for mirror
@@ -88,6 +90,7 @@ class Git(Repo):
         log.info("Fetching recent changes")
         self._run_git(['fetch', 'origin'])
         self._pulled = True
+        self._commit_cache = None
 
     def checkout(self, path, commit_hash):
         def checkout_existing(display_error):
@@ -113,12 +116,73 @@ class Git(Repo):
                           cwd=None)
             checkout_existing(display_error=True)
 
+    def _get_commit_cache(self):
+        """
+        Return the commit metadata cache, brought up to date with the
+        ref tips on first use.  The refs are assumed not to change
+        during the run of asv, except by `pull`.
+        """
+        if self._commit_cache is not None:
+            return self._commit_cache
+
+        if os.path.isdir(os.path.join(self._path, '.git')):
+            cache_path = os.path.join(self._path, '.git', COMMIT_CACHE_FILENAME)
+        elif os.path.isdir(os.path.join(self._path, 'objects')):
+            cache_path = os.path.join(self._path, COMMIT_CACHE_FILENAME)
+        else:
+            cache_path = None
+
+        cache = CommitCache(cache_path)
+
+        refs = {}
+        fmt = '%(objectname) %(objecttype) %(*objectname) %(*objecttype) %(refname)'
+        for line in self._run_git(['for-each-ref', '--format=' + fmt],
+                                  dots=False).splitlines():
+            parts = line.split(' ', 4)
+            if len(parts) != 5:
+                continue
+            if parts[1] == 'commit':
+                refs[parts[4]] = parts[0]
+            elif parts[3] == 'commit':
+                # Annotated tag
+                refs[parts[4]] = parts[2]
+
+        def load_commits(exclude):
+            args = ['rev-list', '--all', '--format=%at %P']
+            if exclude:
+                args += ['--not'] + exclude
+            lines = self._run_git(args, dots=False).splitlines()
+            for header, line in zip(lines[::2], lines[1::2]):
+                items = line.split()
+                yield header.split()[-1], int(items[0]) * 1000, items[1:]
+
+        if cache.update(refs, load_commits):
+            cache.save()
+
+        self._commit_cache = cache
+        return cache
+
     def get_date(self, hash):
+        date = self._get_commit_cache().get_date(hash)
+        if date is not None:
+            return date
         return int(self._run_git(
             ['rev-list', '-n', '1', '--format=%at', hash],
             valid_return_codes=(0, 1), dots=False).strip().split()[-1]) * 1000
 
     def get_hashes_from_range(self, range_spec):
+        cache = self._get_commit_cache()
+        names = range_spec.split('..')
+        if range_spec and not any(c.isspace() for c in range_spec) and len(names) <= 2:
+            commits = [cache.resolve(name) for name in names]
+            if None not in commits:
+                if len(commits) == 2:
+                    hashes = cache.get_first_parent_range(*commits)
+                else:
+                    hashes = cache.get_first_parents(commits[0])
+                if hashes is not None:
+                    return hashes
+
         args = ['rev-list', '--first-parent']
         if range_spec != "":
             args += shlex.split(range_spec)
@@ -165,22 +229,22 @@ class Git(Repo):
         return name
 
     def get_tags(self):
-        tags = {}
-        for tag in self._run_git(["tag", "-l"]).splitlines():
-            tags[tag] = self._run_git(["rev-list", "-n", "1", tag]).strip()
-        return tags
+        return self._get_commit_cache().get_tags()
 
     def get_date_from_name(self, name):
+        commit = self._get_commit_cache().resolve(name)
+        if commit is not None:
+            return self.get_date(commit)
         return self.get_date(name + "^{commit}")
 
     def get_branch_commits(self, branch):
         return self.get_hashes_from_range(self.get_branch_name(branch))
 
     def get_revisions(self, commits):
-        revisions = {}
-        for i, commit in enumerate(self._run_git([
-            "rev-list", "--all", "--date-order", "--reverse",
-        ]).splitlines()):
-            if commit in commits:
-                revisions[commit] = i
-        return revisions
+        cache = self._get_commit_cache()
+        if cache.revisions is None:
+            cache.revisions = self._run_git([
+                "rev-list", "--all", "--date-order", "--reverse",
+            ]).splitlines()
+            cache.save()
+        return cache.get_revisions(commits)
@@ -18,6 +18,7 @@ except ImportError as exc:
 
 from ..console import log
 from ..repo import Repo, NoSuchNameError
+from ..commit_cache import CommitCache, COMMIT_CACHE_FILENAME
 from .. import util
 
 
@@ -34,6 +35,7 @@ class Hg(Repo):
 
         self._path = os.path.abspath(mirror_path)
         self._pulled = False
+        self._commit_cache = None
         if hglib is None:
             raise ImportError("hglib")
 
@@ -109,6 +111,7 @@ class Hg(Repo):
         log.info("Fetching recent changes")
         self._repo.pull()
         self._pulled = True
+        self._commit_cache = None
 
     def checkout(self, path, commit_hash):
         # Need to pull -- the copy is not updated automatically, since
@@ -135,12 +138,77 @@ class Hg(Repo):
                         dest=self._encode_filename(path))
             checkout_existing()
 
+    def _get_commit_cache(self):
+        """
+        Return the commit metadata cache, brought up to date with the
+        heads and tags on first use.  The repository is assumed not to
+        change during the run of asv, except by `pull`.
+        """
+        if self._commit_cache is not None:
+            return self._commit_cache
+
+        cache = CommitCache(os.path.join(self._path, '.hg', COMMIT_CACHE_FILENAME))
+
+        refs = {}
+        for name, rev, node in self._repo.branches():
+            refs['refs/heads/' + self._decode(name)] = self._decode(node)
+        for name, rev, node, islocal in self._repo.tags():
+            if name != b'tip':
+                refs['refs/tags/' + self._decode(name)] = self._decode(node)
+        for node in self._repo.log(b"head()"):
+            refs['heads/' + self._decode(node.node)] = self._decode(node.node)
+
+        null_node = '0' * 40
+        loaded = []
+        reloaded = []
+
+        def load_commits(exclude):
+            revset = "all()"
+            if exclude:
+                revset = "not ::({0})".format(" or ".join(exclude))
+            else:
+                reloaded.append(True)
+            template = "{node} {date|hgdate} {p1node} {p2node}\\n"
+            output = self._decode(self._repo.rawcommand(
+                [b"log", b"-r", self._encode("sort({0}, rev)".format(revset)),
+                 b"--template", self._encode(template)]))
+            for line in output.splitlines():
+                node, date, tz, p1, p2 = line.split()
+                loaded.append(node)
+                yield node, int(date) * 1000, [p for p in (p1, p2) if p != null_node]
+
+        revisions = cache.revisions
+        if cache.update(refs, load_commits):
+            # Revision numbers only increase, so that new commits can
+            # be appended to the revision order
+            if reloaded:
+                cache.revisions = loaded
+            elif revisions is not None:
+                cache.revisions = revisions + loaded
+            cache.save()
+
+        self._commit_cache = cache
+        return cache
+
     def get_date(self, hash):
+        date = self._get_commit_cache().get_date(hash)
+        if date is not None:
+            return date
+
         # TODO: This works on Linux, but should be extended for other platforms
         rev = self._repo.log(self._encode(hash))[0]
         return int(rev.date.strftime("%s")) * 1000
 
     def get_hashes_from_range(self, range_spec, **kwargs):
+        if not kwargs:
+            # Range between two commits, see get_range_spec
+            m = re.match(r'^(\w+)::(\w+) and not \1$', range_spec)
+            if m:
+                commits = self._get_commit_cache().get_first_parent_range(
+                    m.group(1), m.group(2), linear=True)
+                if commits is not None:
+                    return commits
+
         range_spec = self._encode("sort({0}, -rev)".format(range_spec))
         return [self._decode(rev.node) for rev in self._repo.log(range_spec, **kwargs)]
 
@@ -162,10 +230,7 @@ class Hg(Repo):
         return None
 
     def get_tags(self):
-        tags = {}
-        for item in self._repo.log(b"tag()"):
-            tags[self._decode(item.tags)] = self._decode(item.node)
-        return tags
+        return self._get_commit_cache().get_tags()
 
     def get_date_from_name(self, name):
         return self.get_date(name)
@@ -179,9 +244,8 @@ class Hg(Repo):
                                           followfirst=True)
 
     def get_revisions(self, commits):
-        revisions = {}
-        for i, item in enumerate(self._repo.log(b"all()")):
-            node = self._decode(item.node)
-            if node in commits:
-                revisions[node] = i
-        return revisions
+        cache = self._get_commit_cache()
+        if cache.revisions is None:
+            cache.revisions = [self._decode(item.node) for item in self._repo.log(b"all()")]
+            cache.save()
+        return cache.get_revisions(commits)
@@ -54,7 +54,8 @@ class Regressions(OutputPublisher):
                                         graph_data, graph)
 
         cls._save(conf, {'regressions': regressions})
-        cls._save_feed(conf, benchmarks, regressions, revisions, revision_to_hash)
+        cls._save_feed(conf, benchmarks, regressions, revisions, revision_to_hash,
+                       results_table=graphs.results_table)
 
     @classmethod
     def _process_regression(cls, regressions, revision_to_hash, repo, all_params,
@@ -93,7 +94,8 @@ class Regressions(OutputPublisher):
         util.write_json(fn, data, compact=True)
 
     @classmethod
-    def _save_feed(cls, conf, benchmarks, data, revisions, revision_to_hash):
+    def _save_feed(cls, conf, benchmarks, data, revisions, revision_to_hash,
+                   results_table=None):
         """
         Save the results as an Atom feed
         """
@@ -104,23 +106,32 @@ class Regressions(OutputPublisher):
         # was run --- if it is missing, use the date of the commit
         run_timestamps = {}
         revision_timestamps = {}
-        for results in iter_results(conf.results_dir):
-            if results.commit_hash not in revisions:
-                # revisions could be filtered when specifying a range
-                # in 'asv publish'
-                continue
-            revision = revisions[results.commit_hash]
-            revision_timestamps[revision] = results.date
+        if results_table is not None:
+            # revisions could be filtered when specifying a range
+            # in 'asv publish'
+            commit_revisions = [revisions.get(commit_hash)
+                                for commit_hash in results_table.commit_hashes]
+            for revision, date in zip(commit_revisions, results_table.commit_dates):
+                if revision is not None:
+                    revision_timestamps[revision] = date
 
             # Time when the benchmark was run
-            for benchmark_name, timestamp in six.iteritems(results.started_at):
-                key = (benchmark_name, revision)
-                run_timestamps[key] = timestamp
+            for benchmark_name, commit, timestamp in zip(results_table.benchmark,
+                                                         results_table.commit,
+                                                         results_table.started_at):
+                revision = commit_revisions[commit]
+                if revision is not None and timestamp is not None:
+                    run_timestamps[(benchmark_name, revision)] = timestamp
+        else:
+            for results in iter_results(conf.results_dir, lazy=True):
+                if results.commit_hash not in revisions:
+                    continue
+                revision = revisions[results.commit_hash]
+                revision_timestamps[revision] = results.date
 
-            # Fallback to commit date
-            for benchmark_name in results.get_result_keys(benchmarks):
-                key = (benchmark_name, revision)
-                run_timestamps.setdefault(key, results.date)
+                for benchmark_name, timestamp in six.iteritems(results.started_at):
+                    key = (benchmark_name, revision)
+                    run_timestamps[key] = timestamp
 
         # Generate feed entries
         entries = []
@@ -143,7 +154,9 @@ class Regressions(OutputPublisher):
                     graph_params['p-' + k] = v
 
             for rev1, rev2, value1, value2 in jumps:
-                timestamps = (run_timestamps[benchmark_name, t] for t in (rev1, rev2) if t is not None)
+                # Fallback to commit date
+                timestamps = (run_timestamps.get((benchmark_name, t), revision_timestamps[t])
+                              for t in (rev1, rev2) if t is not None)
                 last_timestamp = max(timestamps)
 
                 updated = datetime.datetime.fromtimestamp(last_timestamp/1000)
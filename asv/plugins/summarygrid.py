@@ -16,6 +16,6 @@ class SummaryGrid(OutputPublisher):
     @classmethod
     def publish(cls, conf, repo, benchmarks, graphs, revisions):
         # Generate and save summary graphs
-        summaries = graphs.get_summary_graphs(dots=log.dot)
+        summaries = graphs.get_summary_graphs(dots=log.dot, html_dir=conf.html_dir)
         for graph in summaries:
-            graph.save(conf.html_dir)
+            graph.save(conf.html_dir, packs=graphs.packs)
@@ -113,6 +113,9 @@ class SummaryList(OutputPublisher):
 
         # Write results to files
         for path, data in six.iteritems(results):
+            data = sorted(data, key=lambda x: (x['name'], x['idx']))
+            if graphs.packs is not None:
+                graphs.packs.add('summary', path, data)
+                continue
             filename = os.path.join(conf.html_dir, path)
-            util.write_json(filename, sorted(data, key=lambda x: (x['name'], x['idx'])),
-                            compact=True)
+            util.write_json(filename, data, compact=True)
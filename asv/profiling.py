@@ -4,6 +4,9 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import hashlib
+from xml.sax.saxutils import escape
+
 
 class ProfilerGui(object):
     """
@@ -28,3 +31,103 @@ class ProfilerGui(object):
         profiler file.
         """
         raise NotImplementedError()
+
+
+def parse_collapsed_stacks(data):
+    """
+    Parse data in the collapsed stack format, as written by the
+    sampling profiler, into a dict from tuples of frame names
+    (outermost first) to sample counts.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+
+    stacks = {}
+    for line in data.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if not stack:
+            continue
+        key = tuple(stack.split(';'))
+        stacks[key] = stacks.get(key, 0) + int(count)
+    return stacks
+
+
+def render_flamegraph_svg(data, title="Flame Graph", width=1200):
+    """
+    Render data in the collapsed stack format as a flame graph SVG
+    image, with the outermost frames at the bottom.
+
+    Returns
+    -------
+    svg : str
+        SVG document
+
+    """
+    frame_height = 16
+    font_size = 12
+    char_width = 0.6 * font_size
+    top_margin = 2 * frame_height
+
+    # Merge the stacks to a tree of (count, children) nodes
+    root = [0, {}]
+    for stack, count in parse_collapsed_stacks(data).items():
+        root[0] += count
+        node = root
+        for frame in stack:
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+
+    total = root[0]
+    scale = float(width) / total if total else 0
+
+    # Lay out frames, children in alphabetical order
+    rects = []
+    max_depth = 0
+    todo = [(root[1], 0, 0)]
+    while todo:
+        children, x, depth = todo.pop()
+        for name in sorted(children):
+            count, grandchildren = children[name]
+            if count * scale >= 0.1:
+                rects.append((x, depth, count, name))
+                max_depth = max(max_depth, depth + 1)
+                todo.append((grandchildren, x, depth + 1))
+            x += count
+
+    height = top_margin + max_depth * frame_height
+
+    lines = [
+        '<?xml version="1.0" standalone="no"?>',
+        '<svg version="1.1" width="{0}" height="{1}" '
+        'xmlns="http://www.w3.org/2000/svg">'.format(width, height),
+        '<style>text {{ font-family: monospace; font-size: {0}px; }}</style>'.format(font_size),
+        '<text x="{0}" y="{1}" text-anchor="middle">{2}</text>'.format(
+            width / 2.0, frame_height, escape(title)),
+    ]
+
+    for x, depth, count, name in rects:
+        rect_x = x * scale
+        rect_y = height - (depth + 1) * frame_height
+        rect_width = count * scale
+
+        # Stable warm colors, by function name
+        h = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:6], 16)
+        color = "rgb({0},{1},{2})".format(
+            205 + h % 50, (h >> 8) % 200, (h >> 16) % 55)
+
+        label = name
+        max_chars = int((rect_width - 6) // char_width)
+        if len(label) > max_chars:
+            label = label[:max_chars - 2] + ".." if max_chars > 2 else ""
+
+        lines.append(
+            '<g><title>{0} ({1} samples, {2:.2f}%)</title>'
+            '<rect x="{3:.2f}" y="{4}" width="{5:.2f}" height="{6}" '
+            'fill="{7}" rx="2" ry="2"/>'
+            '<text x="{8:.2f}" y="{9}">{10}</text></g>'.format(
+                escape(name), count, 100.0 * count / total,
+                rect_x, rect_y, rect_width, frame_height - 1, color,
+                rect_x + 3, rect_y + frame_height - 4, escape(label)))
+
+    lines.append('</svg>')
+    return "\n".join(lines) + "\n"
@@ -5,13 +5,18 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import sys
+import array
 import base64
 import os
 import re
 import zlib
+import json
 import itertools
 import hashlib
 import datetime
+import tempfile
+import threading
+import collections
 
 import six
 from six.moves import zip as izip
@@ -19,13 +24,189 @@ from six.moves import zip as izip
 from . import environment
 from .console import log
 from .machine import Machine
+from .results_catalog import ResultsCatalog
 from . import statistics
 from . import util
 
 
-def iter_results_paths(results):
+PROFILE_DIR_NAME = 'profiles'
+
+# Suffix of the journal file next to a results file, see `Results.open_journal`
+JOURNAL_SUFFIX = '.journal'
+
+# Journal entry fields, and the Results attributes they are stored in
+_JOURNAL_FIELDS = (
+    ('result', '_results'),
+    ('samples', '_samples'),
+    ('stats', '_stats'),
+    ('params', '_benchmark_params'),
+    ('started_at', '_started_at'),
+    ('duration', '_duration'),
+    ('version', '_benchmark_version'),
+    ('cpu_affinity', '_cpu_affinity'),
+    ('profile_hash', '_profiles'),
+    ('profile_format', '_profile_formats'),
+)
+
+# Ways of storing samples in results files: JSON lists of numbers, or
+# base64-encoded little-endian float64 arrays
+SAMPLES_FORMATS = ('json', 'binary')
+
+# Size of the first read when parsing a results file header
+_HEADER_CHUNK_SIZE = 16 * 1024
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def get_profile_path(machine_dir, profile_hash, profile_format='pstats'):
     """
-    Iterate over all of the result file paths.
+    Get the path of a stored profile, in the profile store of a
+    machine results directory.
+    """
+    return os.path.join(machine_dir, PROFILE_DIR_NAME,
+                        "{0}.{1}.z".format(profile_hash, profile_format))
+
+
+def _store_profile(machine_dir, profile_hash, profile_format, compressed_data):
+    """
+    Write compressed profile data to the profile store, unless
+    already present.
+    """
+    path = get_profile_path(machine_dir, profile_hash, profile_format)
+    if os.path.isfile(path):
+        return
+
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    # Write atomically, so that concurrent writers of the same
+    # profile do not produce truncated files
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed_data)
+        if not os.path.isfile(path):
+            os.rename(tmp_path, path)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+
+def sweep_profiles(machine_dir, candidates=None):
+    """
+    Delete profiles in the profile store of a machine results
+    directory that are not referenced by any of its results files.
+
+    The referenced profiles are looked up in the results catalog,
+    which parses only the results files changed since it was last
+    updated.
+
+    Parameters
+    ----------
+    machine_dir : str
+        Path to the machine results directory.
+    candidates : set of (profile_hash, profile_format), optional
+        If given, only these profiles are considered for removal.
+
+    Returns
+    -------
+    removed : list of str
+        Paths of the deleted profiles.
+
+    """
+    profile_dir = os.path.join(machine_dir, PROFILE_DIR_NAME)
+    if not os.path.isdir(profile_dir):
+        return []
+
+    results_dir, machine = os.path.split(os.path.abspath(machine_dir))
+    catalog = ResultsCatalog.open(results_dir)
+    if catalog is not None:
+        # Journals of runs in progress are replayed by the catalog
+        with catalog:
+            referenced = catalog.update(machine).get_profiles(machine)
+        if referenced is None:
+            # Cannot tell which profiles the files refer to
+            log.warning("Not removing unused profiles: some results files in "
+                        "'{0}' could not be loaded".format(machine_dir))
+            return []
+    else:
+        referenced = set()
+        for filename in os.listdir(machine_dir):
+            if (filename in ('machine.json', 'benchmarks.json') or
+                    not filename.endswith('.json')):
+                continue
+            try:
+                result = Results.load(os.path.join(machine_dir, filename), lazy=True)
+            except util.UserError as exc:
+                log.warning("Not removing unused profiles: {0}".format(
+                    six.text_type(exc)))
+                return []
+            for key, profile_hash in six.iteritems(result._profiles):
+                referenced.add((profile_hash, result.get_profile_format(key)))
+
+    removed = []
+    for filename in os.listdir(profile_dir):
+        parts = filename.split('.')
+        if len(parts) != 3 or parts[2] != 'z':
+            # Temporary files of concurrent writers
+            continue
+        key = (parts[0], parts[1])
+        if key in referenced or (candidates is not None and key not in candidates):
+            continue
+        path = os.path.join(profile_dir, filename)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+
+    return removed
+
+
+class _Journal(object):
+    """
+    Append-only log of changes to the results of a results file, one
+    JSON object per line.  Each line is flushed to disk as written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = open(path, 'ab')
+
+    def write(self, entry):
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        with self._lock:
+            self._fd.write(line)
+            self._fd.flush()
+            os.fsync(self._fd.fileno())
+
+    def close(self):
+        with self._lock:
+            self._fd.close()
+
+    @staticmethod
+    def read(path):
+        """
+        Iterate over the entries in a journal file, up to the first
+        incomplete one (left by an interrupted write).
+        """
+        with open(path, 'rb') as fd:
+            for line in fd:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+
+
+def _walk_results_paths(results):
+    """
+    Iterate over all of the result file paths, by walking the
+    directory tree.
     """
     skip_files = set([
         'machine.json', 'benchmarks.json'
@@ -45,6 +226,9 @@ def iter_results_paths(results):
                 machine_json)
         else:
             machine_json_err = None
+            # Don't descend into the profile store
+            if PROFILE_DIR_NAME in dirs:
+                dirs.remove(PROFILE_DIR_NAME)
 
         # Iterate over files
         for filename in files:
@@ -57,37 +241,79 @@ def iter_results_paths(results):
                 yield (root, filename, machine_name)
 
 
-def iter_results(results):
+def iter_results_info(results, machine_dir=None, details=False):
+    """
+    Iterate over the result files, with the information recorded in
+    the results catalog, without loading the files.
+
+    Yields (root, filename, machine_name, info), where info is a dict
+    as returned by `ResultsCatalog.iter_files`, or None if the catalog
+    is not available.  If `details` is True, info includes the params
+    and benchmark names.
+    """
+    catalog = ResultsCatalog.open(results)
+
+    if catalog is None:
+        if machine_dir is not None:
+            results = os.path.join(results, machine_dir)
+        for root, filename, machine_name in _walk_results_paths(results):
+            yield root, filename, machine_name, None
+        return
+
+    with catalog:
+        items = list(catalog.update(machine_dir).iter_files(machine_dir, details=details))
+
+    for root, filename, info in items:
+        yield root, filename, info['machine'], info
+
+
+def iter_results_paths(results):
+    """
+    Iterate over all of the result file paths.
+    """
+    for root, filename, machine_name, info in iter_results_info(results):
+        yield (root, filename, machine_name)
+
+
+def iter_results(results, machine_dir=None, lazy=False):
     """
     Iterate over all of the result files.
+
+    If `lazy` is True, only the header of each file is loaded up
+    front; see `Results.load`.
     """
-    for (root, filename, machine_name) in iter_results_paths(results):
+    for root, filename, machine_name, info in iter_results_info(results, machine_dir):
         try:
-            yield Results.load(os.path.join(root, filename), machine_name=machine_name)
+            yield Results.load(os.path.join(root, filename), machine_name=machine_name,
+                               lazy=lazy)
         except util.UserError as exc:
             log.warning(six.text_type(exc))
 
 
-def iter_results_for_machine(results, machine_name):
+def iter_results_for_machine(results, machine_name, lazy=False):
     """
     Iterate over all of the result files for a particular machine.
     """
-    return iter_results(os.path.join(results, machine_name))
+    return iter_results(results, machine_dir=machine_name, lazy=lazy)
 
 
-def iter_results_for_machine_and_hash(results, machine_name, commit):
+def iter_results_for_machine_and_hash(results, machine_name, commit, lazy=False):
     """
     Iterate over all of the result files with a given hash for a
     particular machine.
     """
-    full_commit = get_result_hash_from_prefix(results, machine_name, commit)
+    items = [(root, filename, r_machine_name)
+             for root, filename, r_machine_name, info
+             in iter_results_info(results, machine_name)]
+
+    full_commit = _match_hash_prefix(items, machine_name, commit)
 
-    for (root, filename, machine_name) in iter_results_paths(
-            os.path.join(results, machine_name)):
+    for root, filename, r_machine_name in items:
         results_commit = filename.split('-')[0]
         if results_commit == full_commit:
             try:
-                yield Results.load(os.path.join(root, filename), machine_name=machine_name)
+                yield Results.load(os.path.join(root, filename), machine_name=r_machine_name,
+                                   lazy=lazy)
             except util.UserError as exc:
                 log.warning(six.text_type(exc))
 
@@ -99,8 +325,16 @@ def iter_existing_hashes(results):
 
     May return duplicates.  Use `get_existing_hashes` if that matters.
     """
-    for result in iter_results(results):
-        yield result.commit_hash
+    for root, filename, machine_name, info in iter_results_info(results):
+        if info is not None:
+            if info['commit_hash'] is not None:
+                yield info['commit_hash']
+            continue
+
+        try:
+            yield Results.load(os.path.join(root, filename)).commit_hash
+        except util.UserError as exc:
+            log.warning(six.text_type(exc))
 
 
 def get_existing_hashes(results):
@@ -121,11 +355,20 @@ def get_result_hash_from_prefix(results, machine_name, commit_prefix):
     Returns None if there are no matches. Raises a UserError
     if the prefix is non-unique.
     """
-    commits = set([])
+    items = [(root, filename, r_machine_name)
+             for root, filename, r_machine_name, info
+             in iter_results_info(results, machine_name)]
+    return _match_hash_prefix(items, machine_name, commit_prefix)
 
-    path = os.path.join(results, machine_name)
 
-    for (root, filename, r_machine_name) in iter_results_paths(path):
+def _match_hash_prefix(items, machine_name, commit_prefix):
+    """
+    Find the result commit identifier matching a prefix, among the
+    (root, filename, machine_name) of the result files of a machine.
+    """
+    commits = set([])
+
+    for root, filename, r_machine_name in items:
         if r_machine_name != machine_name:
             log.warning("Skipping results '{0}': machine name is not '{1}'".format(
                 os.path.join(root, filename), machine_name))
@@ -163,6 +406,125 @@ def get_filename(machine, commit_hash, env_name):
             env_name))
 
 
+def _read_results_file(path, size=-1):
+    open_kwargs = {}
+    if sys.version_info[0] >= 3:
+        open_kwargs['encoding'] = 'utf-8'
+
+    with util.long_path_open(path, 'r', **open_kwargs) as fd:
+        return fd.read(size)
+
+
+def _parse_results_header(content):
+    """
+    Parse the keys of the JSON object in `content` that precede the
+    ``results`` key.
+
+    Returns (header, offset), where offset is the position of the
+    ``results`` value in `content`, or None if there is no such key.
+    Raises ValueError if `content` is not valid JSON, or ends before
+    the ``results`` key.
+    """
+    pos = _json_whitespace.match(content, 0).end()
+    if content[pos:pos + 1] != '{':
+        raise ValueError("expected '{{' at position {0}".format(pos))
+    pos += 1
+
+    header = {}
+    while True:
+        pos = _json_whitespace.match(content, pos).end()
+        if content[pos:pos + 1] == '}' and not header:
+            return header, None
+
+        key, pos = _json_decoder.raw_decode(content, pos)
+        pos = _json_whitespace.match(content, pos).end()
+        if content[pos:pos + 1] != ':':
+            raise ValueError("expected ':' at position {0}".format(pos))
+        pos = _json_whitespace.match(content, pos + 1).end()
+
+        if key == 'results':
+            return header, pos
+
+        header[key], pos = _json_decoder.raw_decode(content, pos)
+
+        # Check the next character is present, so that a number cut
+        # at the end of the content is not taken as complete
+        pos = _json_whitespace.match(content, pos).end()
+        if content[pos:pos + 1] == ',':
+            pos += 1
+        elif content[pos:pos + 1] == '}':
+            return header, None
+        else:
+            raise ValueError("expected ',' or '}}' at position {0}".format(pos))
+
+
+def _load_results_header(path, api_version):
+    """
+    Load the header of a results file, reading only the beginning of
+    the file.
+
+    Returns (header, offset) as `_parse_results_header`, or (None,
+    None) if the file is not laid out with the header first and the
+    results last, as written by `Results.save`.
+    """
+    size = _HEADER_CHUNK_SIZE
+    while True:
+        content = _read_results_file(path, size)
+        try:
+            header, offset = _parse_results_header(content)
+            break
+        except ValueError:
+            if len(content) < size:
+                # Whole file read: let the full load report the error
+                return None, None
+            size *= 4
+
+    # Results.save writes the version first and the results last.
+    # Files without the version before the results may have more
+    # header keys after them.
+    if offset is None or header.get('version') != api_version:
+        return None, None
+
+    del header['version']
+    return header, offset
+
+
+def _encode_samples(samples):
+    """
+    Encode a list of samples as base64 of little-endian float64 values.
+    Lists that cannot be encoded are returned as they are.
+    """
+    try:
+        values = array.array('d', samples)
+    except TypeError:
+        return samples
+    if sys.byteorder == 'big':
+        values.byteswap()
+    if six.PY2:
+        data = values.tostring()
+    else:
+        data = values.tobytes()
+    return base64.b64encode(data).decode('ascii')
+
+
+def _decode_samples(samples):
+    """
+    Decode samples encoded by `_encode_samples` to an array of floats.
+    Lists of samples are returned as they are.
+    """
+    if not isinstance(samples, six.string_types):
+        return samples
+    values = array.array('d')
+    data = base64.b64decode(samples)
+    if six.PY2:
+        values.fromstring(data)
+    else:
+        values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
 def _compatible_results(result, result_params, params):
     """
     For parameterized benchmarks, obtain values from *result* that
@@ -192,6 +554,10 @@ class Results(object):
     """
     api_version = 1
 
+    # Attributes decoded from the file on first access, for lazily
+    # loaded results
+    _lazy_attrs = ('_results', '_samples', '_stats', '_benchmark_params')
+
     def __init__(self,
                  params,
                  requirements,
@@ -235,11 +601,17 @@ class Results(object):
         self._stats = {}
         self._benchmark_params = {}
         self._profiles = {}
+        self._new_profiles = {}
+        self._profile_formats = {}
+        # Profiles no longer referenced, removed from the store on save
+        self._dropped_profiles = set()
+        self._samples_format = 'json'
         self._python = python
         self._env_name = env_name
         self._started_at = {}
         self._duration = {}
         self._benchmark_version = {}
+        self._cpu_affinity = {}
         self._env_vars = env_vars
 
         # Note: stderr and errcode are not saved to files
@@ -252,6 +624,68 @@ class Results(object):
         else:
             self._filename = None
 
+        # Root of the results tree, once loaded or saved
+        self._result_dir = None
+
+        # (path, offset) of the results not yet decoded, see `load`
+        self._lazy_results = None
+
+        # Journal of the results added, see `open_journal`
+        self._journal = None
+
+        # Whether the file was written before a run finished
+        self._incomplete = False
+
+    def __getattr__(self, name):
+        # Called only for attributes not set, i.e. the results of
+        # lazily loaded files not yet decoded
+        if name in self._lazy_attrs and self.__dict__.get('_lazy_results') is not None:
+            self._load_lazy_results()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def _load_lazy_results(self):
+        path, offset = self._lazy_results
+        try:
+            results, _ = _json_decoder.raw_decode(_read_results_file(path), offset)
+        except ValueError as exc:
+            raise util.UserError(
+                "Error parsing JSON in file '{0}': {1}".format(
+                    path, six.text_type(exc)))
+        self._lazy_results = None
+        self._set_results(results)
+
+    def _set_results(self, results):
+        self._results = {}
+        self._samples = {}
+        self._stats = {}
+        self._benchmark_params = {}
+
+        for key, value in six.iteritems(results):
+            # Backward compatibility
+            if not isinstance(value, dict):
+                value = {'result': [value], 'samples': None,
+                         'stats': None, 'params': []}
+
+            if not isinstance(value['result'], list):
+                value['result'] = [value['result']]
+
+            if 'stats' in value and not isinstance(value['stats'], list):
+                value['stats'] = [value['stats']]
+
+            value.setdefault('samples', None)
+            value.setdefault('stats', None)
+            value.setdefault('params', [])
+
+            if value['samples'] is not None:
+                value['samples'] = [_decode_samples(x) for x in value['samples']]
+
+            # Assign results
+            self._results[key] = value['result']
+            self._samples[key] = value['samples']
+            self._stats[key] = value['stats']
+            self._benchmark_params[key] = value['params']
+
     @classmethod
     def unnamed(cls):
         return cls({}, {}, None, None, None, None, {})
@@ -272,6 +706,14 @@ class Results(object):
     def env_vars(self):
         return self._env_vars
 
+    @property
+    def incomplete(self):
+        """
+        Whether the results file is of a run that has not finished:
+        interrupted, or still in progress.
+        """
+        return self._incomplete
+
     @property
     def started_at(self):
         return self._started_at
@@ -282,14 +724,21 @@ class Results(object):
 
     def set_build_duration(self, value):
         self._duration["<build>"] = float(value)
+        self._write_journal("<build>")
 
     def set_setup_cache_duration(self, setup_cache_key, value):
-        self._duration["<setup_cache {}>".format(setup_cache_key)] = float(value)
+        key = "<setup_cache {}>".format(setup_cache_key)
+        self._duration[key] = float(value)
+        self._write_journal(key)
 
     @property
     def benchmark_version(self):
         return self._benchmark_version
 
+    @property
+    def cpu_affinity(self):
+        return self._cpu_affinity
+
     @property
     def stderr(self):
         return self._stderr
@@ -392,7 +841,8 @@ class Results(object):
         -------
         samples : {None, list}
             Raw result samples. If the benchmark is parameterized,
-            return a list of values.
+            return a list of values.  Samples loaded from files in
+            the binary samples format are `array.array` objects.
 
         """
         return _compatible_results(self._samples[key],
@@ -415,7 +865,10 @@ class Results(object):
         del self._stats[key]
 
         # Remove profiles (may be missing)
+        self._drop_profile(key)
         self._profiles.pop(key, None)
+        self._new_profiles.pop(key, None)
+        self._profile_formats.pop(key, None)
 
         # Remove run times (may be missing in old files)
         self._started_at.pop(key, None)
@@ -424,6 +877,11 @@ class Results(object):
         # Remove version (may be missing)
         self._benchmark_version.pop(key, None)
 
+        # Remove CPU affinity (may be missing)
+        self._cpu_affinity.pop(key, None)
+
+        self._write_journal(key)
+
     def remove_samples(self, key, selected_idx=None):
         """
         Remove measurement samples from the selected benchmark.
@@ -437,11 +895,14 @@ class Results(object):
             for j in selected_idx:
                 self._samples[key][j] = None
 
+        self._write_journal(key)
+
     def add_result(self, benchmark, result,
                    started_at=None, duration=None,
                    record_samples=False,
                    append_samples=False,
-                   selected_idx=None):
+                   selected_idx=None,
+                   cpu_affinity=None):
         """
         Add benchmark result.
 
@@ -468,6 +929,9 @@ class Results(object):
         selected_idx : set, optional
             Which indices in a parametrized benchmark to update
 
+        cpu_affinity : list of int, optional
+            CPUs the benchmark was pinned to.
+
         """
         new_result = list(result.result)
         new_samples = list(result.samples)
@@ -489,7 +953,7 @@ class Results(object):
                 old_samples = self.get_result_samples(benchmark_name, benchmark['params'])
                 for j in range(len(new_samples)):
                     if old_samples[j] is not None and new_samples[j] is not None:
-                        new_samples[j] = old_samples[j] + new_samples[j]
+                        new_samples[j] = list(old_samples[j]) + new_samples[j]
 
             # Retain old result where requested
             merge_idx = [j for j in range(len(new_result))
@@ -512,6 +976,8 @@ class Results(object):
 
             if n is not None:
                 new_result[j], new_stats[j] = statistics.compute_stats(s, n)
+            elif result.stats is not None and result.stats[j] is not None:
+                new_stats[j] = result.stats[j]
 
         # Compress None lists to just None
         if all(x is None for x in new_result):
@@ -537,17 +1003,92 @@ class Results(object):
         else:
             self._duration[benchmark_name] = float(duration)
         self._benchmark_version[benchmark_name] = benchmark_version
+        if cpu_affinity is None:
+            self._cpu_affinity.pop(benchmark_name, None)
+        else:
+            self._cpu_affinity[benchmark_name] = list(cpu_affinity)
 
         self._stderr[benchmark_name] = result.stderr
         self._errcode[benchmark_name] = result.errcode
 
+        self._drop_profile(benchmark_name)
         if result.profile:
-            profile_data = base64.b64encode(zlib.compress(result.profile))
-            if sys.version_info[0] >= 3:
-                profile_data = profile_data.decode('ascii')
-            self._profiles[benchmark_name] = profile_data
+            self._profiles[benchmark_name] = hashlib.sha256(result.profile).hexdigest()
+            self._new_profiles[benchmark_name] = zlib.compress(result.profile)
+            if result.profile_format not in (None, 'pstats'):
+                self._profile_formats[benchmark_name] = result.profile_format
+            else:
+                self._profile_formats.pop(benchmark_name, None)
+        else:
+            self._profiles.pop(benchmark_name, None)
+            self._new_profiles.pop(benchmark_name, None)
+            self._profile_formats.pop(benchmark_name, None)
+
+        self._write_journal(benchmark_name)
+
+    def open_journal(self, result_dir):
+        """
+        Record the results added from now on in a journal next to the
+        results file, as each one is added.
+
+        If the run is interrupted, the results in the journal are
+        loaded with the results file.  The journal is merged into the
+        results file and removed by `save`.  If there is no results
+        file yet, one without results is written, marked as
+        `incomplete` until saved.
+        """
+        if self._filename is None:
+            raise ValueError("Cannot journal unnamed Results")
+
+        path = os.path.join(result_dir, self._filename)
+        if not os.path.isfile(path):
+            # Make the results findable before the first save, marked
+            # as incomplete until then
+            self._incomplete = True
+            try:
+                self.save(result_dir)
+            finally:
+                self._incomplete = False
+
+        self.close_journal()
+        self._journal = _Journal(path + JOURNAL_SUFFIX)
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write_journal(self, key):
+        if self._journal is None:
+            return
+
+        # Profiles are written to the store at once
+        if key in self._new_profiles:
+            _store_profile(os.path.dirname(self._journal.path), self._profiles[key],
+                           self.get_profile_format(key), self._new_profiles.pop(key))
+
+        entry = {'key': key}
+        for field, attr in _JOURNAL_FIELDS:
+            values = getattr(self, attr)
+            if key in values:
+                entry[field] = values[key]
+        if entry.get('samples') is not None:
+            entry['samples'] = [list(x) if x is not None else None
+                                for x in entry['samples']]
+
+        self._journal.write(entry)
+
+    def _replay_journal(self, path):
+        for entry in _Journal.read(path):
+            key = entry['key']
+            for field, attr in _JOURNAL_FIELDS:
+                values = getattr(self, attr)
+                if field in entry:
+                    values[key] = entry[field]
+                else:
+                    values.pop(key, None)
 
-    def get_profile(self, benchmark_name):
+    def get_profile(self, benchmark_name, result_dir=None):
         """
         Get the profile data for the given benchmark name.
 
@@ -555,17 +1096,50 @@ class Results(object):
         ----------
         benchmark_name : str
             Name of benchmark
+        result_dir : str, optional
+            Path to root of results tree, where the profile is stored.
+            Not needed for results loaded from or saved to disk.
 
         Returns
         -------
         profile_data : bytes
-            Raw profile data
+            Raw profile data, in the format given by
+            `get_profile_format`.
 
         """
-        profile_data = self._profiles[benchmark_name]
-        if sys.version_info[0] >= 3:
-            profile_data = profile_data.encode('ascii')
-        return zlib.decompress(base64.b64decode(profile_data))
+        profile_hash = self._profiles[benchmark_name]
+
+        if benchmark_name in self._new_profiles:
+            compressed_data = self._new_profiles[benchmark_name]
+        else:
+            if result_dir is None:
+                result_dir = self._result_dir
+            if result_dir is None or self._filename is None:
+                raise ValueError("Cannot locate profile for unsaved Results")
+
+            machine_dir = os.path.join(result_dir, os.path.dirname(self._filename))
+            path = get_profile_path(machine_dir, profile_hash,
+                                    self.get_profile_format(benchmark_name))
+            try:
+                with open(path, 'rb') as f:
+                    compressed_data = f.read()
+            except (IOError, OSError) as exc:
+                raise util.UserError(
+                    "Failed to load profile for {0}: {1}".format(benchmark_name, exc))
+
+        return zlib.decompress(compressed_data)
+
+    def _drop_profile(self, key):
+        if key in self._profiles:
+            self._dropped_profiles.add((self._profiles[key], self.get_profile_format(key)))
+
+    def get_profile_format(self, benchmark_name):
+        """
+        Get the format of the profile data for the given benchmark
+        name: 'pstats' for cProfile data, or 'collapsed' for collapsed
+        stacks from the sampling profiler.
+        """
+        return self._profile_formats.get(benchmark_name, 'pstats')
 
     def has_profile(self, benchmark_name):
         """
@@ -573,7 +1147,7 @@ class Results(object):
         """
         return benchmark_name in self._profiles
 
-    def save(self, result_dir):
+    def save(self, result_dir, samples_format=None):
         """
         Save the results to disk, replacing existing results.
 
@@ -581,18 +1155,40 @@ class Results(object):
         ----------
         result_dir : str
             Path to root of results tree.
+        samples_format : {'json', 'binary'}, optional
+            How to store the samples, see `SAMPLES_FORMATS`.  By
+            default, the format of the loaded file is kept.
         """
         if self._filename is None:
             raise ValueError("Cannot save unnamed Results")
 
+        if samples_format is not None:
+            if samples_format not in SAMPLES_FORMATS:
+                raise ValueError("Unknown samples format: {0!r}".format(samples_format))
+            self._samples_format = samples_format
+
+        if self._samples_format == 'binary':
+            encode_samples = _encode_samples
+        else:
+            encode_samples = list
+
         path = os.path.join(result_dir, self._filename)
 
+        # Profiles are stored separately from the results
+        machine_dir = os.path.dirname(path)
+        for key, compressed_data in six.iteritems(self._new_profiles):
+            _store_profile(machine_dir, self._profiles[key],
+                           self.get_profile_format(key), compressed_data)
+        self._new_profiles = {}
+        self._result_dir = result_dir
+
         results = {}
         for key in six.iterkeys(self._samples):
             # Save omitting default values
             value = {'result': self._results[key]}
             if self._samples[key] and any(x is not None for x in self._samples[key]):
-                value['samples'] = self._samples[key]
+                value['samples'] = [encode_samples(x) if x is not None else None
+                                    for x in self._samples[key]]
             if self._stats[key] and any(x is not None for x in self._stats[key]):
                 value['stats'] = self._stats[key]
             if self._benchmark_params[key]:
@@ -603,23 +1199,52 @@ class Results(object):
                     value = value[0]
             results[key] = value
 
-        data = {
-            'results': results,
-            'env_vars': self._env_vars,
-            'params': self._params,
-            'requirements': self._requirements,
-            'commit_hash': self._commit_hash,
-            'date': self._date,
-            'env_name': self._env_name,
-            'python': self._python,
-            'profiles': self._profiles,
-            'started_at': self._started_at,
-            'duration': self._duration,
-            'benchmark_version': self._benchmark_version,
-        }
+        # The results go last, so that the header can be read without
+        # them (see `load`)
+        data = collections.OrderedDict([
+            ('commit_hash', self._commit_hash),
+            ('env_name', self._env_name),
+            ('date', self._date),
+            ('params', self._params),
+            ('python', self._python),
+            ('requirements', self._requirements),
+            ('env_vars', self._env_vars),
+            ('started_at', self._started_at),
+            ('duration', self._duration),
+            ('benchmark_version', self._benchmark_version),
+            ('profile_hashes', self._profiles),
+        ])
+
+        if self._cpu_affinity:
+            data['cpu_affinity'] = self._cpu_affinity
+
+        if self._profile_formats:
+            data['profile_formats'] = self._profile_formats
+
+        if self._samples_format != 'json':
+            data['samples_format'] = self._samples_format
+
+        if self._incomplete:
+            data['incomplete'] = True
+
+        data['results'] = results
 
         util.write_json(path, data, self.api_version, compact=True)
 
+        # The journal is now merged into the results file
+        self.close_journal()
+        if os.path.isfile(path + JOURNAL_SUFFIX):
+            os.remove(path + JOURNAL_SUFFIX)
+
+        catalog = ResultsCatalog.open(result_dir)
+        if catalog is not None:
+            with catalog:
+                catalog.add_results(self, path)
+
+        if self._dropped_profiles:
+            sweep_profiles(machine_dir, self._dropped_profiles)
+            self._dropped_profiles = set()
+
     def load_data(self, result_dir):
         """
         Load previous results for the current parameters (if any).
@@ -632,12 +1257,15 @@ class Results(object):
         if os.path.isfile(path):
             old = self.load(path)
             for dict_name in ('_results', '_samples', '_stats', '_env_vars',
-                              '_benchmark_params', '_profiles', '_started_at',
-                              '_duration', '_benchmark_version'):
+                              '_benchmark_params', '_profiles', '_new_profiles',
+                              '_profile_formats', '_samples_format',
+                              '_started_at', '_duration',
+                              '_benchmark_version', '_cpu_affinity'):
                 setattr(self, dict_name, getattr(old, dict_name))
+            self._result_dir = result_dir
 
     @classmethod
-    def load(cls, path, machine_name=None):
+    def load(cls, path, machine_name=None, lazy=False):
         """
         Load results from disk.
 
@@ -647,9 +1275,21 @@ class Results(object):
             Path to results file.
         machine_name : str, optional
             If given, check that the results file is for the given machine.
+        lazy : bool, optional
+            If True, read only the header of the file (commit hash,
+            date, params, timestamps, ...), and decode the benchmark
+            results on first access.  For files written by older
+            versions of asv, the whole file is loaded.
 
         """
-        d = util.load_json(path, cls.api_version)
+        journal_path = path + JOURNAL_SUFFIX
+        has_journal = os.path.isfile(journal_path)
+
+        d = results_offset = None
+        if lazy and not has_journal:
+            d, results_offset = _load_results_header(path, cls.api_version)
+        if d is None:
+            d = util.load_json(path, cls.api_version)
         d.setdefault('env_vars', {})
 
         try:
@@ -667,40 +1307,39 @@ class Results(object):
                 d['env_vars'],
             )
 
-            obj._results = {}
-            obj._samples = {}
-            obj._stats = {}
-            obj._benchmark_params = {}
-
-            for key, value in six.iteritems(d['results']):
-                # Backward compatibility
-                if not isinstance(value, dict):
-                    value = {'result': [value], 'samples': None,
-                             'stats': None, 'params': []}
-
-                if not isinstance(value['result'], list):
-                    value['result'] = [value['result']]
-
-                if 'stats' in value and not isinstance(value['stats'], list):
-                    value['stats'] = [value['stats']]
-
-                value.setdefault('samples', None)
-                value.setdefault('stats', None)
-                value.setdefault('params', [])
-
-                # Assign results
-                obj._results[key] = value['result']
-                obj._samples[key] = value['samples']
-                obj._stats[key] = value['stats']
-                obj._benchmark_params[key] = value['params']
+            if results_offset is None:
+                obj._set_results(d['results'])
+            else:
+                for name in cls._lazy_attrs:
+                    delattr(obj, name)
+                obj._lazy_results = (path, results_offset)
 
+            obj._samples_format = d.get('samples_format', 'json')
+            obj._profiles = d.get('profile_hashes', {})
+            obj._profile_formats = d.get('profile_formats', {})
             if 'profiles' in d:
-                obj._profiles = d['profiles']
+                # Backward compatibility: profiles stored inline,
+                # moved to the profile store on next save
+                for key, profile_data in six.iteritems(d['profiles']):
+                    if sys.version_info[0] >= 3:
+                        profile_data = profile_data.encode('ascii')
+                    compressed_data = base64.b64decode(profile_data)
+                    obj._profiles[key] = hashlib.sha256(
+                        zlib.decompress(compressed_data)).hexdigest()
+                    obj._new_profiles[key] = compressed_data
+
             obj._filename = os.path.join(*path.split(os.path.sep)[-2:])
+            obj._result_dir = os.path.dirname(os.path.dirname(os.path.abspath(path)))
 
             obj._started_at = d.get('started_at', {})
             obj._duration = d.get('duration', {})
             obj._benchmark_version = d.get('benchmark_version', {})
+            obj._cpu_affinity = d.get('cpu_affinity', {})
+            obj._incomplete = d.get('incomplete', False)
+
+            if has_journal:
+                # Results of an interrupted run
+                obj._replay_journal(journal_path)
         except KeyError as exc:
             raise util.UserError(
                 "Error loading results file '{0}': missing key {1}".format(
@@ -720,6 +1359,15 @@ class Results(object):
         path = os.path.join(result_dir, self._filename)
         os.remove(path)
 
+        self.close_journal()
+        if os.path.isfile(path + JOURNAL_SUFFIX):
+            os.remove(path + JOURNAL_SUFFIX)
+
+        catalog = ResultsCatalog.open(result_dir)
+        if catalog is not None:
+            with catalog:
+                catalog.remove_file(path)
+
     @classmethod
     def update(cls, path):
         util.update_json(cls, path, cls.api_version)
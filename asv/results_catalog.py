@@ -0,0 +1,392 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import os
+import json
+
+import six
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from .console import log
+from . import util
+
+
+CATALOG_FILENAME = 'results-catalog.sqlite'
+
+# Bump when the schema or the content of the rows changes
+CATALOG_VERSION = 2
+
+_SKIP_FILES = set(['machine.json', 'benchmarks.json'])
+
+
+def _file_stamp(path):
+    """
+    Return (mtime, size) of a file, used to detect changes.
+    """
+    st = os.stat(path)
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+
+class ResultsCatalog(object):
+    """
+    Persistent index of the results files in a results directory.
+
+    The catalog is a SQLite database ``results-catalog.sqlite`` in the
+    per-user cache of the results directory (see
+    `util.get_user_cache_path`), with a row for each machine
+    directory::
+
+        machine_dirs(dir, machine, error, mtime, size)
+
+    and a row for each results file::
+
+        result_files(path, dir, commit_hash, env_name, python, date,
+                     params, benchmarks, profiles, mtime, size)
+
+    Paths are relative to the results directory. ``params``,
+    ``benchmarks`` (the list of benchmark names in the file) and
+    ``profiles`` (the list of [hash, format] of the profiles in the
+    profile store it refers to) are stored as JSON.
+
+    `update` brings the catalog up to date, by listing the results
+    directory and parsing only the files whose modification time or
+    size differ from those recorded. `Results.save` and `Results.rm`
+    update the catalog directly.
+
+    If the database cannot be used (no sqlite3 module, or the cache
+    directory is not writable), the catalog is kept in memory only.
+
+    """
+
+    def __init__(self, results_dir):
+        self._path = results_dir
+        self._conn = self._connect()
+
+    @classmethod
+    def open(cls, results_dir):
+        """
+        Return the catalog for the given results directory, or None if
+        it is not available (no sqlite3 module).
+        """
+        if sqlite3 is None:
+            return None
+        return cls(results_dir)
+
+    def _connect(self):
+        db_path = util.get_user_cache_path(self._path, CATALOG_FILENAME)
+
+        if os.path.isdir(self._path):
+            try:
+                if not os.path.isdir(os.path.dirname(db_path)):
+                    os.makedirs(os.path.dirname(db_path))
+                conn = sqlite3.connect(db_path, timeout=60)
+                self._init_schema(conn)
+                return conn
+            except sqlite3.Error as exc:
+                log.debug("Results catalog {0} not usable: {1}".format(db_path, exc))
+                # Corrupted or incompatible database: start over
+                try:
+                    os.remove(db_path)
+                    conn = sqlite3.connect(db_path, timeout=60)
+                    self._init_schema(conn)
+                    return conn
+                except (OSError, sqlite3.Error):
+                    pass
+            except OSError as exc:
+                log.debug("Results catalog {0} not usable: {1}".format(db_path, exc))
+
+        conn = sqlite3.connect(':memory:')
+        self._init_schema(conn)
+        return conn
+
+    def _init_schema(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == CATALOG_VERSION:
+            return
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS machine_dirs")
+            conn.execute("DROP TABLE IF EXISTS result_files")
+            conn.execute("CREATE TABLE machine_dirs ("
+                         "dir TEXT PRIMARY KEY, machine TEXT, error TEXT, "
+                         "mtime INTEGER, size INTEGER)")
+            conn.execute("CREATE TABLE result_files ("
+                         "path TEXT PRIMARY KEY, dir TEXT, commit_hash TEXT, "
+                         "env_name TEXT, python TEXT, date INTEGER, "
+                         "params TEXT, benchmarks TEXT, profiles TEXT, "
+                         "mtime INTEGER, size INTEGER)")
+            conn.execute("CREATE INDEX result_files_dir ON result_files (dir)")
+            conn.execute("PRAGMA user_version = {0:d}".format(CATALOG_VERSION))
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _relpath(self, path):
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self._path))
+        return rel.replace(os.sep, '/')
+
+    def update(self, machine_dir=None):
+        """
+        Synchronize the catalog with the files in the results directory.
+
+        Parameters
+        ----------
+        machine_dir : str, optional
+            Only synchronize this subdirectory of the results directory.
+
+        """
+        from .machine import Machine
+        from .results import PROFILE_DIR_NAME, JOURNAL_SUFFIX
+
+        if machine_dir is None:
+            top = self._path
+            where, args = "", ()
+        else:
+            top = os.path.join(self._path, machine_dir)
+            where, args = self._dir_filter(machine_dir, 'dir')
+
+        old_dirs = dict(
+            (row[0], row[1:])
+            for row in self._conn.execute("SELECT dir, machine, error, mtime, size "
+                                          "FROM machine_dirs" + where,
+                                          args))
+        old_files = dict(
+            (row[0], tuple(row[1:]))
+            for row in self._conn.execute("SELECT path, mtime, size FROM result_files" +
+                                          where, args))
+
+        seen_dirs = set()
+        seen_files = set()
+
+        with self._conn:
+            for root, dirs, files in os.walk(top):
+                dirs.sort()
+                rel_root = self._relpath(root)
+                rel_prefix = '' if rel_root == '.' else rel_root + '/'
+
+                # Parse machine.json, if changed
+                machine_json = os.path.join(root, "machine.json")
+                try:
+                    stamp = _file_stamp(machine_json)
+                except OSError:
+                    stamp = (None, None)
+
+                old = old_dirs.get(rel_root)
+                dir_changed = (old is None or tuple(old[2:]) != stamp)
+                if not dir_changed:
+                    machine_name, error = old[:2]
+                else:
+                    try:
+                        data = util.load_json(machine_json, api_version=Machine.api_version)
+                        machine_name = data.get('machine')
+                        if not isinstance(machine_name, six.text_type):
+                            raise util.UserError("malformed {0}".format(machine_json))
+                        error = None
+                    except util.UserError as err:
+                        machine_name = None
+                        error = "Skipping results: {0}".format(six.text_type(err))
+                    except IOError:
+                        machine_name = None
+                        error = "Skipping results: could not load {0}".format(
+                            machine_json)
+
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO machine_dirs VALUES (?, ?, ?, ?, ?)",
+                        (rel_root, machine_name, error) + stamp)
+
+                seen_dirs.add(rel_root)
+
+                if error is None:
+                    # Don't descend into the profile store
+                    if PROFILE_DIR_NAME in dirs:
+                        dirs.remove(PROFILE_DIR_NAME)
+
+                # Parse results files, if changed.  Files with a journal
+                # (of a run in progress or interrupted) are always parsed.
+                journals = set(fn for fn in files if fn.endswith(JOURNAL_SUFFIX))
+                for filename in files:
+                    if filename in _SKIP_FILES or not filename.endswith('.json'):
+                        continue
+
+                    path = os.path.join(root, filename)
+                    rel_path = rel_prefix + filename
+                    seen_files.add(rel_path)
+
+                    try:
+                        stamp = _file_stamp(path)
+                    except OSError:
+                        continue
+
+                    if (old_files.get(rel_path) == stamp and not dir_changed and
+                            filename + JOURNAL_SUFFIX not in journals):
+                        continue
+
+                    self._add_file(rel_root, rel_path, stamp,
+                                   self._load_header(path, machine_name)
+                                   if error is None else None)
+
+            # Forget removed files
+            for rel_path in set(old_files) - seen_files:
+                self._conn.execute("DELETE FROM result_files WHERE path = ?", (rel_path,))
+            for rel_root in set(old_dirs) - seen_dirs:
+                self._conn.execute("DELETE FROM machine_dirs WHERE dir = ?", (rel_root,))
+
+        return self
+
+    def _load_header(self, path, machine_name):
+        """
+        Load the catalog entries of a results file, or None if it
+        cannot be loaded.
+        """
+        from .results import Results
+
+        try:
+            r = Results.load(path, machine_name=machine_name)
+        except util.UserError:
+            return None
+
+        return self._get_header(r)
+
+    @staticmethod
+    def _get_header(results):
+        profiles = set((profile_hash, results.get_profile_format(key))
+                       for key, profile_hash in six.iteritems(results._profiles))
+        return dict(commit_hash=results.commit_hash, env_name=results.env_name,
+                    python=results._python, date=results.date,
+                    params=results.params,
+                    benchmarks=sorted(results.get_all_result_keys()),
+                    profiles=sorted(profiles))
+
+    def _add_file(self, rel_root, rel_path, stamp, header):
+        if header is None:
+            header = dict(commit_hash=None, env_name=None, python=None,
+                          date=None, params=None, benchmarks=None, profiles=None)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO result_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rel_path, rel_root, header['commit_hash'], header['env_name'],
+             header['python'], header['date'],
+             json.dumps(header['params']), json.dumps(header['benchmarks']),
+             json.dumps(header['profiles'])) + stamp)
+
+    def add_results(self, results, path):
+        """
+        Record a results file just written by `Results.save`.
+        """
+        rel_path = self._relpath(path)
+        rel_root = rel_path.rsplit('/', 1)[0] if '/' in rel_path else '.'
+        with self._conn:
+            self._add_file(rel_root, rel_path, _file_stamp(path),
+                           self._get_header(results))
+
+    def remove_file(self, path):
+        """
+        Forget a results file removed by `Results.rm`.
+        """
+        with self._conn:
+            self._conn.execute("DELETE FROM result_files WHERE path = ?",
+                               (self._relpath(path),))
+
+    def get_profiles(self, machine_dir):
+        """
+        Return the set of (profile_hash, profile_format) of the profiles
+        referred to by the results files in a machine directory, or
+        None if some of the files could not be parsed.
+
+        Parameters
+        ----------
+        machine_dir : str
+            Subdirectory of the results directory.
+
+        """
+        machine_dir = machine_dir.replace(os.sep, '/').strip('/')
+        profiles = set()
+        for row in self._conn.execute("SELECT commit_hash, profiles FROM result_files "
+                                      "WHERE dir = ?", (machine_dir,)):
+            if row[0] is None:
+                return None
+            profiles.update(tuple(x) for x in json.loads(row[1]))
+        return profiles
+
+    @staticmethod
+    def _dir_filter(machine_dir, column):
+        """
+        Return a WHERE clause and its arguments, selecting the rows
+        whose directory `column` is under the given subdirectory.
+        """
+        machine_dir = machine_dir.replace(os.sep, '/').strip('/')
+        escaped = machine_dir.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return (" WHERE {0} = ? OR {0} LIKE ? ESCAPE '\\'".format(column),
+                (machine_dir, escaped + '/%'))
+
+    def iter_files(self, machine_dir=None, details=True):
+        """
+        Iterate over the results files in the catalog, in directories
+        with a valid machine.json.
+
+        Parameters
+        ----------
+        machine_dir : str, optional
+            Only files under this subdirectory of the results directory.
+        details : bool, optional
+            Whether to include params and benchmarks in the info.
+
+        Yields
+        ------
+        root : str
+            Directory containing the file
+        filename : str
+            File name
+        info : dict
+            Machine name, and the commit_hash, env_name, python, date,
+            and optionally params and benchmarks recorded for the file
+            (None if the file could not be parsed).
+
+        """
+        query = ("SELECT d.dir, d.machine, d.error, f.path, f.commit_hash, f.env_name, "
+                 "f.python, f.date, f.params, f.benchmarks "
+                 "FROM result_files f JOIN machine_dirs d ON f.dir = d.dir")
+        args = ()
+        if machine_dir is not None:
+            where, args = self._dir_filter(machine_dir, 'd.dir')
+            query += where
+        query += " ORDER BY f.path"
+
+        warned = set()
+        roots = {}
+        for row in self._conn.execute(query, args).fetchall():
+            rel_root, machine_name, error, rel_path = row[:4]
+
+            if error is not None:
+                # Show the warning only if there are some files to load
+                if rel_root not in warned:
+                    log.warning(error)
+                    warned.add(rel_root)
+                continue
+
+            info = dict(machine=machine_name,
+                        commit_hash=row[4], env_name=row[5], python=row[6],
+                        date=row[7])
+            if details:
+                info['params'] = json.loads(row[8])
+                info['benchmarks'] = json.loads(row[9])
+
+            root = roots.get(rel_root)
+            if root is None:
+                if rel_root == '.':
+                    root = self._path
+                else:
+                    root = os.path.join(self._path, *rel_root.split('/'))
+                roots[rel_root] = root
+            yield root, rel_path.rsplit('/', 1)[-1], info
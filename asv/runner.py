@@ -12,12 +12,15 @@ import re
 import time
 import tempfile
 import itertools
+import marshal
 import datetime
 import pstats
 import socket
 import struct
 import threading
 import traceback
+import contextlib
+import collections
 
 import six
 
@@ -25,6 +28,7 @@ from .console import log
 from .results import Results, format_benchmark_result
 from . import statistics
 from . import util
+from .setup_cache_store import get_setup_cache_store_key
 
 
 WIN = (os.name == "nt")
@@ -41,7 +45,8 @@ JSON_ERROR_RETCODE = -257
 
 BenchmarkResult = util.namedtuple_with_doc(
     'BenchmarkResult',
-    ['result', 'samples', 'number', 'errcode', 'stderr', 'profile'],
+    ['result', 'samples', 'number', 'errcode', 'stderr', 'profile', 'stats',
+     'profile_format'],
     """
     Postprocessed benchmark result
 
@@ -65,8 +70,17 @@ BenchmarkResult = util.namedtuple_with_doc(
         If `profile` is `True` and run was at least partially successful,
         this key will be a byte string containing the cProfile data.
         Otherwise, None.
+    stats : {list of {dict, None}, None}
+        Additional statistics reported by the benchmark, for each
+        parameter combination (or None if none reported). Statistics
+        for sampled results are computed from the samples instead.
+    profile_format : {'pstats', 'collapsed', None}
+        Format of `profile`: cProfile data, or collapsed stacks from
+        the sampling profiler. None is the same as 'pstats'.
     """)
 
+BenchmarkResult.__new__.__defaults__ = (None, None)
+
 
 def skip_benchmarks(benchmarks, env, results=None):
     """
@@ -111,7 +125,11 @@ def run_benchmarks(benchmarks, env, results=None,
                    extra_params=None,
                    record_samples=False, append_samples=False,
                    run_rounds=None,
-                   launch_method=None):
+                   launch_method=None,
+                   benchmark_workers=1,
+                   cores=None,
+                   setup_cache_store=None,
+                   expected_durations=None):
     """
     Run all of the benchmarks in the given `Environment`.
 
@@ -131,9 +149,11 @@ def run_benchmarks(benchmarks, env, results=None,
         This is useful to quickly find errors in the benchmark
         functions, without taking the time necessary to get
         accurate timings.
-    profile : bool, optional
-        When `True`, run the benchmark through the `cProfile`
-        profiler.
+    profile : {bool, 'cprofile', 'sampler'}, optional
+        When `True` or 'cprofile', run the benchmark through the
+        `cProfile` profiler.  When 'sampler', run it through the
+        low-overhead sampling profiler, which records collapsed
+        stacks.
     extra_params : dict, optional
         Override values for benchmark attributes.
     record_samples : bool, optional
@@ -146,6 +166,20 @@ def run_benchmarks(benchmarks, env, results=None,
         If None, run all rounds.
     launch_method : {'auto', 'spawn', 'forkserver'}, optional
         Benchmark launching method to use.
+    benchmark_workers : int, optional
+        Number of benchmarks to run in parallel. Each worker has its
+        own launcher and is pinned to a separate set of CPUs.
+        Benchmarks sharing a setup_cache run in the same worker.
+    cores : list of int, optional
+        CPUs to divide between the workers. If None, the CPUs in
+        the ``cpu_affinity`` extra parameter, or all available CPUs,
+        are used.
+    setup_cache_store : SetupCacheStore, optional
+        Persistent store from which to reuse setup_cache results,
+        and where to save new ones.
+    expected_durations : dict, optional
+        Expected duration of each benchmark, in seconds. If given,
+        the longest benchmarks (and setup_cache groups) are run first.
 
     Returns
     -------
@@ -170,7 +204,7 @@ def run_benchmarks(benchmarks, env, results=None,
 
     # Find all setup_cache routines needed
     setup_cache_timeout = {}
-    benchmark_order = {}
+    benchmark_order = collections.OrderedDict()
     cache_users = {}
     max_processes = 0
 
@@ -181,8 +215,19 @@ def run_benchmarks(benchmarks, env, results=None,
         else:
             return int(benchmark.get('processes', 1))
 
+    if setup_cache_store is not None and setup_cache_store.by_build:
+        build_hash = env.get_installed_build_hash()
+    else:
+        build_hash = None
+
+    store_keys = {}
+
     for name, benchmark in sorted(six.iteritems(benchmarks)):
         key = benchmark.get('setup_cache_key')
+        if setup_cache_store is not None and key is not None:
+            store_key = get_setup_cache_store_key(benchmark, env.name, build_hash)
+            if store_key is not None:
+                store_keys[key] = store_key
         setup_cache_timeout[key] = max(benchmark.get('setup_cache_timeout',
                                                      benchmark['timeout']),
                                        setup_cache_timeout.get(key, 0))
@@ -190,6 +235,19 @@ def run_benchmarks(benchmarks, env, results=None,
         max_processes = max(max_processes, get_processes(benchmark))
         cache_users.setdefault(key, set()).add(name)
 
+    if expected_durations is not None:
+        # Longest first, keeping benchmarks sharing a setup_cache together
+        def get_expected(item):
+            return expected_durations.get(item[0], 0)
+
+        def get_group_expected(item):
+            return sum(get_expected(x) for x in item[1])
+
+        for benchmark_set in benchmark_order.values():
+            benchmark_set.sort(key=get_expected, reverse=True)
+        benchmark_order = collections.OrderedDict(
+            sorted(benchmark_order.items(), key=get_group_expected, reverse=True))
+
     if run_rounds is None:
         run_rounds = list(range(1, max_processes + 1))
 
@@ -200,11 +258,10 @@ def run_benchmarks(benchmarks, env, results=None,
         for run_round in run_rounds[::-1]:
             for setup_cache_key, benchmark_set in six.iteritems(benchmark_order):
                 for name, benchmark in benchmark_set:
-                    log.step()
-
                     processes = get_processes(benchmark)
 
                     if run_round > processes:
+                        log.step()
                         if (not append_samples and
                                 run_round == run_rounds[-1] and
                                 name in existing_results):
@@ -231,58 +288,45 @@ def run_benchmarks(benchmarks, env, results=None,
 
     benchmark_durations = {}
 
-    log.info("Benchmarking {0}".format(env.name))
-
-    partial_info_time = None
-    indent = log.indent()
-    indent.__enter__()
-
-    spawner = get_spawner(env, benchmarks.benchmark_dir,
-                          launch_method=launch_method)
-
-    try:
-        # Preimport benchmark suite (if using forkserver)
-        success, out = spawner.preimport()
-
-        if success:
-            if show_stderr and out:
-                log.info("Importing benchmark suite produced output:")
-                with log.indent():
-                    log.error(out.rstrip())
+    def remove_cache_dir(setup_cache_key):
+        cache_dir = cache_dirs.pop(setup_cache_key)
+        if setup_cache_key in store_keys:
+            setup_cache_store.release_cache_dir(store_keys[setup_cache_key])
         else:
-            log.warning("Importing benchmark suite failed (skipping all benchmarks).")
-            if show_stderr and out:
-                with log.indent():
-                    log.error(out)
-
-            stderr = 'asv: benchmark suite import failed'
-            for name, benchmark, setup_cache_key, is_final in iter_run_items():
-                if name in failed_benchmarks:
-                    continue
+            util.long_path_rmtree(cache_dir, True)
 
-                selected_idx = benchmarks.benchmark_selection.get(name)
-                started_at = datetime.datetime.utcnow()
-                res = fail_benchmark(benchmark, stderr=stderr)
-                results.add_result(benchmark, res,
-                                   selected_idx=selected_idx,
-                                   started_at=started_at,
-                                   record_samples=record_samples)
-                failed_benchmarks.add(name)
-            return results
+    # Serializes access to results and log between parallel workers
+    lock = threading.Lock()
+    stop_event = threading.Event()
+
+    def run_items(items, spawner, extra_params, parallel=False):
+        """
+        Run benchmark items with the given spawner. When other
+        workers run in parallel, each benchmark is logged only after
+        it has finished.
+        """
+        partial_info_time = None
+        cpu_affinity = extra_params.get('cpu_affinity')
+
+        for name, benchmark, setup_cache_key, is_final in items:
+            if stop_event.is_set():
+                break
 
-        # Run benchmarks
-        for name, benchmark, setup_cache_key, is_final in iter_run_items():
             selected_idx = benchmarks.benchmark_selection.get(name)
 
+            with lock:
+                log.step()
+
             started_at = datetime.datetime.utcnow()
 
             # Don't try to rerun failed benchmarks
             if name in failed_benchmarks:
                 if is_final:
                     partial_info_time = None
-                    log.info(name, reserve_space=True)
-                    log_benchmark_result(results, benchmark,
-                                         show_stderr=show_stderr)
+                    with lock:
+                        log.info(name, reserve_space=True)
+                        log_benchmark_result(results, benchmark,
+                                             show_stderr=show_stderr)
                 continue
 
             # Setup cache first, if needed
@@ -292,34 +336,67 @@ def run_benchmarks(benchmarks, env, results=None,
                 cache_dir = cache_dirs[setup_cache_key]
             elif setup_cache_key not in failed_setup_cache:
                 partial_info_time = None
-                log.info("Setting up {0}".format(setup_cache_key), reserve_space=True)
-                params_str = json.dumps({'cpu_affinity': extra_params.get('cpu_affinity')})
-                cache_dir, stderr = spawner.create_setup_cache(
-                    name, setup_cache_timeout[setup_cache_key], params_str)
+                store_key = store_keys.get(setup_cache_key)
+                cache_dir = None
+                if store_key is not None:
+                    with lock:
+                        cache_dir = setup_cache_store.get_cache_dir(store_key)
+
                 if cache_dir is not None:
-                    log.add_padded('ok')
-                    cache_dirs[setup_cache_key] = cache_dir
+                    with lock:
+                        log.info("Setting up {0}".format(setup_cache_key), reserve_space=True)
+                        log.add_padded('cached')
+                        cache_dirs[setup_cache_key] = cache_dir
+                    spawner.preload_cache(cache_dir)
                 else:
-                    log.add_padded('failed')
-                    if stderr and show_stderr:
-                        with log.indent():
-                            log.error(stderr)
-                    failed_setup_cache[setup_cache_key] = stderr
-
-                duration = (datetime.datetime.utcnow() - started_at).total_seconds()
-                results.set_setup_cache_duration(setup_cache_key, duration)
+                    stored_dir = None
+                    if store_key is not None:
+                        with lock:
+                            stored_dir = setup_cache_store.create_cache_dir(store_key)
+
+                    if not parallel:
+                        log.info("Setting up {0}".format(setup_cache_key), reserve_space=True)
+                    params_str = json.dumps({'cpu_affinity': cpu_affinity})
+                    cache_dir, stderr = spawner.create_setup_cache(
+                        name, setup_cache_timeout[setup_cache_key], params_str,
+                        cache_dir=stored_dir)
+                    with lock:
+                        if parallel:
+                            log.info("Setting up {0}".format(setup_cache_key), reserve_space=True)
+                        if stored_dir is not None:
+                            if cache_dir is not None:
+                                setup_cache_store.finalize_cache_dir(store_key)
+                            else:
+                                setup_cache_store.release_cache_dir(store_key)
+                        if cache_dir is not None:
+                            log.add_padded('ok')
+                            cache_dirs[setup_cache_key] = cache_dir
+                        else:
+                            log.add_padded('failed')
+                            if stderr and show_stderr:
+                                with log.indent():
+                                    log.error(stderr)
+                            failed_setup_cache[setup_cache_key] = stderr
+
+                        duration = (datetime.datetime.utcnow() - started_at).total_seconds()
+                        results.set_setup_cache_duration(setup_cache_key, duration)
+
+                    if cache_dir is not None:
+                        spawner.preload_cache(cache_dir)
                 started_at = datetime.datetime.utcnow()
 
             if setup_cache_key in failed_setup_cache:
                 # Mark benchmark as failed
                 partial_info_time = None
-                log.warning('{0} skipped (setup_cache failed)'.format(name))
                 stderr = 'asv: setup_cache failed\n\n{}'.format(failed_setup_cache[setup_cache_key])
                 res = fail_benchmark(benchmark, stderr=stderr)
-                results.add_result(benchmark, res,
-                                   selected_idx=selected_idx,
-                                   started_at=started_at,
-                                   record_samples=record_samples)
+                with lock:
+                    log.warning('{0} skipped (setup_cache failed)'.format(name))
+                    results.add_result(benchmark, res,
+                                       selected_idx=selected_idx,
+                                       started_at=started_at,
+                                       record_samples=record_samples,
+                                       cpu_affinity=cpu_affinity)
                 failed_benchmarks.add(name)
                 continue
 
@@ -328,7 +405,8 @@ def run_benchmarks(benchmarks, env, results=None,
             cur_extra_params = extra_params
             if name in previous_result_keys:
                 cur_extra_params = []
-                prev_stats = results.get_result_stats(name, benchmark['params'])
+                with lock:
+                    prev_stats = results.get_result_stats(name, benchmark['params'])
                 for s in prev_stats:
                     if s is None or 'number' not in s:
                         p = extra_params
@@ -340,7 +418,10 @@ def run_benchmarks(benchmarks, env, results=None,
             # Run benchmark
             if is_final:
                 partial_info_time = None
-                log.info(name, reserve_space=True)
+                if not parallel:
+                    log.info(name, reserve_space=True)
+            elif parallel:
+                pass
             elif partial_info_time is None or time.time() > partial_info_time + 30:
                 partial_info_time = time.time()
                 log.info('Running ({0}--)'.format(name))
@@ -358,45 +439,215 @@ def run_benchmarks(benchmarks, env, results=None,
             else:
                 benchmark_durations[name] = (ended_at - started_at).total_seconds()
 
-            # Save result
-            results.add_result(benchmark, res,
-                               selected_idx=selected_idx,
-                               started_at=started_at,
-                               duration=benchmark_durations[name],
-                               record_samples=(not is_final or record_samples),
-                               append_samples=(name in previous_result_keys))
+            with lock:
+                # Save result
+                results.add_result(benchmark, res,
+                                   selected_idx=selected_idx,
+                                   started_at=started_at,
+                                   duration=benchmark_durations[name],
+                                   record_samples=(not is_final or record_samples),
+                                   append_samples=(name in previous_result_keys),
+                                   cpu_affinity=cpu_affinity)
 
-            previous_result_keys.add(name)
+                previous_result_keys.add(name)
 
-            if all(r is None for r in res.result):
-                failed_benchmarks.add(name)
+                if all(r is None for r in res.result):
+                    failed_benchmarks.add(name)
 
-            # Log result
-            if is_final:
-                partial_info_time = None
-                log_benchmark_result(results, benchmark,
-                                     show_stderr=show_stderr)
-            else:
-                log.add('.')
+                # Log result
+                if is_final:
+                    partial_info_time = None
+                    if parallel:
+                        log.info(name, reserve_space=True)
+                    log_benchmark_result(results, benchmark,
+                                         show_stderr=show_stderr)
+                elif not parallel:
+                    log.add('.')
 
             # Cleanup setup cache, if no users left
             if cache_dir is not None and is_final:
-                cache_users[setup_cache_key].remove(name)
-                if not cache_users[setup_cache_key]:
-                    # No users of this cache left, perform cleanup
-                    util.long_path_rmtree(cache_dir, True)
-                    del cache_dirs[setup_cache_key]
+                with lock:
+                    cache_users[setup_cache_key].remove(name)
+                    if not cache_users[setup_cache_key]:
+                        # No users of this cache left, perform cleanup
+                        spawner.unload_cache(cache_dir)
+                        remove_cache_dir(setup_cache_key)
+
+    def run_parallel(spawners, worker_cpus):
+        # Benchmarks sharing a setup_cache must run in the same
+        # worker. Schedule groups with longest previous durations
+        # first; idle workers pick the next group from the queue.
+        groups = collections.OrderedDict()
+        for item in iter_run_items():
+            name, benchmark, setup_cache_key, is_final = item
+            if setup_cache_key is None:
+                key = (None, name)
+            else:
+                key = setup_cache_key
+            groups.setdefault(key, []).append(item)
+
+        if expected_durations is not None:
+            durations = expected_durations
+        else:
+            durations = results.duration
+
+        def get_cost(items):
+            names = set(item[0] for item in items)
+            return sum(durations.get(name, 0) for name in names)
+
+        work_queue = six.moves.queue.Queue()
+        for items in sorted(groups.values(), key=get_cost, reverse=True):
+            work_queue.put(items)
+
+        errors = []
+
+        def worker(spawner, cpus):
+            worker_extra_params = dict(extra_params)
+            worker_extra_params['cpu_affinity'] = cpus
+            try:
+                while not stop_event.is_set():
+                    try:
+                        items = work_queue.get_nowait()
+                    except six.moves.queue.Empty:
+                        break
+                    run_items(items, spawner, worker_extra_params, parallel=True)
+            except BaseException:
+                errors.append(sys.exc_info())
+                stop_event.set()
+
+        threads = [threading.Thread(target=worker, args=(spawner, cpus))
+                   for spawner, cpus in zip(spawners, worker_cpus)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for thread in threads:
+                # Join with timeout, so that KeyboardInterrupt is delivered
+                while thread.is_alive():
+                    thread.join(0.1)
+        except KeyboardInterrupt:
+            stop_event.set()
+            for spawner in spawners:
+                spawner.interrupt()
+            raise util.UserError("Interrupted.")
+
+        if errors:
+            six.reraise(*errors[0])
+
+    if benchmark_workers > 1:
+        if cores is None:
+            cores = extra_params.get('cpu_affinity')
+        if cores is None:
+            cores = util.get_available_cpus()
+        worker_cpus = _split_cpus(cores, benchmark_workers)
+    else:
+        worker_cpus = [extra_params.get('cpu_affinity')]
+
+    log.info("Benchmarking {0}".format(env.name))
+
+    indent = log.indent()
+    indent.__enter__()
+
+    spawners = []
+
+    try:
+        for cpus in worker_cpus:
+            spawners.append(get_spawner(env, benchmarks.benchmark_dir,
+                                        launch_method=launch_method))
+
+        # Preimport benchmark suite (if using forkserver)
+        for spawner in spawners:
+            success, out = spawner.preimport()
+            if not success:
+                break
+
+        if success:
+            if show_stderr and out:
+                log.info("Importing benchmark suite produced output:")
+                with log.indent():
+                    log.error(out.rstrip())
+        else:
+            log.warning("Importing benchmark suite failed (skipping all benchmarks).")
+            if show_stderr and out:
+                with log.indent():
+                    log.error(out)
+
+            stderr = 'asv: benchmark suite import failed'
+            for name, benchmark, setup_cache_key, is_final in iter_run_items():
+                log.step()
+                if name in failed_benchmarks:
+                    continue
+
+                selected_idx = benchmarks.benchmark_selection.get(name)
+                started_at = datetime.datetime.utcnow()
+                res = fail_benchmark(benchmark, stderr=stderr)
+                results.add_result(benchmark, res,
+                                   selected_idx=selected_idx,
+                                   started_at=started_at,
+                                   record_samples=record_samples)
+                failed_benchmarks.add(name)
+            return results
+
+        # Run benchmarks
+        if len(spawners) == 1:
+            run_items(iter_run_items(), spawners[0], extra_params)
+        else:
+            log.info("Running in {0} workers, on CPUs {1}".format(
+                len(spawners), ", ".join(_format_cpus(cpus) for cpus in worker_cpus)))
+            run_parallel(spawners, worker_cpus)
     finally:
         # Cleanup any dangling caches
-        for cache_dir in cache_dirs.values():
-            if cache_dir is not None:
-                util.long_path_rmtree(cache_dir, True)
+        for setup_cache_key in list(cache_dirs.keys()):
+            if setup_cache_key is not None:
+                remove_cache_dir(setup_cache_key)
         indent.__exit__(None, None, None)
-        spawner.close()
+        for spawner in spawners:
+            spawner.close()
+
+    dispatch_count = sum(spawner.dispatch_count for spawner in spawners)
+    if dispatch_count > 0:
+        dispatch_time = sum(spawner.dispatch_time for spawner in spawners)
+        log.debug("Benchmark dispatch overhead: {0} per run ({1} runs)".format(
+            util.human_time(dispatch_time / dispatch_count), dispatch_count))
 
     return results
 
 
+def _split_cpus(cpus, num):
+    """
+    Split a list of CPUs to `num` disjoint, contiguous sets of nearly
+    equal size.
+    """
+    cpus = sorted(set(cpus))
+    if len(cpus) < num:
+        raise util.UserError(
+            "Cannot run {0} benchmark workers on {1} CPUs".format(num, len(cpus)))
+
+    size, extra = divmod(len(cpus), num)
+    result = []
+    start = 0
+    for j in range(num):
+        end = start + size + (1 if j < extra else 0)
+        result.append(cpus[start:end])
+        start = end
+    return result
+
+
+def _format_cpus(cpus):
+    """
+    Format a sorted list of CPUs in the --cores format, e.g. "0-3,5".
+    """
+    parts = []
+    for k, group in itertools.groupby(enumerate(cpus), lambda x: x[1] - x[0]):
+        group = [cpu for j, cpu in group]
+        if len(group) > 1:
+            parts.append("{0}-{1}".format(group[0], group[-1]))
+        else:
+            parts.append(str(group[0]))
+    return ",".join(parts)
+
+
 def get_spawner(env, benchmark_dir, launch_method):
     has_fork = hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')
 
@@ -482,8 +733,8 @@ def run_benchmark(benchmark, spawner, profile,
         Benchmark object dict
     spawner : Spawner
         Benchmark process spawner
-    profile : bool
-        Whether to run with profile
+    profile : {bool, 'cprofile', 'sampler'}
+        Whether to run with profile, and which profiler to use
     selected_idx : set, optional
         Set of parameter indices to run for.
     extra_params : {dict, list}, optional
@@ -507,36 +758,39 @@ def run_benchmark(benchmark, spawner, profile,
     result = []
     samples = []
     number = []
+    stats = []
     profiles = []
     stderr = ''
     errcode = 0
 
     if benchmark['params']:
-        param_iter = enumerate(itertools.product(*benchmark['params']))
+        num_params = len(list(itertools.product(*benchmark['params'])))
     else:
-        param_iter = [(0, None)]
+        num_params = 1
 
-    for param_idx, params in param_iter:
-        if selected_idx is not None and param_idx not in selected_idx:
+    run_idx = [param_idx for param_idx in range(num_params)
+               if selected_idx is None or param_idx in selected_idx]
+
+    param_results = dict(zip(run_idx, _run_benchmark_params(
+        benchmark, spawner, run_idx,
+        extra_params=extra_params, profile=profile,
+        cwd=cwd)))
+
+    for param_idx in range(num_params):
+        if param_idx not in param_results:
             result.append(util.nan)
             samples.append(None)
             number.append(None)
+            stats.append(None)
             profiles.append(None)
             continue
 
-        if isinstance(extra_params, list):
-            cur_extra_params = extra_params[param_idx]
-        else:
-            cur_extra_params = extra_params
-
-        res = _run_benchmark_single_param(
-            benchmark, spawner, param_idx,
-            extra_params=cur_extra_params, profile=profile,
-            cwd=cwd)
+        res = param_results[param_idx]
 
         result += res.result
         samples += res.samples
         number += res.number
+        stats += res.stats if res.stats is not None else [None] * len(res.result)
 
         profiles.append(res.profile)
 
@@ -553,15 +807,21 @@ def run_benchmark(benchmark, spawner, profile,
         number=number,
         errcode=errcode,
         stderr=stderr.strip(),
-        profile=_combine_profile_data(profiles)
+        profile=(_combine_collapsed_data(profiles) if profile == 'sampler'
+                 else _combine_profile_data(profiles)),
+        stats=stats if any(s is not None for s in stats) else None,
+        profile_format='collapsed' if profile == 'sampler' else None
     )
 
 
-def _run_benchmark_single_param(benchmark, spawner, param_idx,
-                                profile, extra_params, cwd):
+def _run_benchmark_params(benchmark, spawner, param_indices,
+                          profile, extra_params, cwd):
     """
-    Run a benchmark, for single parameter combination index in case it
-    is parameterized
+    Run a benchmark, for the given parameter combination indices in
+    case it is parameterized.
+
+    The runs are submitted to the spawner together, so that it can
+    pipeline them.
 
     Parameters
     ----------
@@ -569,108 +829,138 @@ def _run_benchmark_single_param(benchmark, spawner, param_idx,
         Benchmark object dict
     spawner : Spawner
         Benchmark process spawner
-    param_idx : {int, None}
-        Parameter index to run benchmark for
-    profile : bool
-        Whether to run with profile
-    extra_params : dict
-        Additional parameters to pass to the benchmark
+    param_indices : list of int
+        Parameter indices to run benchmark for
+    profile : {bool, 'cprofile', 'sampler'}
+        Whether to run with profile, and which profiler to use
+    extra_params : {dict, list}
+        Additional parameters to pass to the benchmark.
+        If a list, each entry should correspond to a benchmark
+        parameter combination.
     cwd : {str, None}
         Working directory to run the benchmark in.
         If None, run in a temporary directory.
 
     Returns
     -------
-    result : BenchmarkResult
-        Result data.
+    results : list of BenchmarkResult
+        Result data, for each parameter index.
 
     """
-    name = benchmark['name']
-    if benchmark['params']:
-        name += '-%d' % (param_idx,)
-
-    if profile:
-        profile_fd, profile_path = tempfile.mkstemp()
-        os.close(profile_fd)
-    else:
-        profile_path = 'None'
-
-    params_str = json.dumps(extra_params)
+    jobs = []
+    profile_paths = []
+    tmp_dirs = []
 
-    if cwd is None:
-        real_cwd = tempfile.mkdtemp()
-    else:
-        real_cwd = cwd
-
-    result_file = tempfile.NamedTemporaryFile(delete=False)
     try:
-        result_file.close()
-
-        out, errcode = spawner.run(
-            name=name, params_str=params_str, profile_path=profile_path,
-            result_file_name=result_file.name,
-            timeout=benchmark['timeout'],
-            cwd=real_cwd)
+        for param_idx in param_indices:
+            name = benchmark['name']
+            if benchmark['params']:
+                name += '-%d' % (param_idx,)
+
+            if profile:
+                profile_fd, profile_path = tempfile.mkstemp()
+                os.close(profile_fd)
+                profile_paths.append(profile_path)
+            else:
+                profile_path = 'None'
 
-        if errcode != 0:
-            if errcode == util.TIMEOUT_RETCODE:
-                out += "\n\nasv: benchmark timed out (timeout {0}s)\n".format(benchmark['timeout'])
+            if isinstance(extra_params, list):
+                cur_extra_params = extra_params[param_idx]
+            else:
+                cur_extra_params = extra_params
 
-            result = None
-            samples = None
-            number = None
-        else:
-            with open(result_file.name, 'r') as stream:
-                data = stream.read()
+            if profile == 'sampler':
+                cur_extra_params = dict(cur_extra_params, profiler='sampler')
 
-            try:
-                data = json.loads(data)
-            except ValueError as exc:
-                data = None
-                errcode = JSON_ERROR_RETCODE
-                out += "\n\nasv: failed to parse benchmark result: {0}\n".format(exc)
-
-            # Special parsing for timing benchmark results
-            if isinstance(data, dict) and 'samples' in data and 'number' in data:
-                result = True
-                samples = data['samples']
-                number = data['number']
+            if cwd is None:
+                real_cwd = tempfile.mkdtemp()
+                tmp_dirs.append(real_cwd)
             else:
-                result = data
-                samples = None
-                number = None
-
-        if benchmark['params'] and out:
-            params, = itertools.islice(itertools.product(*benchmark['params']),
-                                       param_idx, param_idx + 1)
-            out = "For parameters: {0}\n{1}".format(", ".join(params), out)
-
-        if profile:
-            with io.open(profile_path, 'rb') as profile_fd:
-                profile_data = profile_fd.read()
-            profile_data = profile_data if profile_data else None
-        else:
-            profile_data = None
+                real_cwd = cwd
+
+            jobs.append(dict(name=name,
+                             params_str=json.dumps(cur_extra_params),
+                             profile_path=profile_path,
+                             timeout=benchmark['timeout'],
+                             cwd=real_cwd))
 
-        return BenchmarkResult(
-            result=[result],
-            samples=[samples],
-            number=[number],
-            errcode=errcode,
-            stderr=out.strip(),
-            profile=profile_data)
+        outputs = spawner.run_many(jobs)
 
+        return [_parse_benchmark_output(benchmark, param_idx, job['profile_path'],
+                                        out, errcode, result_text)
+                for param_idx, job, (out, errcode, result_text)
+                in zip(param_indices, jobs, outputs)]
     except KeyboardInterrupt:
         spawner.interrupt()
         raise util.UserError("Interrupted.")
     finally:
-        os.remove(result_file.name)
-        if profile:
+        for profile_path in profile_paths:
             os.remove(profile_path)
-        if cwd is None:
+        for real_cwd in tmp_dirs:
             util.long_path_rmtree(real_cwd, True)
 
 
+def _parse_benchmark_output(benchmark, param_idx, profile_path,
+                            out, errcode, result_text):
+    """
+    Postprocess output of a single benchmark run to a BenchmarkResult.
+    """
+    if errcode != 0:
+        if errcode == util.TIMEOUT_RETCODE:
+            out += "\n\nasv: benchmark timed out (timeout {0}s)\n".format(benchmark['timeout'])
+
+        result = None
+        samples = None
+        number = None
+        stats = None
+    else:
+        try:
+            data = json.loads(result_text)
+        except (TypeError, ValueError) as exc:
+            data = None
+            errcode = JSON_ERROR_RETCODE
+            out += "\n\nasv: failed to parse benchmark result: {0}\n".format(exc)
+
+        stats = None
+
+        # Special parsing for timing benchmark results
+        if isinstance(data, dict) and 'samples' in data and 'number' in data:
+            result = True
+            samples = data['samples']
+            number = data['number']
+        elif isinstance(data, dict) and 'value' in data and 'stats' in data:
+            # Value with additional statistics
+            result = data['value']
+            samples = None
+            number = None
+            stats = data['stats']
+        else:
+            result = data
+            samples = None
+            number = None
+
+    if benchmark['params'] and out:
+        params, = itertools.islice(itertools.product(*benchmark['params']),
+                                   param_idx, param_idx + 1)
+        out = "For parameters: {0}\n{1}".format(", ".join(params), out)
+
+    if profile_path != 'None':
+        with io.open(profile_path, 'rb') as profile_fd:
+            profile_data = profile_fd.read()
+        profile_data = profile_data if profile_data else None
+    else:
+        profile_data = None
+
+    return BenchmarkResult(
+        result=[result],
+        samples=[samples],
+        number=[number],
+        errcode=errcode,
+        stderr=out.strip(),
+        profile=profile_data,
+        stats=[stats])
+
+
 class Spawner(object):
     """
     Manage launching individual benchmark.py commands
@@ -681,11 +971,17 @@ class Spawner(object):
         self.benchmark_dir = os.path.abspath(benchmark_dir)
         self.interrupted = False
 
+        # Number of runs, and total time spent outside the benchmark
+        # processes for them (if the spawner measures it)
+        self.dispatch_count = 0
+        self.dispatch_time = 0
+
     def interrupt(self):
         self.interrupted = True
 
-    def create_setup_cache(self, benchmark_id, timeout, params_str):
-        cache_dir = tempfile.mkdtemp()
+    def create_setup_cache(self, benchmark_id, timeout, params_str, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = tempfile.mkdtemp()
 
         env_vars = dict(os.environ)
         env_vars.update(self.env.env_vars)
@@ -708,6 +1004,19 @@ class Spawner(object):
             out += '\nasv: setup_cache failed (exit status {})'.format(errcode)
             return None, out.strip()
 
+    def preload_cache(self, cache_dir):
+        """
+        Load the setup_cache result in `cache_dir` in advance, for
+        the benchmarks run with it as working directory.
+        """
+        pass
+
+    def unload_cache(self, cache_dir):
+        """
+        Discard a setup_cache result loaded by `preload_cache`.
+        """
+        pass
+
     def run(self, name, params_str, profile_path, result_file_name, timeout, cwd):
         env_vars = dict(os.environ)
         env_vars.update(self.env.env_vars)
@@ -721,6 +1030,39 @@ class Spawner(object):
             env=env_vars)
         return out, errcode
 
+    def run_many(self, jobs):
+        """
+        Run several benchmarks in sequence.
+
+        Parameters
+        ----------
+        jobs : list of dict
+            Keyword arguments (except `result_file_name`) for `run`,
+            for each benchmark to run.
+
+        Returns
+        -------
+        outputs : list of tuple
+            List of ``(out, errcode, result_text)`` for each job.
+            `result_text` is None if the benchmark failed.
+
+        """
+        outputs = []
+        for job in jobs:
+            result_file = tempfile.NamedTemporaryFile(delete=False)
+            try:
+                result_file.close()
+                out, errcode = self.run(result_file_name=result_file.name, **job)
+                if errcode == 0:
+                    with open(result_file.name, 'r') as stream:
+                        result_text = stream.read()
+                else:
+                    result_text = None
+            finally:
+                os.remove(result_file.name)
+            outputs.append((out, errcode, result_text))
+        return outputs
+
     def preimport(self):
         return True, ""
 
@@ -729,6 +1071,19 @@ class Spawner(object):
 
 
 class ForkServer(Spawner):
+    """
+    Launch benchmarks by forking from a server process, which has
+    the benchmark suite preimported.
+
+    Commands are sent to the server through a single persistent Unix
+    socket connection, as length-prefixed JSON messages. Several run
+    commands can be in flight at the same time (up to
+    `pipeline_depth`), and the captured output and result of each
+    benchmark are streamed back inline in the replies.
+    """
+
+    pipeline_depth = 8
+
     def __init__(self, env, root):
         super(ForkServer, self).__init__(env, root)
 
@@ -761,6 +1116,8 @@ class ForkServer(Spawner):
             os.rmdir(self.tmp_dir)
             raise RuntimeError("Failed to start server thread")
 
+        self._conn = None
+
     def _stdout_reader(self):
         try:
             out = self.server_proc.stdout.read()
@@ -773,15 +1130,43 @@ class ForkServer(Spawner):
         self._server_output = out
 
     def run(self, name, params_str, profile_path, result_file_name, timeout, cwd):
-        msg = {'action': 'run',
-               'benchmark_id': name,
-               'params_str': params_str,
-               'profile_path': profile_path,
-               'result_file': result_file_name,
-               'timeout': timeout,
-               'cwd': cwd}
-        result = self._send_command(msg)
-        return result['out'], result['errcode']
+        (out, errcode, result_text), = self.run_many([
+            dict(name=name, params_str=params_str, profile_path=profile_path,
+                 timeout=timeout, cwd=cwd)])
+        if result_text is not None:
+            with open(result_file_name, 'w') as stream:
+                stream.write(result_text)
+        return out, errcode
+
+    def run_many(self, jobs):
+        jobs = list(jobs)
+        replies = []
+        num_sent = 0
+
+        start_time = time.time()
+
+        with self._check_server():
+            while len(replies) < len(jobs):
+                # Keep the pipeline full
+                while (num_sent < len(jobs) and
+                       num_sent - len(replies) < self.pipeline_depth):
+                    job = jobs[num_sent]
+                    self._send({'action': 'run',
+                                'benchmark_id': job['name'],
+                                'params_str': job['params_str'],
+                                'profile_path': job['profile_path'],
+                                'timeout': job['timeout'],
+                                'cwd': job['cwd']})
+                    num_sent += 1
+
+                replies.append(self._recv())
+
+        elapsed = time.time() - start_time
+        self.dispatch_count += len(replies)
+        self.dispatch_time += elapsed - sum(reply['elapsed'] or 0 for reply in replies)
+
+        return [(reply['out'], reply['errcode'], reply['result'])
+                for reply in replies]
 
     def preimport(self):
         success = True
@@ -799,11 +1184,24 @@ class ForkServer(Spawner):
 
         return success, out
 
-    def _send_command(self, msg):
-        msg = json.dumps(msg)
-        if sys.version_info[0] >= 3:
-            msg = msg.encode('utf-8')
+    def preload_cache(self, cache_dir):
+        # The server loads the result once, and the forked benchmark
+        # processes inherit it copy-on-write. On failure, the
+        # benchmark processes load it themselves.
+        try:
+            out = self._send_command({'action': 'load_cache', 'cache_dir': cache_dir})
+        except Exception as exc:
+            out = str(exc)
+        if out:
+            log.debug("Preloading setup_cache failed:\n{0}".format(out))
 
+    def unload_cache(self, cache_dir):
+        try:
+            self._send_command({'action': 'unload_cache', 'cache_dir': cache_dir})
+        except Exception:
+            pass
+
+    def _connect(self):
         # Connect (with wait+retry)
         s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         for retry in range(5, 0, -1):
@@ -814,33 +1212,58 @@ class ForkServer(Spawner):
                 if retry > 1:
                     time.sleep(0.2)
                 else:
+                    s.close()
                     raise
+        return s
 
-        # Send command
+    @contextlib.contextmanager
+    def _check_server(self):
         try:
-            s.sendall(struct.pack('<Q', len(msg)))
-            s.sendall(msg)
-
-            # Read result
-            read_size, = struct.unpack('<Q', util.recvall(s, 8))
-            result_text = util.recvall(s, read_size)
-            if sys.version_info[0] >= 3:
-                result_text = result_text.decode('utf-8')
-            result = json.loads(result_text)
+            yield
         except Exception:
             exitcode = self.server_proc.poll()
             if exitcode is not None:
                 raise util.UserError("Process exited with code {0}".format(exitcode))
             raise
-        finally:
-            s.close()
 
-        return result
+    def _send(self, msg):
+        if self._conn is None:
+            self._conn = self._connect()
+
+        msg = json.dumps(msg)
+        if sys.version_info[0] >= 3:
+            msg = msg.encode('utf-8')
+
+        self._conn.sendall(struct.pack('<Q', len(msg)) + msg)
+
+    def _recv(self):
+        read_size, = struct.unpack('<Q', util.recvall(self._conn, 8))
+        result_text = util.recvall(self._conn, read_size)
+        if sys.version_info[0] >= 3:
+            result_text = result_text.decode('utf-8')
+        return json.loads(result_text)
+
+    def _send_command(self, msg):
+        with self._check_server():
+            self._send(msg)
+            return self._recv()
 
     def close(self):
         import signal
 
+        if self._conn is not None:
+            try:
+                if not self.interrupted:
+                    self._send({'action': 'quit'})
+            except Exception:
+                pass
+            self._conn.close()
+            self._conn = None
+
         # Check for termination
+        if self.server_proc.poll() is None:
+            time.sleep(0.1)
+
         if self.server_proc.poll() is None:
             util._killpg_safe(self.server_proc.pid, signal.SIGINT)
 
@@ -862,6 +1285,17 @@ class ForkServer(Spawner):
         util.long_path_rmtree(self.tmp_dir)
 
 
+class _ProfileData(object):
+    """
+    Profile data in the form accepted by `pstats.Stats`
+    """
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
 def _combine_profile_data(datasets):
     """
     Combine a list of profile data to a single profile
@@ -872,29 +1306,30 @@ def _combine_profile_data(datasets):
     elif len(datasets) == 1:
         return datasets[0]
 
-    # Load and combine stats
-    stats = None
+    # Load and combine stats, in memory
+    stats = pstats.Stats(_ProfileData(datasets[0]))
+    for data in datasets[1:]:
+        stats.add(_ProfileData(data))
 
-    while datasets:
-        data = datasets.pop(0)
+    # Same format as written by pstats.Stats.dump_stats
+    return marshal.dumps(stats.stats)
 
-        f = tempfile.NamedTemporaryFile(delete=False)
-        try:
-            f.write(data)
-            f.close()
-            if stats is None:
-                stats = pstats.Stats(f.name)
-            else:
-                stats.add(f.name)
-        finally:
-            os.remove(f.name)
 
-    # Write combined stats out
-    f = tempfile.NamedTemporaryFile(delete=False)
-    try:
-        f.close()
-        stats.dump_stats(f.name)
-        with open(f.name, 'rb') as fp:
-            return fp.read()
-    finally:
-        os.remove(f.name)
+def _combine_collapsed_data(datasets):
+    """
+    Combine a list of collapsed stack data to a single one
+    """
+    datasets = [data for data in datasets if data is not None]
+    if not datasets:
+        return None
+    elif len(datasets) == 1:
+        return datasets[0]
+
+    counts = collections.OrderedDict()
+    for data in datasets:
+        for line in data.decode('utf-8').splitlines():
+            stack, _, count = line.rpartition(' ')
+            counts[stack] = counts.get(stack, 0) + int(count)
+
+    return "".join("{0} {1}\n".format(stack, count)
+                   for stack, count in sorted(counts.items())).encode('utf-8')
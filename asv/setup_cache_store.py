@@ -0,0 +1,213 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import os
+import json
+import hashlib
+
+from . import util
+
+
+def get_setup_cache_store_key(benchmark, env_name, build_hash=None):
+    """
+    Compute the key under which the setup_cache of a benchmark is stored.
+
+    Parameters
+    ----------
+    benchmark : dict
+        Benchmark info, as returned by discovery.
+    env_name : str
+        Name of the environment the setup_cache runs in.
+    build_hash : str, optional
+        Hash identifying the installed build of the project. If None,
+        the stored setup_cache is shared between all builds.
+
+    Returns
+    -------
+    key : str or None
+        Hex digest identifying the setup_cache, or None if the
+        benchmark has no setup_cache, or was discovered by an asv
+        version that does not record the setup_cache version.
+
+    """
+    setup_cache_key = benchmark.get('setup_cache_key')
+    setup_cache_version = benchmark.get('setup_cache_version')
+    if setup_cache_key is None or setup_cache_version is None:
+        return None
+
+    data = [setup_cache_key, setup_cache_version, env_name, build_hash]
+    return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+
+class SetupCacheStore(object):
+    """
+    Persistent store for setup_cache results
+
+    Data is stored in a directory tree::
+
+        {self._path}/
+            {self._path}/{key}/*
+            {self._path}/{key}.timestamp
+
+    The key identifies the setup_cache source code and version, the
+    environment, and optionally the installed build of the project
+    (see `get_setup_cache_store_key`).  The timestamp file contains
+    the total size in bytes of the directory, and its modification
+    time is updated each time the directory is used.
+
+    If the timestamp file is missing, the subdirectory is ignored (and
+    subject to cleanup).
+
+    The cache cleanup removes the least recently used items, until
+    the total size is below ``setup_cache_store_size`` megabytes.
+    Directories handed out by `get_cache_dir` or `create_cache_dir`
+    are not removed until released with `release_cache_dir`.
+
+    """
+
+    def __init__(self, conf):
+        self._path = os.path.join(conf.env_dir, 'asv-setup-cache')
+        self._max_size = int(conf.setup_cache_store_size * 1024**2)
+        self.by_build = conf.setup_cache_store_by_build
+        self._in_use = {}
+
+    @classmethod
+    def from_conf(cls, conf):
+        """
+        Return a store for the given configuration, or None if the
+        store is not enabled.
+        """
+        if conf.setup_cache_store_size > 0:
+            return cls(conf)
+        return None
+
+    def _get_cache_dir(self, key):
+        """
+        Get the cache dir and timestamp file corresponding to a given key.
+        """
+        path = os.path.join(self._path, key)
+        stamp = path + ".timestamp"
+        return path, stamp
+
+    def _remove_cache_dir(self, key):
+        path, stamp = self._get_cache_dir(key)
+        if os.path.exists(stamp):
+            os.unlink(stamp)
+        if os.path.isdir(path):
+            util.long_path_rmtree(path, True)
+
+    def _get_size(self, key):
+        path, stamp = self._get_cache_dir(key)
+        try:
+            with open(stamp, 'r') as f:
+                return int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return _get_dir_size(path)
+
+    def _get_cache_contents(self):
+        """
+        Return list of keys in the cache with a valid timestamp,
+        sorted by decreasing timestamp
+        """
+        if not os.path.isdir(self._path):
+            return []
+
+        items = []
+        for name in os.listdir(self._path):
+            path, stamp = self._get_cache_dir(name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                items.append((os.stat(stamp).st_mtime, name))
+            except OSError:
+                continue
+
+        items.sort(reverse=True)
+        return [name for mtime, name in items]
+
+    def _cleanup(self):
+        # First remove items without timestamp
+        if os.path.isdir(self._path):
+            for name in os.listdir(self._path):
+                if name.endswith('.timestamp') or name in self._in_use:
+                    continue
+                path, stamp = self._get_cache_dir(name)
+                if not os.path.exists(stamp):
+                    self._remove_cache_dir(name)
+
+        # Then remove least recently used items exceeding the size limit
+        total_size = 0
+        for name in self._get_cache_contents():
+            total_size += self._get_size(name)
+            if total_size > self._max_size and name not in self._in_use:
+                self._remove_cache_dir(name)
+
+    def _acquire(self, key):
+        self._in_use[key] = self._in_use.get(key, 0) + 1
+
+    def get_cache_dir(self, key):
+        """
+        Return the stored directory for the given key, marking it as
+        recently used and in use, or None if not in the store.
+        """
+        path, stamp = self._get_cache_dir(key)
+        if os.path.isdir(path) and os.path.isfile(stamp):
+            os.utime(stamp, None)
+            self._acquire(key)
+            return path
+
+        return None
+
+    def create_cache_dir(self, key):
+        """
+        Create an empty directory for the given key, replacing any
+        previous contents. It becomes available from `get_cache_dir`
+        only after `finalize_cache_dir` is called.
+        """
+        self._remove_cache_dir(key)
+
+        path, stamp = self._get_cache_dir(key)
+        os.makedirs(path)
+        self._acquire(key)
+        return path
+
+    def finalize_cache_dir(self, key):
+        """
+        Mark the directory for the given key as complete, and clean up
+        the store.
+        """
+        path, stamp = self._get_cache_dir(key)
+
+        if os.path.isdir(path):
+            with open(stamp, 'w') as f:
+                f.write(str(_get_dir_size(path)))
+
+        self._cleanup()
+
+    def release_cache_dir(self, key):
+        """
+        Mark the directory for the given key as no longer in use, and
+        remove it if it no longer fits in the store.
+        """
+        count = self._in_use.pop(key, 0) - 1
+        if count > 0:
+            self._in_use[key] = count
+        else:
+            path, stamp = self._get_cache_dir(key)
+            if not os.path.isfile(stamp):
+                # Not finalized: setup_cache failed or was interrupted
+                self._remove_cache_dir(key)
+            self._cleanup()
+
+
+def _get_dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for fn in files:
+            try:
+                size += os.lstat(os.path.join(root, fn)).st_size
+            except OSError:
+                pass
+    return size
@@ -84,6 +84,8 @@ def get_err(result, stats):
     Return an 'error measure' suitable for informing the user
     about the spread of the measurement results.
     """
+    if 'q_25' not in stats or 'q_75' not in stats:
+        return None
     a, b = stats['q_25'], stats['q_75']
     return (b - a)/2
 
@@ -134,6 +136,9 @@ def is_different(samples_a, samples_b, stats_a, stats_b, p_threshold=0.002):
     # which generally can be significantly smaller than p <= 0.01
     # depending on the actual data. For normal test (known variance),
     # 0.00027 <= p <= 0.01.
+    if 'ci_99' not in stats_a or 'ci_99' not in stats_b:
+        return True
+
     ci_a = stats_a['ci_99']
     ci_b = stats_b['ci_99']
 
@@ -365,6 +365,22 @@ try:
 except ImportError:
     _rangemedian = None
 
+# Numpy, imported on first use by _get_numpy (False if not available)
+_numpy = None
+
+
+# Bump when changes to the algorithm change the detected steps
+# (invalidates the results stored by asv.steps_cache)
+STEP_DETECT_VERSION = 2
+
+# Parameters of detect_steps_incremental: number of previous data
+# points re-solved together with the new ones, and maximum relative
+# growth of the data and change of the median weight before solving
+# the full problem again
+INCREMENTAL_WINDOW = 50
+INCREMENTAL_MAX_GROWTH = 0.1
+INCREMENTAL_MAX_WEIGHT_CHANGE = 0.1
+
 
 #
 # Detecting regressions
@@ -395,44 +411,169 @@ def detect_steps(y, w=None):
 
     """
 
-    index_map = {}
+    index_map, y_filtered, w_filtered, w_median = _filter_data(y, w)
+
+    # Find piecewise segments
+    right, values, dists, gamma = solve_potts_autogamma(y_filtered, w=w_filtered)
+
+    mins = _get_mins(y_filtered, right)
+    return _get_steps(index_map, right, values, dists, mins)
+
+
+def detect_steps_incremental(y, w=None, state=None):
+    """
+    Detect steps in a (noisy) signal, reusing the result for a shorter
+    signal of which `y` is an extension.
+
+    Only a trailing window of the data, consisting of the new data and
+    the last `INCREMENTAL_WINDOW` previous data points, is re-solved,
+    with the previous value of the penalty parameter gamma.  If the
+    steps in the window are unchanged, the new data is added to the
+    last interval.  The full problem is solved instead if there is no
+    previous result, if the steps in the window change, if the data
+    has grown by more than a fraction `INCREMENTAL_MAX_GROWTH` since
+    the last full solve, or if the median weight has changed by more
+    than `INCREMENTAL_MAX_WEIGHT_CHANGE`.
+
+    Parameters
+    ----------
+    y, w
+        As for `detect_steps`.
+    state : dict, optional
+        State returned by the previous call for the data ``y[:n]``,
+        ``w[:n]``, where ``n = state['n']``.  The caller must ensure
+        this data is unchanged.
+
+    Returns
+    -------
+    steps : list
+        As for `detect_steps`.
+    state : dict
+        State to pass to the next call, as a JSON-compatible dict.
+
+    """
+    if state is not None and state['gamma'] is not None and len(y) >= state['n']:
+        result = _detect_steps_incremental(y, w, state)
+        if result is not None:
+            return result
+
+    index_map, y_filtered, w_filtered, w_median = _filter_data(y, w)
+    right, values, dists, gamma = solve_potts_autogamma(y_filtered, w=w_filtered)
+    mins = _get_mins(y_filtered, right)
+
+    state = dict(n=len(y), n_full=len(y_filtered), w_median=w_median, gamma=gamma,
+                 right=right, values=values, dists=dists, mins=mins)
+    return _get_steps(index_map, right, values, dists, mins), state
+
+
+def _detect_steps_incremental(y, w, state):
+    """
+    Incremental part of `detect_steps_incremental`.  Returns None if
+    the full problem needs to be solved.
+    """
+    index_map, y_filtered, w_filtered, w_median = _filter_data(
+        y, w, w_median=state['w_median'])
+
+    n = len(y_filtered)
+    if n > state['n_full'] * (1 + INCREMENTAL_MAX_GROWTH):
+        return None
+    if abs(w_median / state['w_median'] - 1) > INCREMENTAL_MAX_WEIGHT_CHANGE:
+        return None
+
+    right = state['right']
+    values = state['values']
+    dists = state['dists']
+    mins = state['mins']
+
+    m = right[-1]
+    if n > m:
+        # Re-solve the trailing window
+        start = max(0, m - INCREMENTAL_WINDOW)
+        tail_right, tail_values, tail_dists = solve_potts_approx(
+            y_filtered[start:], w_filtered[start:], gamma=state['gamma'])
+
+        # The steps must stay the same
+        if tail_right[:-1] != [r - start for r in right[:-1] if r > start]:
+            return None
+
+        # Extend the last interval
+        l = right[-2] if len(right) > 1 else 0
+        mu_dist = get_mu_dist(y_filtered[l:], w_filtered[l:])
+        right = right[:-1] + [n]
+        values = values[:-1] + [mu_dist.mu(0, n - l - 1)]
+        dists = dists[:-1] + [mu_dist.dist(0, n - l - 1)]
+        mins = mins[:-1] + [min(mins[-1], min(y_filtered[m:]))]
+
+    state = dict(state, n=len(y), right=right, values=values, dists=dists, mins=mins)
+    return _get_steps(index_map, right, values, dists, mins), state
+
+
+def _filter_data(y, w, w_median=None):
+    """
+    Drop missing data, and fill in and normalize weights.
+
+    Returns
+    -------
+    index_map : list
+        Positions in `y` of the data points retained
+    y_filtered, w_filtered : list
+        Data and weights
+    w_median : float
+        Median weight.  If `w_median` is given, it is used for the
+        normalization instead of the actual median.
+
+    """
+    index_map = []
     y_filtered = []
     for j, x in enumerate(y):
         if x is None or x != x:
             # None or NaN: missing data
             continue
-        index_map[len(y_filtered)] = j
+        index_map.append(j)
         y_filtered.append(x)
 
     # Weights
     if w is None:
-        w_filtered = [1]*len(y_filtered)
+        return index_map, y_filtered, [1]*len(y_filtered), 1.0
+
+    # Fill-in and normalize weights
+    w_valid = [ww for ww in w if ww is not None and ww == ww]
+    if w_valid:
+        w_actual = median(w_valid)
+        if w_actual == 0:
+            w_actual = 1.0
     else:
-        # Fill-in and normalize weights
-        w_valid = [ww for ww in w if ww is not None and ww == ww]
-        if w_valid:
-            w_median = median(w_valid)
-            if w_median == 0:
-                w_median = 1.0
-        else:
-            w_median = 1.0
+        w_actual = 1.0
 
-        w_filtered = [1.0]*len(y_filtered)
-        for j in range(len(w_filtered)):
-            jj = index_map[j]
-            if w[jj] is not None and w[jj] == w[jj]:
-                w_filtered[j] = w[jj] / w_median
+    if w_median is None:
+        w_median = w_actual
+
+    w_filtered = [1.0]*len(y_filtered)
+    for j in range(len(w_filtered)):
+        jj = index_map[j]
+        if w[jj] is not None and w[jj] == w[jj]:
+            w_filtered[j] = w[jj] / w_median
+
+    return index_map, y_filtered, w_filtered, w_actual
+
+
+def _get_mins(y, right):
+    mins = []
+    l = 0
+    for r in right:
+        mins.append(min(y[l:r]))
+        l = r
+    return mins
 
-    # Find piecewise segments
-    right, values, dists, gamma = solve_potts_autogamma(y_filtered, w=w_filtered)
 
+def _get_steps(index_map, right, values, dists, mins):
     # Extract the steps, mapping indices back etc.
     steps = []
     l = 0
-    for r, v, d in zip(right, values, dists):
+    for r, v, d, m in zip(right, values, dists, mins):
         steps.append((index_map[l], index_map[r-1] + 1,
                           v,
-                          min(y_filtered[l:r]),
+                          m,
                           abs(d/(r - l))))
         l = r
     return steps
@@ -675,23 +816,25 @@ def solve_potts_autogamma(y, w, beta=None, **kw):
         r, v, d = solve_potts_approx(y, w, gamma=gamma, mu_dist=mu_dist, **kw)
 
         # MLE fit noise correlation
-        def sigma_star(rights, values, rho):
-            """
-            |E_0| + sum_{j>0} |E_j - rho E_{j-1}|
-            """
-            l = 1
-            E_prev = y[0] - values[0]
-            s = abs(E_prev)
-            for r, v in zip(rights, values):
-                for yv in y[l:r]:
-                    E = yv - v
-                    s += abs(E - rho*E_prev)
-                    E_prev = E
-                l = r
-            return s
-
-        rho_best = golden_search(lambda rho: sigma_star(r, v, rho), -1, 1,
-                                 xatol=0.05, expand_bounds=True)
+        if hasattr(mu_dist, 'get_sigma_star'):
+            sigma_star = mu_dist.get_sigma_star(r, v)
+        else:
+            def sigma_star(rho):
+                """
+                |E_0| + sum_{j>0} |E_j - rho E_{j-1}|
+                """
+                l = 1
+                E_prev = y[0] - v[0]
+                s = abs(E_prev)
+                for rr, vv in zip(r, v):
+                    for yv in y[l:rr]:
+                        E = yv - vv
+                        s += abs(E - rho*E_prev)
+                        E_prev = E
+                    l = rr
+                return s
+
+        rho_best = golden_search(sigma_star, -1, 1, xatol=0.05, expand_bounds=True)
 
         # Measurement noise floor
         if len(v) > 2:
@@ -703,7 +846,7 @@ def solve_potts_autogamma(y, w, beta=None, **kw):
         sigma_0 = max(1e-300, sigma_0)
 
         # Objective function
-        s = sigma_star(r, v, rho_best)
+        s = sigma_star(rho_best)
         obj = beta*len(r) + math.log(sigma_0 + s)
 
         # Done
@@ -794,12 +937,25 @@ def merge_pieces(gamma, right, values, dists, mu_dist, max_size):
     # restriction.
     l = 0
     for j in range(1, len(right)):
-        prev_score = dist(l, right[j-1]-1) + dist(right[j-1], right[j]-1)
+        if hasattr(mu_dist, 'dist_row'):
+            # Distances of all windows [l, k-1] and [k, right[j]-1] at once
+            row_end = min(right[j-1] + max_size, right[j]) - 1
+            col_start = max(right[j-1] - max_size, l)
+            row = mu_dist.dist_row(l, row_end)
+            col = mu_dist.dist_col(col_start, right[j]-1)
+
+            def score(k):
+                return row[k - 1 - l] + col[k - col_start]
+        else:
+            def score(k):
+                return dist(l, k - 1) + dist(k, right[j]-1)
+
+        prev_score = score(right[j-1])
         new_off = 0
         for off in range(-max_size, max_size+1):
             if right[j-1] + off - 1 <= l or right[j-1] + off >= right[j] - 1 or off == 0:
                 continue
-            new_score = dist(l, right[j-1]+off-1) + dist(right[j-1]+off, right[j]-1)
+            new_score = score(right[j-1] + off)
             if new_score < prev_score:
                 new_off = off
                 prev_score = new_score
@@ -875,9 +1031,216 @@ class L1Dist(object):
         self.dist_memo.clear()
 
 
+class NumpyL1Dist(object):
+    """
+    Same as `L1Dist`, using Numpy.
+
+    The medians and distances of all windows of a given maximum size
+    are computed in batches, and the inner loop of the dynamic program
+    in `solve_potts` is vectorized (`find_best_partition`).  Other
+    windows are computed one at a time, and memoized.
+
+    """
+
+    # Maximum window size for the batch computation, and maximum
+    # number of elements in its intermediate arrays
+    max_batch_size = 128
+    max_batch_items = 2**20
+
+    def __init__(self, y, w):
+        np = _get_numpy()
+        self.y = np.asarray(y, dtype=float)
+        self.w = np.asarray(w, dtype=float)
+        self.mu_memo = {}
+        self.dist_memo = {}
+        self._windows = {}
+
+    def _compute(self, l, r):
+        np = _get_numpy()
+
+        y = self.y[l:r+1]
+        w = self.w[l:r+1]
+        order = np.argsort(y, kind='mergesort')
+        ys = y[order]
+        c = np.cumsum(w[order])
+        midpoint = c[-1] / 2
+
+        # Same tie rules as weighted_median
+        gt = np.flatnonzero(c > midpoint)
+        if len(gt):
+            j = gt[0]
+            yvals = ys[:j][c[:j] == midpoint]
+            m = (yvals.sum() + ys[j]) / (len(yvals) + 1)
+        else:
+            m = y.sum() / len(y)
+
+        self.mu_memo[l, r] = float(m)
+        self.dist_memo[l, r] = float((w * abs(y - m)).sum())
+
+    def mu(self, l, r):
+        windows = self._windows.get(r - l)
+        if windows is not None:
+            return float(windows[0][r, r - l])
+        if (l, r) not in self.mu_memo:
+            self._compute(l, r)
+        return self.mu_memo[l, r]
+
+    def dist(self, l, r):
+        windows = self._windows.get(r - l)
+        if windows is not None:
+            return float(windows[1][r, r - l])
+        if (l, r) not in self.dist_memo:
+            self._compute(l, r)
+        return self.dist_memo[l, r]
+
+    def cleanup_cache(self):
+        # Reset cache if it is too big
+        if len(self.mu_memo) < 500000:
+            return
+
+        self.mu_memo.clear()
+        self.dist_memo.clear()
+
+    def get_windows(self, size):
+        """
+        Compute the median and distance of all windows of at most
+        `size` points.
+
+        Returns
+        -------
+        mu, dist : ndarray, shape (n, size)
+            Values for the window ``[r - k, r]`` at ``[r, k]``
+            (undefined for ``k > r``).
+
+        """
+        np = _get_numpy()
+
+        windows = self._windows.get(size - 1)
+        if windows is not None:
+            return windows
+
+        n = len(self.y)
+        mu = np.zeros((n, size))
+        dist = np.zeros((n, size))
+
+        cols = np.arange(size)
+        chunk = max(1, self.max_batch_items // (size * size))
+        for r0 in range(0, n, chunk):
+            r1 = min(n, r0 + chunk)
+
+            # Window [r - size + 1, r] for each r, sorted; points before
+            # the start of the data get zero weight and sort last
+            idx = np.arange(r0, r1)[:, None] + (cols - size + 1)[None, :]
+            valid = idx >= 0
+            idx = np.maximum(idx, 0)
+            y = self.y[idx]
+            order = np.argsort(np.where(valid, y, np.inf), axis=1, kind='mergesort')
+            ys = np.take_along_axis(y, order, axis=1)
+            ws = np.take_along_axis(np.where(valid, self.w[idx], 0), order, axis=1)
+
+            # Window [r - k, r] contains the points at columns >= size - 1 - k
+            mask = order[:, None, :] >= (size - 1 - cols)[None, :, None]
+            wm = np.where(mask, ws[:, None, :], 0)
+            c = np.cumsum(wm, axis=2)
+            midpoint = c[:, :, -1:] / 2
+
+            # Same tie rules as weighted_median
+            gt = c > midpoint
+            has_gt = gt.any(axis=2)
+            j = gt.argmax(axis=2)
+            before = (c == midpoint) & mask & (cols[None, None, :] < j[:, :, None])
+            m = ((np.where(before, ys[:, None, :], 0).sum(axis=2) +
+                  np.take_along_axis(ys, j, axis=1)) / (before.sum(axis=2) + 1))
+            mean = (np.where(mask, ys[:, None, :], 0).sum(axis=2) /
+                    np.maximum(mask.sum(axis=2), 1))
+            m = np.where(has_gt, m, mean)
+
+            mu[r0:r1] = m
+            dist[r0:r1] = (wm * abs(ys[:, None, :] - m[:, :, None])).sum(axis=2)
+
+        for k in range(size):
+            self._windows[k] = (mu, dist)
+        return mu, dist
+
+    def find_best_partition(self, gamma, min_size, max_size, min_pos, max_pos):
+        """
+        Routine "Find best partition" of `solve_potts`.
+        """
+        np = _get_numpy()
+
+        i0 = min_pos
+        i1 = max_pos
+        size = min(max_size, i1 - i0)
+
+        if size <= self.max_batch_size:
+            dist = self.get_windows(size)[1]
+        else:
+            dist = None
+
+        B = np.empty(i1 - i0 + 1)
+        B[0] = -gamma
+        p = [0]*(i1 - i0)
+        for r in range(i0, i1):
+            a = max(r + 1 - max_size, i0)
+            b = max(r + 1 - min_size + 1, i0)
+            if b <= a:
+                B[r+1-i0] = np.inf
+                continue
+
+            # Cost for l in range(a, b)
+            if dist is not None:
+                d = dist[r, r-b+1:r-a+1][::-1]
+            else:
+                d = np.array([self.dist(l, r) for l in range(a, b)])
+            cost = B[a-i0:b-i0] + gamma + d
+
+            # Rightmost minimum
+            k = len(cost) - 1 - int(cost[::-1].argmin())
+            B[r+1-i0] = cost[k]
+            p[r-i0] = a + k - 1
+
+            if dist is None:
+                self.cleanup_cache()
+
+        return p
+
+    def get_sigma_star(self, right, values):
+        """
+        Return the function ``sigma_star(rho)`` of `solve_potts_autogamma`
+        for the given solution.
+        """
+        np = _get_numpy()
+
+        E = self.y - np.repeat(values, np.diff(np.concatenate([[0], right])))
+        E_0 = abs(E[0])
+        E_cur = E[1:]
+        E_prev = E[:-1]
+
+        def sigma_star(rho):
+            return E_0 + abs(E_cur - rho*E_prev).sum()
+
+        return sigma_star
+
+
+def _get_numpy():
+    """
+    Import Numpy on first use.  Returns None if it is not available.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
 def get_mu_dist(y, w):
     if _rangemedian is not None:
         return _rangemedian.RangeMedian(y, w)
+    elif _get_numpy() is not None:
+        return NumpyL1Dist(y, w)
     else:
         return L1Dist(y, w)
 
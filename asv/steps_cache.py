@@ -0,0 +1,218 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import os
+import json
+import time
+import hashlib
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from .console import log
+from . import step_detect
+from . import util
+
+
+STEPS_CACHE_FILENAME = 'steps-cache.sqlite'
+
+# Bump when the schema changes
+STEPS_CACHE_VERSION = 2
+
+
+def get_steps_key(data):
+    """
+    Compute the key under which the steps of a data series are stored.
+
+    Parameters
+    ----------
+    data : list of (x, y, w)
+        Data series, as passed to step detection.
+
+    Returns
+    -------
+    key : str
+        Hex digest of the data and the step detection version.
+
+    """
+    content = json.dumps([step_detect.STEP_DETECT_VERSION, data])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class StepsCache(object):
+    """
+    Persistent cache of step detection results.
+
+    The cache is a SQLite database ``steps-cache.sqlite`` in the
+    per-user cache of the results directory (see
+    `util.get_user_cache_path`), with a row for each data series::
+
+        steps(key, steps, size, atime)
+
+    and a row for each named series (graph and series index)::
+
+        series(name, state, size, atime)
+
+    The key is computed by `get_steps_key` from the data series, and
+    ``steps`` is the result of step detection as JSON.  ``state`` is
+    the last state of incremental step detection for the named
+    series, as JSON (see `Graph.detect_steps`).  ``atime`` is the last
+    time the row was used.
+
+    On `close`, the least recently used rows are removed until the
+    total size of the stored steps is below ``steps_cache_size``
+    megabytes.
+
+    Attributes
+    ----------
+    hits : int
+        Number of series found in the cache.
+    misses : int
+        Number of series not found in the cache.
+
+    """
+
+    def __init__(self, results_dir, max_size):
+        self._path = util.get_user_cache_path(results_dir, STEPS_CACHE_FILENAME)
+        self._max_size = max_size
+        self._used = set()
+        self._used_series = set()
+        self.hits = 0
+        self.misses = 0
+        self._conn = self._connect()
+
+    @classmethod
+    def from_conf(cls, conf):
+        """
+        Return the cache for the given configuration, or None if it is
+        not enabled or not available.
+        """
+        if sqlite3 is None or not os.path.isdir(conf.results_dir):
+            return None
+        max_size = int(conf.steps_cache_size * 1024**2)
+        if max_size <= 0:
+            return None
+        return cls(conf.results_dir, max_size)
+
+    def _connect(self):
+        try:
+            if not os.path.isdir(os.path.dirname(self._path)):
+                os.makedirs(os.path.dirname(self._path))
+            conn = sqlite3.connect(self._path, timeout=60)
+            self._init_schema(conn)
+            return conn
+        except sqlite3.Error as exc:
+            log.debug("Steps cache {0} not usable: {1}".format(self._path, exc))
+            # Corrupted or incompatible database: start over
+            try:
+                os.remove(self._path)
+                conn = sqlite3.connect(self._path, timeout=60)
+                self._init_schema(conn)
+                return conn
+            except (OSError, sqlite3.Error):
+                pass
+        except OSError as exc:
+            log.debug("Steps cache {0} not usable: {1}".format(self._path, exc))
+
+        conn = sqlite3.connect(':memory:')
+        self._init_schema(conn)
+        return conn
+
+    def _init_schema(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == STEPS_CACHE_VERSION:
+            return
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS steps")
+            conn.execute("DROP TABLE IF EXISTS series")
+            conn.execute("CREATE TABLE steps ("
+                         "key TEXT PRIMARY KEY, steps TEXT, "
+                         "size INTEGER, atime REAL)")
+            conn.execute("CREATE TABLE series ("
+                         "name TEXT PRIMARY KEY, state TEXT, "
+                         "size INTEGER, atime REAL)")
+            conn.execute("PRAGMA user_version = {0:d}".format(STEPS_CACHE_VERSION))
+
+    def get(self, key):
+        """
+        Return the stored steps for the given key, or None if not in
+        the cache.
+        """
+        row = self._conn.execute("SELECT steps FROM steps WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used.add(key)
+        return json.loads(row[0])
+
+    def put(self, key, steps):
+        """
+        Store the steps for the given key.  The changes are committed
+        on `close`.
+        """
+        content = json.dumps(steps)
+        self._conn.execute("INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?)",
+                           (key, content, len(content), time.time()))
+
+    def get_state(self, name):
+        """
+        Return the stored state for the given series name, or None.
+        """
+        row = self._conn.execute("SELECT state FROM series WHERE name = ?",
+                                 (name,)).fetchone()
+        if row is None:
+            return None
+
+        self._used_series.add(name)
+        return json.loads(row[0])
+
+    def put_state(self, name, state):
+        """
+        Store the state for the given series name.  The changes are
+        committed on `close`.
+        """
+        content = json.dumps(state)
+        self._conn.execute("INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?)",
+                           (name, content, len(content), time.time()))
+
+    def _cleanup(self):
+        total_size = 0
+        expired = {'steps': [], 'series': []}
+        for table, key, size, atime in self._conn.execute(
+                "SELECT 'steps', key, size, atime FROM steps "
+                "UNION ALL SELECT 'series', name, size, atime FROM series "
+                "ORDER BY atime DESC").fetchall():
+            total_size += size
+            if total_size > self._max_size:
+                expired[table].append((key,))
+
+        self._conn.executemany("DELETE FROM steps WHERE key = ?", expired['steps'])
+        self._conn.executemany("DELETE FROM series WHERE name = ?", expired['series'])
+
+    def close(self):
+        """
+        Mark the used rows as recently used, remove the rows exceeding
+        the size limit, and close the database.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.executemany("UPDATE steps SET atime = ? WHERE key = ?",
+                                   [(now, key) for key in self._used])
+            self._conn.executemany("UPDATE series SET atime = ? WHERE name = ?",
+                                   [(now, name) for name in self._used_series])
+            self._cleanup()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
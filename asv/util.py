@@ -25,6 +25,7 @@ import shutil
 import stat
 import shlex
 import operator
+import hashlib
 import collections
 import multiprocessing
 
@@ -793,8 +794,10 @@ def write_json(path, data, api_version=None, compact=False):
         os.makedirs(dirname)
 
     if api_version is not None:
-        data = dict(data)
-        data['version'] = api_version
+        # Keep the version first, and the order of the remaining keys
+        data = collections.OrderedDict(
+            [('version', api_version)] +
+            [(key, value) for key, value in six.iteritems(data) if key != 'version'])
 
     open_kwargs = {}
     if sys.version_info[0] >= 3:
@@ -984,6 +987,16 @@ def get_cpu_info():
     return ''
 
 
+def get_available_cpus():
+    """
+    Returns a sorted list of the CPUs this process is allowed to run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    import multiprocessing
+    return list(range(multiprocessing.cpu_count()))
+
+
 def get_memsize():
     """
     Returns the amount of physical memory in this machine.
@@ -1249,6 +1262,34 @@ def sanitize_filename(filename):
     return filename
 
 
+def get_user_cache_dir():
+    """
+    Return the directory of the per-user caches of asv:
+    ``$XDG_CACHE_HOME/asv``, by default ``~/.cache/asv``, or
+    ``%LOCALAPPDATA%\\asv\\Cache`` on Windows.
+
+    The caches only speed things up, and can be deleted at any time.
+    """
+    if os.environ.get('XDG_CACHE_HOME'):
+        return os.path.join(os.environ['XDG_CACHE_HOME'], 'asv')
+    if WIN and os.environ.get('LOCALAPPDATA'):
+        return os.path.join(os.environ['LOCALAPPDATA'], 'asv', 'Cache')
+    return os.path.join(os.path.expanduser('~'), '.cache', 'asv')
+
+
+def get_user_cache_path(directory, filename):
+    """
+    Return the path of a per-user cache file about the given
+    directory (e.g. the results directory), so that the cache is
+    kept out of the directory itself.
+    """
+    directory = os.path.normcase(os.path.realpath(directory))
+    if not isinstance(directory, six.text_type):
+        directory = directory.decode(sys.getfilesystemencoding())
+    key = hashlib.sha256(directory.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(get_user_cache_dir(), key, filename)
+
+
 def namedtuple_with_doc(name, slots, doc):
     cls = collections.namedtuple(name, slots)
     if sys.version_info[0] >= 3:
@@ -1390,7 +1431,8 @@ def get_multiprocessing_lock(name):
 
 def get_multiprocessing_pool(parallel=None):
     """Create a multiprocessing.Pool, managing global locks properly"""
-    return multiprocessing.Pool(initializer=_init_global_locks,
+    return multiprocessing.Pool(processes=parallel,
+                                initializer=_init_global_locks,
                                 initargs=(_global_locks,))
 
 
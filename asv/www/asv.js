@@ -14,6 +14,10 @@ $(document).ready(function() {
     /* Graph data cache */
     var graph_cache = {};
     var graph_cache_max_size = 5;
+    /* URLs of graphs with reduced resolution data */
+    var graph_lod_urls = null;
+    /* Requests of the indices of the graph packs */
+    var graph_pack_index_cache = {};
 
     var colors = [
         '#247AAD',
@@ -283,11 +287,18 @@ $(document).ready(function() {
             }, 1);
         }
         else {
-            $.ajax({
-                url: url + '?timestamp=' + $.asv.master_timestamp,
-                dataType: "json",
-                cache: true
-            }).done(function(data) {
+            var request;
+            if (master_json.graph_packs) {
+                request = load_packed_graph_data(url);
+            }
+            else {
+                request = $.ajax({
+                    url: url + '?timestamp=' + $.asv.master_timestamp,
+                    dataType: "json",
+                    cache: true
+                });
+            }
+            request.done(function(data) {
                 if (Object.keys(graph_cache).length > graph_cache_max_size) {
                     $.each(Object.keys(graph_cache), function (i, key) {
                         delete graph_cache[key];
@@ -302,6 +313,165 @@ $(document).ready(function() {
         return dfd.promise();
     }
 
+    /*
+      Load graph data from the pack of its benchmark (see
+      asv.graph.GraphPacks) with a HTTP range request.  If the server
+      does not support range requests, the data is sliced from the
+      whole pack.
+     */
+    function load_packed_graph_data(url) {
+        var dfd = $.Deferred();
+        var parts = url.split('/');
+        var pack_url = "graph_packs/" + parts[parts.length - 1].replace(/(\.lod([0-9]+-[0-9]+)?)?\.json$/, "");
+        var path = $.map(parts, function (val) { return decodeURIComponent(val); }).join('/');
+
+        load_graph_pack_index(pack_url).done(function(index) {
+            var item = index[path];
+            if (!item) {
+                dfd.reject();
+                return;
+            }
+            $.ajax({
+                url: pack_url + '.pack?timestamp=' + $.asv.master_timestamp,
+                dataType: "text",
+                headers: {Range: "bytes=" + item[0] + "-" + (item[0] + item[1] - 1)},
+                cache: true
+            }).done(function(text, status, xhr) {
+                if (xhr.status != 206) {
+                    text = text.substr(item[0], item[1]);
+                }
+                var data;
+                try {
+                    data = JSON.parse(text);
+                }
+                catch (e) {
+                    dfd.reject();
+                    return;
+                }
+                dfd.resolve(data);
+            }).fail(function() {
+                dfd.reject();
+            });
+        }).fail(function() {
+            dfd.reject();
+        });
+
+        return dfd.promise();
+    }
+
+    function load_graph_pack_index(pack_url) {
+        if (!graph_pack_index_cache[pack_url]) {
+            graph_pack_index_cache[pack_url] = $.ajax({
+                url: pack_url + '.index.json?timestamp=' + $.asv.master_timestamp,
+                dataType: "json",
+                cache: true
+            }).fail(function() {
+                delete graph_pack_index_cache[pack_url];
+            });
+        }
+        return graph_pack_index_cache[pack_url];
+    }
+
+    /*
+      Whether reduced resolution data is available for the graph
+      at the given URL (see asv.graph.Graph.get_lod_data)
+     */
+    function has_graph_lod(url) {
+        if (!graph_lod_urls) {
+            graph_lod_urls = {};
+            $.each(master_json.graph_lod || [], function(i, path) {
+                var parts = $.map(path.split('/'), function (val) {
+                    return encodeURIComponent(val);
+                });
+                graph_lod_urls[parts.join('/') + ".json"] = true;
+            });
+        }
+        return !!graph_lod_urls[url];
+    }
+
+    /*
+      URL of the index of the reduced resolution data of the graph at
+      the given URL, or of a chunk of one of its levels (see
+      asv.graph.Graph.get_lod_files)
+     */
+    function graph_lod_url(url, level, chunk) {
+        if (level === undefined) {
+            return url.replace(/\.json$/, ".lod.json");
+        }
+        return url.replace(/\.json$/, ".lod" + level + "-" + chunk + ".json");
+    }
+
+    /*
+      Load the given chunks of a level of reduced resolution graph
+      data, joined in one.  Level 0 is the full resolution data, a
+      list of points as in the graph data; the other levels contain
+      lists of the bucket revisions and values.
+     */
+    function load_graph_lod_chunks(url, level, chunks) {
+        var requests = $.map(chunks, function (chunk) {
+            return load_graph_data(graph_lod_url(url, level, chunk));
+        });
+        return $.when.apply($, requests).then(function () {
+            var parts = Array.prototype.slice.call(arguments, 0, chunks.length);
+            if (level == 0) {
+                return [].concat.apply([], parts);
+            }
+            var data = {};
+            $.each(parts[0], function (key, values) {
+                var series = values.length > 0 && $.isArray(values[0]);
+                data[key] = series ? $.map(values, function () { return [[]]; }) : [];
+                $.each(parts, function (i, part) {
+                    if (series) {
+                        for (var j = 0; j < data[key].length; ++j) {
+                            data[key][j] = data[key][j].concat(part[key][j]);
+                        }
+                    }
+                    else {
+                        data[key] = data[key].concat(part[key]);
+                    }
+                });
+            });
+            return data;
+        });
+    }
+
+    /*
+      Convert reduced resolution graph data, loaded with
+      load_graph_lod_chunks, to the format of the full graph data, with
+      the bucket means (or the given key of the level, 'min' or
+      'max') as the values.
+     */
+    function lod_to_graph_data(data, key) {
+        var values_data = data[key || 'mean'];
+        var scalar = !(values_data.length > 0 && $.isArray(values_data[0]));
+        var series = new Array(data.x.length);
+        for (var k = 0; k < data.x.length; ++k) {
+            if (scalar) {
+                series[k] = [data.x[k], values_data[k]];
+            }
+            else {
+                var values = new Array(values_data.length);
+                for (var j = 0; j < values_data.length; ++j) {
+                    values[j] = values_data[j][k];
+                }
+                series[k] = [data.x[k], values];
+            }
+        }
+        return series;
+    }
+
+    /*
+      Map the revisions of the points of reduced resolution graph data
+      to the [first, last] revisions of their buckets.
+     */
+    function lod_buckets(data) {
+        var buckets = {};
+        for (var k = 0; k < data.x.length; ++k) {
+            buckets[data.x[k]] = [data.first[k], data.last[k]];
+        }
+        return buckets;
+    }
+
     /*
       Parse hash string, assuming format similar to standard URL
       query strings
@@ -447,6 +617,8 @@ $(document).ready(function() {
         }).done(function (index) {
             master_json = index;
             $.asv.master_json = index;
+            graph_lod_urls = null;
+            graph_pack_index_cache = {};
 
             /* Page title */
             var project_name = $("#project-name")[0];
@@ -500,6 +672,11 @@ $(document).ready(function() {
     this.param_selection_from_flat_idx = param_selection_from_flat_idx;
     this.graph_to_path = graph_to_path;
     this.load_graph_data = load_graph_data;
+    this.has_graph_lod = has_graph_lod;
+    this.graph_lod_url = graph_lod_url;
+    this.load_graph_lod_chunks = load_graph_lod_chunks;
+    this.lod_to_graph_data = lod_to_graph_data;
+    this.lod_buckets = lod_buckets;
     this.get_commit_hash = get_commit_hash;
     this.get_revision = get_revision;
 
@@ -9,7 +9,11 @@ $(document).ready(function() {
     /* An array of graphs being displayed. */
     var graphs = [];
     var orig_graphs = [];
-    /* An array of commit revisions being displayed */
+    /* The data of the graphs, with the reduced resolution data
+       loaded if any (see $.asv.load_graph_lod_chunks) */
+    var loaded_graphs = [];
+    /* An array of commit revisions being displayed, from the full
+       resolution data */
     var current_revisions = [];
     /* True when log scaling is enabled. */
     var log_scale = false;
@@ -97,6 +101,18 @@ $(document).ready(function() {
         return $.asv.get_commit_hash(x);
     }
 
+    function get_bucket(series, x) {
+        // Return the [first, last] revisions combined in the reduced
+        // resolution data point of a series at position x, or null
+        if (!series.lod_buckets) {
+            return null;
+        }
+        if (date_scale) {
+            x = date_to_revision[x];
+        }
+        return series.lod_buckets[x] || null;
+    }
+
 
     function display_benchmark(bm_name, state_selection, highlight_revisions) {
         setup_benchmark_graph_display();
@@ -297,9 +313,19 @@ $(document).ready(function() {
                 if (previous_hover != item.datapoint) {
                     previous_hover = item.datapoint;
                     var y = item.datapoint[1];
+                    var unit = $.asv.master_json.benchmarks[current_benchmark].unit;
+                    var bucket = get_bucket(item.series, item.datapoint[0]);
+                    if (bucket) {
+                        /* Mean of several commits */
+                        showTooltip(
+                            item.pageX, item.pageY,
+                            $.asv.pretty_unit(y, unit) + " (mean) @ " +
+                                $.asv.get_commit_hash(bucket[0]) + ".." +
+                                $.asv.get_commit_hash(bucket[1]));
+                        return;
+                    }
                     var commit_hash = get_commit_hash(item.datapoint[0]);
                     if (commit_hash) {
-                        var unit = $.asv.master_json.benchmarks[current_benchmark].unit;
                         showTooltip(
                             item.pageX, item.pageY,
                             $.asv.pretty_unit(y, unit) + " @ " + commit_hash);
@@ -323,6 +349,13 @@ $(document).ready(function() {
                         select_reference = false;
                         reference = item.datapoint[1];
                         update_graphs();
+                    } else if (get_bucket(item.series, item.datapoint[0])) {
+                        /* Zoom in on the commits of a reduced
+                           resolution data point */
+                        var bucket = get_bucket(item.series, item.datapoint[0]);
+                        previous_click = null;
+                        update_graphs({xaxis: {from: get_x_from_revision(bucket[0]),
+                                               to: get_x_from_revision(bucket[1])}});
                     } else {
                         var commit_hash = get_commit_hash(item.datapoint[0]);
                         if (previous_hash !== commit_hash) {
@@ -826,7 +859,6 @@ $(document).ready(function() {
 
         var to_load = collect_graphs(current_benchmark, state, benchmark_param_selection);
         var failures = 0;
-        var count = 1;
         
         if (to_load.length === 0) {
             $('#main-graph').html("<div style='display: flex;" +
@@ -837,30 +869,24 @@ $(document).ready(function() {
             return
         }
     
+        loaded_graphs = [];
         current_revisions = [];
         $.each(to_load, function(i, item) {
-            $.asv.load_graph_data(
-                item[0]
-            ).done(function (data) {
-                $.each(data, function(i, point) {
-                    if (current_revisions.indexOf(point[0]) === -1) {
-                        current_revisions.push(point[0]);
-                    }
-                });
-                $.each(item[1], function(j, graph_content) {
-                    var series;
-                    series = $.asv.filter_graph_data(data,
-                                                     x_coordinate_axis,
-                                                     graph_content[0],
-                                                     $.asv.master_json.benchmarks[current_benchmark].params);
-                    orig_graphs.push({
-                        data: series,
-                        label: graph_content[1],
-                        bars: { order: count, },
+            var loaded = {url: item[0], contents: item[1], lod: null, level: null,
+                          chunks: [], coarse: null, data: null, min_data: null,
+                          max_data: null, buckets: null};
+            load_graph(loaded).done(function () {
+                /* Reduced resolution data, used only when the x-axis
+                   is the time axis, does not have all revisions */
+                if (!loaded.lod) {
+                    $.each(loaded.data, function(i, point) {
+                        if (current_revisions.indexOf(point[0]) === -1) {
+                            current_revisions.push(point[0]);
+                        }
                     });
-                    count += 1;
-                });
-                graphs = orig_graphs;
+                }
+                loaded_graphs.push(loaded);
+                rebuild_graphs();
                 update_graphs();
             }).fail(function () {
                 failures += 1;
@@ -884,6 +910,233 @@ $(document).ready(function() {
         });
     }
 
+    /* Load the data of a graph.  If reduced resolution data is
+       available and the x-axis is the time axis, load its coarsest
+       level, and otherwise the full data. */
+    function load_graph(loaded) {
+        if (x_coordinate_axis != 0 || !$.asv.has_graph_lod(loaded.url)) {
+            return $.asv.load_graph_data(loaded.url).done(function (data) {
+                loaded.data = data;
+                loaded.min_data = loaded.max_data = loaded.buckets = null;
+            });
+        }
+
+        return $.asv.load_graph_data(
+            $.asv.graph_lod_url(loaded.url)
+        ).then(function (lod) {
+            var level = lod.levels.length - 1;
+            var chunks = $.map(lod.levels[level].chunks, function (info, k) { return k; });
+            return $.asv.load_graph_lod_chunks(loaded.url, level, chunks).done(function (data) {
+                loaded.lod = lod;
+                loaded.coarse = {
+                    data: $.asv.lod_to_graph_data(data),
+                    min_data: $.asv.lod_to_graph_data(data, 'min'),
+                    max_data: $.asv.lod_to_graph_data(data, 'max'),
+                    buckets: $.asv.lod_buckets(data)
+                };
+                set_graph_level(loaded, level, [], null);
+            });
+        });
+    }
+
+    /* Show the data of the given chunks of a level of detail of a
+       graph, and the coarsest level outside of their range. */
+    function set_graph_level(loaded, level, chunks, detail) {
+        var coarse = loaded.coarse;
+
+        loaded.level = level;
+        loaded.chunks = chunks;
+
+        if (detail === null) {
+            loaded.data = coarse.data;
+            loaded.min_data = coarse.min_data;
+            loaded.max_data = coarse.max_data;
+            loaded.buckets = coarse.buckets;
+            return;
+        }
+
+        var level_chunks = loaded.lod.levels[level].chunks;
+        var first = level_chunks[chunks[0]][0];
+        var last = level_chunks[chunks[chunks.length - 1]][1];
+
+        var data = [];
+        var min_data = [];
+        var max_data = [];
+        var buckets = {};
+        function add_coarse(k) {
+            var x = coarse.data[k][0];
+            data.push(coarse.data[k]);
+            min_data.push(coarse.min_data[k]);
+            max_data.push(coarse.max_data[k]);
+            buckets[x] = coarse.buckets[x];
+        }
+
+        var k = 0;
+        for (; k < coarse.data.length; ++k) {
+            if (coarse.buckets[coarse.data[k][0]][1] >= first) {
+                break;
+            }
+            add_coarse(k);
+        }
+        data = data.concat(detail.data);
+        min_data = min_data.concat(detail.min_data);
+        max_data = max_data.concat(detail.max_data);
+        $.extend(buckets, detail.buckets);
+        for (; k < coarse.data.length; ++k) {
+            if (coarse.buckets[coarse.data[k][0]][0] > last) {
+                add_coarse(k);
+            }
+        }
+
+        loaded.data = data;
+        loaded.min_data = min_data;
+        loaded.max_data = max_data;
+        loaded.buckets = buckets;
+    }
+
+    /* Build the graphs to plot from the loaded data.  Reduced
+       resolution data is drawn with the range between the minimum and
+       maximum of each bucket filled, in the color of the line. */
+    function rebuild_graphs() {
+        var count = 1;
+        var params = $.asv.master_json.benchmarks[current_benchmark].params;
+        orig_graphs = [];
+        $.each(loaded_graphs, function(i, loaded) {
+            $.each(loaded.contents, function(j, graph_content) {
+                var series;
+                series = $.asv.filter_graph_data(loaded.data,
+                                                 x_coordinate_axis,
+                                                 graph_content[0],
+                                                 params);
+                orig_graphs.push({
+                    data: series,
+                    label: graph_content[1],
+                    color: count - 1,
+                    bars: { order: count, },
+                    lod_buckets: loaded.buckets
+                });
+
+                if (loaded.lod) {
+                    var min_series = $.asv.filter_graph_data(loaded.min_data,
+                                                             x_coordinate_axis,
+                                                             graph_content[0],
+                                                             params);
+                    var max_series = $.asv.filter_graph_data(loaded.max_data,
+                                                             x_coordinate_axis,
+                                                             graph_content[0],
+                                                             params);
+                    var envelope = new Array(series.length);
+                    for (var k = 0; k < series.length; ++k) {
+                        if (min_series[k][1] === null || max_series[k][1] === null) {
+                            envelope[k] = [series[k][0], null, null];
+                        } else {
+                            envelope[k] = [series[k][0], max_series[k][1], min_series[k][1]];
+                        }
+                    }
+                    orig_graphs.push({
+                        data: envelope,
+                        color: count - 1,
+                        lines: { show: true, lineWidth: 0, fill: 0.2 },
+                        points: { show: false },
+                        hoverable: false,
+                        clickable: false,
+                        lod_buckets: loaded.buckets
+                    });
+                }
+                count += 1;
+            });
+        });
+        graphs = orig_graphs;
+    }
+
+    /* Load more detailed data for the graphs shown at reduced
+       resolution, for the chunks of data in the x-axis range, or go
+       back to the coarsest level when zoomed out. */
+    function refine_graph_levels(ranges) {
+        var to_refine = [];
+
+        if (x_coordinate_axis != 0) {
+            return;
+        }
+
+        $.each(loaded_graphs, function(i, loaded) {
+            if (!loaded.lod) {
+                return;
+            }
+
+            var lod = loaded.lod;
+            var coarsest = lod.levels.length - 1;
+
+            /* Estimated number of data points in the range */
+            var n = 0;
+            $.each(loaded.coarse.data, function(j, point) {
+                var x = get_x_from_revision(point[0]);
+                if (x >= ranges.xaxis.from && x <= ranges.xaxis.to) {
+                    n += 1;
+                }
+            });
+            n *= lod.levels[coarsest].size;
+
+            /* Finest level with at most max_points points in the
+               range, and its chunks in the range */
+            var level = coarsest;
+            while (level > 0 && n / lod.levels[level - 1].size <= lod.max_points) {
+                level -= 1;
+            }
+            var chunks = [];
+            if (level != coarsest) {
+                $.each(lod.levels[level].chunks, function(k, info) {
+                    if (get_x_from_revision(info[1]) >= ranges.xaxis.from &&
+                            get_x_from_revision(info[0]) <= ranges.xaxis.to) {
+                        chunks.push(k);
+                    }
+                });
+            }
+            if (!chunks.length) {
+                level = coarsest;
+            }
+
+            if (level == loaded.level && chunks.join() == loaded.chunks.join()) {
+                return;
+            }
+
+            /* Ignore the data of previous requests loaded later */
+            var request = loaded.request = (loaded.request || 0) + 1;
+
+            if (level == coarsest) {
+                set_graph_level(loaded, level, [], null);
+                to_refine.push($.when());
+                return;
+            }
+
+            to_refine.push($.asv.load_graph_lod_chunks(
+                loaded.url, level, chunks
+            ).done(function (data) {
+                if (loaded.request != request) {
+                    return;
+                }
+                var detail;
+                if (level == 0) {
+                    detail = {data: data, min_data: data, max_data: data, buckets: {}};
+                }
+                else {
+                    detail = {data: $.asv.lod_to_graph_data(data),
+                              min_data: $.asv.lod_to_graph_data(data, 'min'),
+                              max_data: $.asv.lod_to_graph_data(data, 'max'),
+                              buckets: $.asv.lod_buckets(data)};
+                }
+                set_graph_level(loaded, level, chunks, detail);
+            }));
+        });
+
+        if (to_refine.length) {
+            $.when.apply($, to_refine).done(function () {
+                rebuild_graphs();
+                update_graphs(ranges);
+            });
+        }
+    }
+
     /* Handle log scaling the plot */
     function handle_y_scale(options) {
         if (!graphs.length)
@@ -913,13 +1166,17 @@ $(document).ready(function() {
                         break;
                     }
                 }
-                var p = data[j][1];
-                if (p !== null && (!log_scale || p > 0)) {
-                    if (p < min) {
-                        min = p;
-                    }
-                    if (p > max) {
-                        max = p;
+                /* Envelopes of reduced resolution data have a
+                   third value, the bottom of the filled range */
+                for (var c = 1; c < data[j].length; ++c) {
+                    var p = data[j][c];
+                    if (p !== null && (!log_scale || p > 0)) {
+                        if (p < min) {
+                            min = p;
+                        }
+                        if (p > max) {
+                            max = p;
+                        }
                     }
                 }
             }
@@ -1116,8 +1373,8 @@ $(document).ready(function() {
     }
 
     /* Once we have all of the graphs loaded, send them to flot for
-       drawing. */
-    function update_graphs() {
+       drawing, zoomed in on the given ranges if any. */
+    function update_graphs(ranges) {
         if (current_benchmark === null) {
             return;
         }
@@ -1272,6 +1529,8 @@ $(document).ready(function() {
             if (overview) {
                 overview.setSelection(ranges, true);
             }
+
+            refine_graph_levels(ranges);
         });
 
         overview_div.off("plotselected");
@@ -1288,8 +1547,10 @@ $(document).ready(function() {
                 return;
             }
 
-            /* Find the minimum and maximum values */
+            /* Find the minimum and maximum values, and their first
+               and last commits (several for reduced resolution data) */
             var min = Infinity;
+            var first_commit = null;
             var left = plot.getAxes().xaxis.min;
             $.each(graphs, function(i, graph) {
                 var data = graph.data;
@@ -1298,6 +1559,9 @@ $(document).ready(function() {
                     if (p !== null && p >= left) {
                         if (p < min) {
                             min = p;
+                            var bucket = get_bucket(graph, p);
+                            first_commit = (bucket ? $.asv.get_commit_hash(bucket[0])
+                                            : get_commit_hash(p));
                         }
                         break;
                     }
@@ -1305,6 +1569,7 @@ $(document).ready(function() {
             });
 
             var max = -Infinity;
+            var last_commit = null;
             var right = plot.getAxes().xaxis.max;
             $.each(graphs, function(i, graph) {
                 var data = graph.data;
@@ -1313,6 +1578,9 @@ $(document).ready(function() {
                     if (p !== null && p <= right) {
                         if (p > max) {
                             max = p;
+                            var bucket = get_bucket(graph, p);
+                            last_commit = (bucket ? $.asv.get_commit_hash(bucket[1])
+                                           : get_commit_hash(p));
                         }
                         break;
                     }
@@ -1320,13 +1588,11 @@ $(document).ready(function() {
             });
 
             var result;
-            if (min === null || max === null || min > max) {
+            if (first_commit === null || last_commit === null || min > max) {
                 result = '';
-            } else if (min == max) {
-                result = get_commit_hash(min) + '^!';
+            } else if (first_commit == last_commit) {
+                result = first_commit + '^!';
             } else {
-                var first_commit = get_commit_hash(min);
-                var last_commit = get_commit_hash(max);
                 result = first_commit + ".." + last_commit;
             }
             $("#range")[0].value = result;
@@ -1358,6 +1624,10 @@ $(document).ready(function() {
 
         update_tags();
         update_range();
+
+        if (ranges) {
+            plot.setSelection(ranges);
+        }
     }
 
 
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    from asv import config, environment, runner
+except ImportError:
+    pass
+
+
+class Dispatch:
+    """
+    Per-benchmark dispatch overhead of the launch methods, measured
+    by running a trivial benchmark.
+    """
+    params = ['spawn', 'forkserver']
+    param_names = ['launch_method']
+    number = 1
+    repeat = (5, 20, 10.0)
+    timeout = 120
+
+    def setup(self, launch_method):
+        if launch_method == 'forkserver' and not hasattr(os, 'fork'):
+            raise NotImplementedError()
+
+        self.tmpdir = tempfile.mkdtemp()
+        benchmark_dir = os.path.join(self.tmpdir, 'benchmark')
+        os.makedirs(benchmark_dir)
+        with open(os.path.join(benchmark_dir, '__init__.py'), 'w') as f:
+            pass
+        with open(os.path.join(benchmark_dir, 'trivial.py'), 'w') as f:
+            f.write("def track_trivial():\n    return 0\n")
+
+        conf = config.Config.from_json({'project': 'asv',
+                                        'repo': 'None',
+                                        'benchmark_dir': benchmark_dir})
+        env = environment.ExistingEnvironment(conf, sys.executable, {}, {})
+        self.spawner = runner.get_spawner(env, benchmark_dir, launch_method)
+        self.spawner.preimport()
+        self.result_file = os.path.join(self.tmpdir, 'result')
+
+    def teardown(self, launch_method):
+        self.spawner.close()
+        shutil.rmtree(self.tmpdir)
+
+    def time_run_trivial(self, launch_method):
+        self.spawner.run('trivial.track_trivial', '{}', 'None',
+                         self.result_file, 60, self.tmpdir)
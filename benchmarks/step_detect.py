@@ -18,3 +18,34 @@ class Simple:
 
     def time_solve_potts_approx(self):
         step_detect.solve_potts_approx(self.y, [1] * len(self.y), gamma=0.3)
+
+
+class Backends:
+    params = ['python', 'numpy', 'rangemedian']
+    param_names = ['backend']
+
+    def setup(self, backend):
+        if not hasattr(step_detect, 'NumpyL1Dist'):
+            raise NotImplementedError()
+
+        if backend == 'rangemedian' and step_detect._rangemedian is None:
+            raise NotImplementedError()
+        if backend == 'numpy' and step_detect._get_numpy() is None:
+            raise NotImplementedError()
+
+        self._saved = (step_detect._rangemedian, step_detect._numpy)
+        if backend != 'rangemedian':
+            step_detect._rangemedian = None
+        if backend == 'python':
+            step_detect._numpy = False
+
+        self.y = ([1]*20 + [2]*30)*50
+
+    def teardown(self, backend):
+        step_detect._rangemedian, step_detect._numpy = self._saved
+
+    def time_detect_steps(self, backend):
+        step_detect.detect_steps(self.y)
+
+    def time_solve_potts_approx(self, backend):
+        step_detect.solve_potts_approx(self.y, [1] * len(self.y), gamma=0.3)
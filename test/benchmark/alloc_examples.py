@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+
+def alloc_list():
+    # Transient allocation of 2**20 pointers, plus 10 retained lists
+    obj = [0] * 2**20
+    del obj
+    alloc_list.retained = [[x] for x in range(10)]
+
+
+alloc_list.alloc_by_file = 5
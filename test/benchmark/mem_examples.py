@@ -7,3 +7,7 @@ from __future__ import (absolute_import, division, print_function,
 
 def mem_list():
     return [0] * 255
+
+
+def mem_bytearray():
+    return bytearray(2**16)
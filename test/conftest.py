@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import contextlib
 import pytest
 
@@ -18,6 +20,9 @@ def pytest_addoption(parser):
 
 def pytest_sessionstart(session):
     os.environ['PIP_NO_INDEX'] = '1'
+    # Keep the per-user caches of asv out of the home directory
+    session.config._asv_cache_home = tempfile.mkdtemp(prefix='asv-test-cache-')
+    os.environ['XDG_CACHE_HOME'] = session.config._asv_cache_home
     _monkeypatch_conda_lock(session.config)
 
     # Unregister unwanted environment types
@@ -29,6 +34,12 @@ def pytest_sessionstart(session):
             cls.matches_python_fallback = (cls.tool_name in (env_type, "existing"))
 
 
+def pytest_sessionfinish(session, exitstatus):
+    cache_home = getattr(session.config, '_asv_cache_home', None)
+    if cache_home is not None:
+        shutil.rmtree(cache_home, ignore_errors=True)
+
+
 def _monkeypatch_conda_lock(config):
     import asv.plugins.conda
     import asv.util
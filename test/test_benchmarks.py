@@ -7,6 +7,7 @@ from __future__ import (absolute_import, division, print_function,
 import os
 import sys
 import shutil
+import itertools
 from os.path import join, dirname
 
 import pytest
@@ -73,7 +74,7 @@ def test_discover_benchmarks(benchmarks_fixture):
     b = benchmarks.Benchmarks.discover(conf, repo, envs, [commit_hash],
                                        regex='example')
     conf.branches = old_branches
-    assert len(b) == 36
+    assert len(b) == 38
 
     b = benchmarks.Benchmarks.discover(conf, repo, envs, [commit_hash],
                               regex='time_example_benchmark_1')
@@ -106,7 +107,7 @@ def test_discover_benchmarks(benchmarks_fixture):
     assert b._benchmark_selection['params_examples.track_param_selection'] == [0, 1, 2, 3]
 
     b = benchmarks.Benchmarks.discover(conf, repo, envs, [commit_hash])
-    assert len(b) == 50
+    assert len(b) == 52
 
     assert 'named.OtherSuite.track_some_func' in b
 
@@ -345,3 +346,55 @@ def test_asv_benchmark_timings():
                      '--setup=import time',
                      'time.sleep(0)'],
                     cwd=os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_peakmem_subtract_baseline():
+    def peakmem_func():
+        # Large enough to be allocated in new pages, returned to the
+        # system when freed, also in a long-running process
+        b'x' * (16 * 2**20)
+
+    bench = benchmark.PeakMemBenchmark('peakmem_func', peakmem_func, [peakmem_func])
+    assert not bench.subtract_baseline
+    assert isinstance(bench.run(), int)
+
+    # Opt-in: the peak above the memory in use before the call
+    peakmem_func.subtract_baseline = True
+    bench = benchmark.PeakMemBenchmark('peakmem_func', peakmem_func, [peakmem_func])
+    assert bench.subtract_baseline
+    result = bench.run()
+    if benchmark.reset_peak_rss():
+        assert result['value'] == result['stats']['peak'] - result['stats']['baseline']
+        assert result['value'] >= 8 * 2**20
+        assert result['stats']['baseline'] > 0
+    else:
+        assert isinstance(result, int)
+
+
+def test_time_benchmark_ci_target():
+    def time_func():
+        pass
+
+    class CyclicTimer(object):
+        def __init__(self, values):
+            self.values = itertools.cycle(values)
+
+        def timeit(self, number):
+            return next(self.values)
+
+    bench = benchmark.TimeBenchmark('time_func', time_func, [time_func])
+
+    def run(values, ci_target):
+        samples, number = bench.benchmark_timing(CyclicTimer(values), min_repeat=1,
+                                                 max_repeat=100, max_time=1e6,
+                                                 warmup_time=0, number=1,
+                                                 min_run_count=0,
+                                                 ci_target=ci_target)
+        return len(samples)
+
+    # Stable timings stop when the 99% CI of the median is narrow
+    # enough, noisy ones continue up to max_repeat
+    assert run([1.0], 0.05) == 8
+    assert run([1.0, 1.01], 0.05) == 8
+    assert run([1.0, 2.0], 0.05) == 100
+    assert run([1.0], 0) == 100
@@ -14,6 +14,7 @@ import pytest
 import six
 
 from asv import config
+from asv import util
 from asv.commands import make_argparser
 
 from . import tools
@@ -121,6 +122,18 @@ def test_run_python_same(capsys, basic_conf):
     assert "Installing" not in text
 
 
+def test_run_option_conflicts(basic_conf):
+    tmpdir, local, conf = basic_conf
+
+    with pytest.raises(util.UserError):
+        tools.run_asv_with_conf(conf, 'run', '--python=same', '--cores=0',
+                                _machine_file=join(tmpdir, 'asv-machine.json'))
+
+    with pytest.raises(util.UserError):
+        tools.run_asv_with_conf(conf, 'run', '--python=same', '--sampler',
+                                _machine_file=join(tmpdir, 'asv-machine.json'))
+
+
 def test_profile_python_same(capsys, basic_conf):
     tmpdir, local, conf = basic_conf
 
@@ -137,6 +150,21 @@ def test_profile_python_same(capsys, basic_conf):
     assert "Installing" not in text
 
 
+def test_profile_sampler_python_same(capsys, basic_conf):
+    tmpdir, local, conf = basic_conf
+
+    # Test the sampling profiler, and flame graph output
+    svg_path = join(tmpdir, 'profile.svg')
+    tools.run_asv_with_conf(conf, 'profile', '--python=same', '--sampler',
+                            '--output', svg_path, "time_secondary.track_value",
+                            _machine_file=join(tmpdir, 'asv-machine.json'))
+
+    with open(svg_path, 'r') as f:
+        svg = f.read()
+    assert svg.startswith('<?xml')
+    assert svg.rstrip().endswith('</svg>')
+
+
 def test_dev_python_arg():
     parser, subparsers = make_argparser()
 
@@ -5,8 +5,15 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import os
+import json
+import math
+import random
 
-from asv.graph import Graph, RESAMPLED_POINTS, make_summary_graph
+from asv.graph import (Graph, GraphSet, RESAMPLED_POINTS, LOD_MAX_POINTS, LOD_FACTOR,
+                       make_summary_graph, _get_steps_batches)
+from asv import steps_cache
+from asv.steps_cache import StepsCache
+from asv import util
 
 
 def test_graph_single():
@@ -221,6 +228,219 @@ def test_graph_steps():
         assert s == steps
 
 
+def test_graph_steps_cache(tmpdir):
+    vals = [(1, 1), (5, 1), (6, 1), (7, 1), (8, 1),
+            (11, 2), (15, 2), (16, 2 + 1e-5), (17, 2), (18, 2)]
+
+    def get_steps(cache, scale=1):
+        g = Graph('foo', {})
+        for x, y in vals:
+            g.add_data_point(x, [y, scale * y])
+        g.detect_steps(cache=cache)
+        return g.get_steps()
+
+    steps = get_steps(None)
+
+    cache = StepsCache(str(tmpdir), 1024**2)
+    assert get_steps(cache) == steps
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache.close()
+
+    # Stored results are reused, also by other graphs with the same data
+    cache = StepsCache(str(tmpdir), 1024**2)
+    assert [[tuple(s) for s in item] for item in get_steps(cache, scale=3)][0] == steps[0]
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    # Least recently used results are removed when over the size limit
+    cache = StepsCache(str(tmpdir), 1)
+    get_steps(cache)
+    assert (cache.hits, cache.misses) == (2, 0)
+    cache.close()
+    cache = StepsCache(str(tmpdir), 1024**2)
+    get_steps(cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache.close()
+
+    # Appended data is solved incrementally
+    vals.append((19, 2))
+    name = Graph('foo', {}).path + ':0'
+    cache = StepsCache(str(tmpdir), 1024**2)
+    assert cache.get_state(name)['state']['n'] == len(vals) - 1
+    assert get_steps(cache) == get_steps(None)
+    assert cache.get_state(name)['state']['n'] == len(vals)
+    cache.close()
+
+
+def test_steps_cache_state_atime(tmpdir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(steps_cache.time, 'time', lambda: now[0])
+
+    cache = StepsCache(str(tmpdir), 1024**2)
+    cache.put_state('a', {'n': 1})
+    now[0] += 1
+    cache.put_state('b', {'n': 1})
+    cache.close()
+
+    # Reading a state marks it as recently used, so that it is kept
+    # over states stored later
+    now[0] += 1
+    size = len(json.dumps({'n': 1}))
+    cache = StepsCache(str(tmpdir), size)
+    assert cache.get_state('a') == {'n': 1}
+    cache.close()
+
+    cache = StepsCache(str(tmpdir), 1024**2)
+    assert cache.get_state('a') == {'n': 1}
+    assert cache.get_state('b') is None
+    cache.close()
+
+
+def test_graph_steps_batched():
+    random.seed(1)
+
+    def get_graphs():
+        graphs = GraphSet()
+        for k in range(20):
+            g = graphs.get_graph('foo', {'k': str(k)})
+            for x in range(random.randint(0, 80)):
+                if random.random() < 0.1:
+                    g.add_data_point(x, None)
+                elif k % 2 == 0:
+                    g.add_data_point(x, [x // 20 + random.random(), None])
+                else:
+                    g.add_data_point(x, x // 30 + random.random(), random.random())
+        return graphs
+
+    state = random.getstate()
+    graphs = get_graphs()
+    dots = []
+    graphs.detect_steps(dots=lambda: dots.append(1))
+    assert len(dots) == 20
+    expected = [graph.get_steps() for path, graph in graphs]
+
+    random.setstate(state)
+    graphs = get_graphs()
+    dots = []
+    pool = util.get_multiprocessing_pool(2)
+    try:
+        graphs.detect_steps(pool, dots=lambda: dots.append(1), n_processes=2)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+    assert len(dots) == 20
+    assert [graph.get_steps() for path, graph in graphs] == expected
+
+
+def test_get_steps_batches():
+    tasks = [(0, 0, [None]*n, None) for n in [100, 10, 10, 50, 50, 10, 10, 10, 10, 5]]
+    batches = _get_steps_batches(tasks, 2)
+    assert sorted(sum(batches, [])) == list(range(len(tasks)))
+    assert batches[0][0] == 0
+
+    # Cost n*log(n) is balanced between the batches
+    costs = [sum(len(tasks[i][2]) * math.log(len(tasks[i][2]) + 1) for i in batch)
+             for batch in batches]
+    assert costs[0] >= costs[1] > 0.75 * costs[0]
+    assert len(_get_steps_batches(tasks, 100)) == len(tasks)
+    assert _get_steps_batches([], 4) == []
+
+
+def test_graph_lod(tmpdir):
+    html_dir = str(tmpdir)
+
+    g = Graph('foo', {})
+    for x in range(LOD_MAX_POINTS):
+        g.add_data_point(x, x)
+    assert g.get_lod_data() is None
+    g.save(html_dir)
+    assert not os.path.isfile(os.path.join(html_dir, g.path + ".lod.json"))
+
+    # Series with missing values
+    n = LOD_MAX_POINTS * LOD_FACTOR**2 + 5
+    g = Graph('foo', {})
+    for x in range(n):
+        g.add_data_point(2*x, [x, None if 100 <= x < 200 else -x])
+
+    lod = g.get_lod_data()
+    assert lod['n'] == n
+    assert lod['max_points'] == LOD_MAX_POINTS
+    assert [level['size'] for level in lod['levels']] == [LOD_FACTOR**k for k in (1, 2, 3)]
+
+    level = lod['levels'][0]
+    size = LOD_FACTOR
+    assert len(level['x']) == (n + size - 1) // size
+    assert level['x'][:2] == [2*(size//2), 2*(size + size//2)]
+    assert level['x'][-1] == 2*(n - 1)
+    assert level['first'][:2] == [0, 2*size]
+    assert level['last'][:2] == [2*(size - 1), 2*(2*size - 1)]
+    assert level['first'][-1] == level['last'][-1] == 2*(n - 1)
+    assert level['min'][0][:2] == [0, size]
+    assert level['max'][0][:2] == [size - 1, 2*size - 1]
+    assert level['mean'][0][1] == size + (size - 1) / 2
+    assert level['min'][1][1] == -(2*size - 1)
+    assert level['mean'][1][100//size] is None
+    assert len(lod['levels'][-1]['x']) <= LOD_MAX_POINTS < len(lod['levels'][-2]['x'])
+
+    # Each level is written in chunks, listed in the index
+    g.save(html_dir)
+    index = util.load_json(os.path.join(html_dir, g.path + ".lod.json"))
+    assert index['n'] == n
+    assert [level['size'] for level in index['levels']] == [1] + [LOD_FACTOR**k
+                                                                 for k in (1, 2, 3)]
+
+    def load_chunks(graph, index, j):
+        return [util.load_json(os.path.join(html_dir, '{0}.lod{1}-{2}.json'.format(
+            graph.path, j, k))) for k in range(len(index['levels'][j]['chunks']))]
+
+    chunks = load_chunks(g, index, 0)
+    assert len(chunks) == (n + LOD_MAX_POINTS - 1) // LOD_MAX_POINTS
+    assert sum(chunks, []) == util.load_json(os.path.join(html_dir, g.path + ".json"))
+    assert index['levels'][0]['chunks'][1] == [2*LOD_MAX_POINTS, 2*(2*LOD_MAX_POINTS - 1),
+                                               LOD_MAX_POINTS]
+
+    for j, level in enumerate(lod['levels'], 1):
+        chunks = load_chunks(g, index, j)
+        assert sum((chunk['x'] for chunk in chunks), []) == level['x']
+        assert sum((chunk['mean'][1] for chunk in chunks), []) == level['mean'][1]
+        assert [[c['first'][0], c['last'][-1], len(c['x'])] for c in chunks] == \
+            index['levels'][j]['chunks']
+
+    # Only small files are needed for a view of all the data
+    def size(ext):
+        return os.path.getsize(os.path.join(html_dir, g.path + ext))
+    coarsest = len(index['levels']) - 1
+    assert len(index['levels'][coarsest]['chunks']) == 1
+    assert size(".lod.json") + size(".lod{0}-0.json".format(coarsest)) < size(".json") / 4
+    for j, level in enumerate(index['levels']):
+        for k in range(len(level['chunks'])):
+            assert size(".lod{0}-{1}.json".format(j, k)) < size(".json") / 4
+
+    # Stale chunks are removed
+    g2 = Graph('foo', {})
+    for x in range(LOD_MAX_POINTS + 1):
+        g2.add_data_point(x, x)
+    g2.save(html_dir)
+    lod_files = sorted(fn for fn in os.listdir(os.path.dirname(
+        os.path.join(html_dir, g.path))) if '.lod' in fn)
+    assert lod_files == ['foo.lod.json', 'foo.lod0-0.json', 'foo.lod0-1.json',
+                         'foo.lod1-0.json']
+
+    Graph.remove_files(html_dir, g2.path)
+    assert os.listdir(os.path.dirname(os.path.join(html_dir, g.path))) == []
+
+    # Scalar series
+    g = Graph('bar', {})
+    for x in range(LOD_MAX_POINTS + 1):
+        g.add_data_point(x, 1.0)
+    lod = g.get_lod_data()
+    assert len(lod['levels']) == 1
+    assert lod['levels'][0]['mean'][:2] == [1.0, 1.0]
+    files = dict(g.get_lod_files())
+    assert files['.lod1-0.json']['mean'] == lod['levels'][0]['mean']
+
+
 def test_graph_filename_sanitization():
     g = Graph('hello:world', {'a/a': 'b>b', 'c*c': 'd\0\0d'})
     assert g.path == os.path.join('graphs', 'a_a-b_b', 'c_c-d__d', 'hello_world')
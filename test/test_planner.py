@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from asv import results, runner
+from asv.planner import DurationHistory, TimeBudgetPlan
+
+
+BENCHMARKS = {
+    'stable': {'name': 'stable', 'version': '1', 'params': [], 'timeout': 60},
+    'noisy': {'name': 'noisy', 'version': '1', 'params': [], 'timeout': 60},
+    'cached': {'name': 'cached', 'version': '1', 'params': [], 'timeout': 60,
+               'setup_cache_key': 'cached:1'},
+    'new': {'name': 'new', 'version': '1', 'params': [], 'timeout': 60},
+}
+
+
+def make_result(commit_hash, date, env_name='env'):
+    r = results.Results({'machine': 'foo'}, {}, commit_hash, date, '3.7', env_name, {})
+
+    samples = {'stable': [1.0] * 20,
+               'noisy': [1.0, 3.0] * 10,
+               'cached': [1.0] * 20}
+    durations = {'stable': 10.0, 'noisy': 20.0, 'cached': 30.0}
+
+    for name, values in samples.items():
+        v = runner.BenchmarkResult(result=[1.0], samples=[values], number=[1],
+                                   profile=None, errcode=0, stderr='')
+        r.add_result(BENCHMARKS[name], v, duration=durations[name])
+
+    r.set_build_duration(5.0)
+    r.set_setup_cache_duration('cached:1', 15.0)
+    return r
+
+
+def test_duration_history():
+    history = DurationHistory([make_result('a', 1), make_result('b', 2)], BENCHMARKS)
+
+    assert history.get_duration('env', 'stable') == 10.0
+    assert history.get_duration('env', '<build>') == 5.0
+    assert history.get_duration('env', '<setup_cache cached:1>') == 15.0
+    assert history.get_duration('env', 'new') is None
+    assert history.get_duration('other-env', 'stable') is None
+
+    assert history.get_instability('env', 'stable') == 0
+    assert history.get_instability('env', 'noisy') > 0
+    assert history.get_instability('env', 'new') == 0
+
+
+def test_time_budget_plan():
+    history = DurationHistory([make_result('a', 1)], BENCHMARKS)
+
+    # Unknown benchmarks are assumed to take the median duration
+    plan = TimeBudgetPlan(1e6, ['c2', 'c1'], ['env'], BENCHMARKS, history)
+    assert plan.expected_durations['env'] == {'stable': 10.0, 'noisy': 20.0,
+                                              'cached': 30.0, 'new': 20.0}
+    assert plan.num_selected == 8
+    assert plan.predicted == 2 * (5 + 15 + 10 + 20 + 30 + 20)
+
+    # Newest commit first, least stable benchmark first; jobs that
+    # don't fit are skipped, but smaller ones may still be selected
+    plan = TimeBudgetPlan(85, ['c2', 'c1'], ['env'], BENCHMARKS, history)
+    assert plan.selected == {('c2', 'env'): set(['noisy', 'cached', 'stable'])}
+    assert plan.is_selected('c2', 'env', 'noisy')
+    assert not plan.is_selected('c2', 'env', 'new')
+    assert not plan.is_selected('c1', 'env', 'noisy')
+    assert plan.predicted == 5 + 20 + (15 + 30) + 10
+
+    # Already skipped benchmarks are not planned
+    plan = TimeBudgetPlan(100, ['c2'], ['env'], BENCHMARKS, history,
+                          skip={('c2', 'env'): set(['noisy', 'new', 'stable'])})
+    assert plan.selected == {('c2', 'env'): set(['cached'])}
+    assert plan.predicted == 5 + 15 + 30
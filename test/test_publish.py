@@ -5,6 +5,8 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import datetime
+import glob
+import json
 import os
 from os.path import abspath, dirname, join, isfile, isdir
 import shutil
@@ -20,7 +22,12 @@ except ImportError:
 
 from asv import config
 from asv import util
+from asv import step_detect
+from asv.commands import publish
+from asv.commands.publish import MANIFEST_FILENAME, PublishManifest
+from asv.graph import Graph
 from asv.repo import get_repo
+from asv.results import Results
 
 
 from . import tools
@@ -148,6 +155,9 @@ def test_publish(tmpdir):
     for item in expected_graph_list:
         assert item in index['graph_param_list']
 
+    # The graphs are too small for reduced resolution data
+    assert index['graph_lod'] == []
+
 
 @pytest.fixture(params=[
     "git",
@@ -191,6 +201,182 @@ def test_publish_range_spec(generate_result_dir):
         assert set(data['revision_to_hash'].values()) == expected
 
 
+def test_publish_incremental(generate_result_dir, monkeypatch):
+    conf, repo, commits = generate_result_dir(5 * [1] + 5 * [10])
+    graph_fn = join(conf.html_dir, _graph_path(repo.dvcs))
+
+    # Without a previous publish, everything is published
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    regressions = util.load_json(join(conf.html_dir, "regressions.json"))
+    assert regressions['regressions'][0][4:6] == [10.0, 1.0]
+    # The manifest is not published
+    assert not isfile(join(conf.html_dir, MANIFEST_FILENAME))
+    assert isfile(PublishManifest.get_path(conf.html_dir))
+    graph_stat = os.stat(graph_fn)
+
+    # Nothing changed: no results loaded (except headers), and no
+    # graphs written
+    orig_load = Results.load
+
+    def no_load(*args, **kwargs):
+        if kwargs.get('lazy'):
+            return orig_load(*args, **kwargs)
+        raise AssertionError("results loaded")
+
+    with monkeypatch.context() as m:
+        m.setattr(Results, 'load', no_load)
+        m.setattr(Graph, 'save', no_load)
+        m.setattr(step_detect, 'detect_steps', no_load)
+        m.setattr(step_detect, 'detect_steps_incremental', no_load)
+        tools.run_asv_with_conf(conf, "publish", "--incremental")
+    assert util.load_json(join(conf.html_dir, "regressions.json")) == regressions
+    assert os.stat(graph_fn).st_mtime == graph_stat.st_mtime
+
+    # New results: same output as a full publish
+    machine_dir = join(conf.results_dir, 'tarzan')
+    for commit in commits[-3:]:
+        fn, = [fn for fn in os.listdir(machine_dir) if fn.startswith(commit[:8])]
+        path = join(machine_dir, fn)
+        data = util.load_json(path, api_version=1)
+        data['results']['time_func'] = 1
+        util.write_json(path, data, api_version=1)
+
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    incremental = [util.load_json(join(conf.html_dir, fn))
+                   for fn in ("regressions.json", _graph_path(repo.dvcs))]
+    tools.run_asv_with_conf(conf, "publish")
+    full = [util.load_json(join(conf.html_dir, fn))
+            for fn in ("regressions.json", _graph_path(repo.dvcs))]
+    assert incremental == full
+    assert incremental[0] != regressions
+
+
+def test_publish_incremental_removed_graph(generate_result_dir):
+    conf, repo, commits = generate_result_dir(5 * [1] + 5 * [10])
+    machine_dir = join(conf.results_dir, 'tarzan')
+    summary_path = join('graphs', 'summary', 'time_func.json')
+
+    # Results in two configurations, the second for a single commit
+    for fn in os.listdir(machine_dir):
+        if fn != 'machine.json':
+            path = join(machine_dir, fn)
+            data = util.load_json(path, api_version=1)
+            data['params']['cpu'] = 'fast'
+            util.write_json(path, data, api_version=1)
+            if fn.startswith(commits[-1][:8]):
+                data['params']['cpu'] = 'slow'
+                data['results']['time_func'] = 100
+                extra_path = join(machine_dir, 'extra.json')
+                util.write_json(extra_path, data, api_version=1)
+
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    slow_graph, = glob.glob(join(conf.html_dir, 'graphs', '*', 'cpu-slow', '*', 'time_func.json'))
+    summary = util.load_json(join(conf.html_dir, summary_path))
+
+    # The remaining graph is unchanged, but the summary is not
+    os.remove(extra_path)
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    assert not isfile(slow_graph)
+    incremental = util.load_json(join(conf.html_dir, summary_path))
+    assert incremental != summary
+    tools.run_asv_with_conf(conf, "publish")
+    assert util.load_json(join(conf.html_dir, summary_path)) == incremental
+
+    # A missing summary is regenerated
+    os.remove(join(conf.html_dir, summary_path))
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    assert util.load_json(join(conf.html_dir, summary_path)) == incremental
+
+
+def test_publish_graph_packs(generate_result_dir):
+    conf, repo, commits = generate_result_dir(5 * [1] + 5 * [10])
+    graph_path = _graph_path(repo.dvcs)
+    tools.run_asv_with_conf(conf, "publish")
+    expected = util.load_json(join(conf.html_dir, graph_path))
+
+    def get_pack_data(path):
+        pack_fn = join(conf.html_dir, 'graph_packs', 'time_func')
+        pack_index = util.load_json(pack_fn + '.index.json')
+        offset, length = pack_index[path.replace(os.sep, '/')]
+        with open(pack_fn + '.pack', 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length).decode('ascii'))
+
+    conf.graph_packs = True
+    tools.run_asv_with_conf(conf, "publish")
+    assert util.load_json(join(conf.html_dir, 'index.json'))['graph_packs']
+    assert not isdir(join(conf.html_dir, 'graphs'))
+    assert get_pack_data(graph_path) == expected
+    assert get_pack_data(join('graphs', 'summary', 'time_func.json'))
+
+    # The packs are served with range requests
+    pack_index = util.load_json(join(conf.html_dir, 'graph_packs', 'time_func.index.json'))
+    offset, length = pack_index[graph_path.replace(os.sep, '/')]
+    with tools.preview(conf.html_dir) as base_url:
+        request = six.moves.urllib.request.Request(
+            base_url + 'graph_packs/time_func.pack',
+            headers={'Range': 'bytes={0}-{1}'.format(offset, offset + length - 1)})
+        response = six.moves.urllib.request.urlopen(request)
+        assert response.getcode() == 206
+        assert json.loads(response.read().decode('ascii')) == expected
+
+    # Changed results update the pack
+    machine_dir = join(conf.results_dir, 'tarzan')
+    for commit in commits[-3:]:
+        fn, = [fn for fn in os.listdir(machine_dir) if fn.startswith(commit[:8])]
+        path = join(machine_dir, fn)
+        data = util.load_json(path, api_version=1)
+        data['results']['time_func'] = 1
+        util.write_json(path, data, api_version=1)
+
+    tools.run_asv_with_conf(conf, "publish", "--incremental")
+    incremental = get_pack_data(graph_path)
+    assert incremental != expected
+    tools.run_asv_with_conf(conf, "publish")
+    assert get_pack_data(graph_path) == incremental
+
+
+def test_results_table(tmpdir, monkeypatch):
+    result_dir = join(six.text_type(tmpdir), 'results')
+    shutil.copytree(RESULT_DIR, result_dir)
+    benchmarks = util.load_json(join(result_dir, 'benchmarks.json'), api_version=2)
+
+    tables = []
+    for min_files in [1, 1000]:
+        # Load in parallel and serially
+        monkeypatch.setattr(publish, 'PARALLEL_LOAD_MIN_FILES', min_files)
+        manifest = publish.PublishManifest('key')
+        table = publish.ResultsTable()
+        for entry in manifest.iter_entries(result_dir, benchmarks):
+            table.add_entry(entry)
+        tables.append(table)
+
+    # No processes are started with parallel=1
+    def no_pool(*args, **kwargs):
+        raise AssertionError("pool created")
+    monkeypatch.setattr(publish, 'PARALLEL_LOAD_MIN_FILES', 1)
+    monkeypatch.setattr(util, 'get_multiprocessing_pool', no_pool)
+    manifest = publish.PublishManifest('key')
+    table = publish.ResultsTable()
+    for entry in manifest.iter_entries(result_dir, benchmarks, parallel=1):
+        table.add_entry(entry)
+    tables.append(table)
+
+    table = tables[0]
+    for other in tables[1:]:
+        assert (json.dumps(table.__dict__, sort_keys=True) ==
+                json.dumps(other.__dict__, sort_keys=True))
+    assert len(table) > 0
+    assert len(set(table.commit_hashes)) == len(table.commit_hashes)
+    assert len(table.param_sets) < len(table.commit_hashes)
+
+    # The columns have one entry per row
+    for column in (table.benchmark, table.param_set, table.commit, table.value,
+                   table.weight, table.started_at):
+        assert len(column) == len(table)
+    assert set(table.benchmark) <= set(benchmarks)
+
+
 def test_regression_simple(generate_result_dir):
     conf, repo, commits = generate_result_dir(5 * [1] + 5 * [10])
     tools.run_asv_with_conf(conf, "publish")
@@ -317,6 +317,47 @@ def test_get_new_branch_commits(two_branch_repo_case, existing, expected):
     assert commits == expected
 
 
+def test_commit_cache(two_branch_repo_case):
+    dvcs, master, r, conf = two_branch_repo_case
+
+    tip = dvcs.get_hash(master)
+    dvcs.tag(1)
+
+    r = repo.get_repo(conf)
+    master_commits = r.get_branch_commits(master)
+    stable_commits = r.get_branch_commits("stable")
+    all_commits = set(master_commits + stable_commits)
+
+    assert r.get_tags() == {"tag1": tip}
+    assert r.get_date_from_name("tag1") == r.get_date(tip)
+
+    dates = [r.get_date(commit) for commit in master_commits]
+    assert dates == sorted(dates)[::-1]
+
+    revisions = r.get_revisions(all_commits)
+    assert sorted(revisions) == sorted(all_commits)
+    assert sorted(revisions.values()) == list(range(len(all_commits)))
+
+    spec = r.get_range_spec(master_commits[2], master_commits[0])
+    assert r.get_hashes_from_range(spec) == master_commits[:2]
+
+    # The cache is stored in the repository and extended with new commits
+    meta_dir = ".git" if r.dvcs == "git" else ".hg"
+    assert os.path.isfile(join(dvcs.path, meta_dir, "asv-commit-cache.json"))
+
+    with open(join(dvcs.path, "new_file"), "w") as f:
+        f.write("new")
+    dvcs.add(join(dvcs.path, "new_file"))
+    dvcs.commit("Revision 7")
+
+    r = repo.get_repo(conf)
+    new_commits = r.get_branch_commits(master)
+    assert new_commits[1:] == master_commits
+    assert dvcs.get_commit_message(new_commits[0]) == "Revision 7"
+    assert r.get_date(new_commits[0]) >= dates[0]
+    assert sorted(r.get_revisions(all_commits).values()) == sorted(revisions.values())
+
+
 def test_git_submodule(tmpdir):
     tmpdir = six.text_type(tmpdir)
 
@@ -5,13 +5,16 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import os
+import base64
+import zlib
+import hashlib
 import datetime
 import shutil
 from os.path import join
 
 import six
 
-from asv import results, runner, util
+from asv import results, results_catalog, runner, util
 import pytest
 
 
@@ -109,6 +112,12 @@ def test_results(tmpdir):
             # Get profile
             assert r2.get_profile(bench) == b'\x00\xff'
 
+        # Profiles are stored outside the results file
+        assert 'profiles' not in util.load_json(join(resultsdir, r._filename))
+        profile_hash = r2._profiles['suite1.benchmark1']
+        assert os.path.isfile(results.get_profile_path(join(resultsdir, 'foo'),
+                                                       profile_hash))
+
         # Check get_result_keys
         mock_benchmarks = {
             'suite1.benchmark1': {'version': '1'},
@@ -153,6 +162,253 @@ def test_backward_compat_load():
     assert r._env_name == 'py2.7-Cython-numpy1.8'
 
 
+def test_inline_profile_compat(tmpdir):
+    # Profiles stored inline by older versions are moved to the
+    # profile store on save
+    tmpdir = six.text_type(tmpdir)
+
+    r = results.Results({'machine': 'mach'}, {}, 'aaaa', 0, 'py', 'env', {})
+    r.save(tmpdir)
+
+    path = join(tmpdir, 'mach', 'aaaa-env.json')
+    data = util.load_json(path)
+    data['results'] = {'some_benchmark': 42}
+    data['profiles'] = {'some_benchmark': base64.b64encode(
+        zlib.compress(b'\x00\xff')).decode('ascii')}
+    del data['profile_hashes']
+    util.write_json(path, data, results.Results.api_version)
+
+    r = results.Results.load(path)
+    assert r.get_profile('some_benchmark') == b'\x00\xff'
+    r.save(tmpdir)
+
+    data = util.load_json(path)
+    assert 'profiles' not in data
+    r = results.Results.load(path)
+    assert r.get_profile('some_benchmark') == b'\x00\xff'
+
+
+def test_profile_format(tmpdir):
+    tmpdir = six.text_type(tmpdir)
+
+    r = results.Results({'machine': 'mach'}, {}, 'aaaa', 0, 'py', 'env', {})
+    value = runner.BenchmarkResult(result=[42], samples=[None], number=[None],
+                                   errcode=0, stderr='', profile=b'a;b 1\n',
+                                   profile_format='collapsed')
+    benchmark = {'name': 'some_benchmark', 'version': None, 'params': []}
+    r.add_result(benchmark, value)
+    r.save(tmpdir)
+
+    r = results.Results.load(join(tmpdir, 'mach', 'aaaa-env.json'))
+    assert r.get_profile_format('some_benchmark') == 'collapsed'
+    assert r.get_profile('some_benchmark') == b'a;b 1\n'
+
+
+def test_sweep_profiles(tmpdir, monkeypatch):
+    tmpdir = six.text_type(tmpdir)
+    machine_dir = join(tmpdir, 'mach')
+    os.makedirs(machine_dir)
+    util.write_json(join(machine_dir, 'machine.json'), {'machine': 'mach'},
+                    api_version=1)
+
+    def add(r, name, profile):
+        value = runner.BenchmarkResult(result=[1], samples=[None], number=[None],
+                                       errcode=0, stderr='', profile=profile)
+        r.add_result({'name': name, 'version': None, 'params': []}, value)
+
+    def stored():
+        return set(os.listdir(join(machine_dir, results.PROFILE_DIR_NAME)))
+
+    # Two files sharing a profile
+    r1 = results.Results({'machine': 'mach'}, {}, 'aaaa', 0, 'py', 'env', {})
+    r2 = results.Results({'machine': 'mach'}, {}, 'bbbb', 0, 'py', 'env', {})
+    add(r1, 'bench1', b'shared')
+    add(r1, 'bench2', b'old')
+    add(r2, 'bench1', b'shared')
+    r1.save(tmpdir)
+    r2.save(tmpdir)
+
+    h = dict((x, hashlib.sha256(x).hexdigest() + '.pstats.z')
+             for x in (b'shared', b'old', b'new'))
+    assert stored() == set(h[x] for x in (b'shared', b'old'))
+    assert results.sweep_profiles(machine_dir) == []
+
+    # Replaced profiles are removed on save, without loading the
+    # results files already in the catalog
+    loaded = []
+    orig_load = results.Results.load.__func__
+
+    def load(cls, path, *args, **kwargs):
+        loaded.append(path)
+        return orig_load(cls, path, *args, **kwargs)
+    monkeypatch.setattr(results.Results, 'load', classmethod(load))
+
+    add(r1, 'bench2', b'new')
+    r1.save(tmpdir)
+    assert stored() == set(h[x] for x in (b'shared', b'new'))
+    assert loaded == []
+    monkeypatch.undo()
+
+    # Profiles still referenced by another file are kept
+    r1.remove_result('bench1')
+    r1.save(tmpdir)
+    assert stored() == set(h[x] for x in (b'shared', b'new'))
+
+    # Unreferenced profiles left by removed files
+    r1.rm(tmpdir)
+    assert results.sweep_profiles(machine_dir) == [
+        join(machine_dir, results.PROFILE_DIR_NAME, h[b'new'])]
+    assert stored() == set([h[b'shared']])
+
+    # Profiles referenced only from the journal of a run in progress
+    r3 = results.Results({'machine': 'mach'}, {}, 'cccc', 0, 'py', 'env', {})
+    r3.open_journal(tmpdir)
+    add(r3, 'bench1', b'new')
+    assert results.sweep_profiles(machine_dir) == []
+    r3.close_journal()
+    assert stored() == set(h[x] for x in (b'shared', b'new'))
+
+
+def test_lazy_load(tmpdir, monkeypatch):
+    tmpdir = six.text_type(tmpdir)
+
+    # Small reads, to check parsing across read boundaries
+    monkeypatch.setattr(results, '_HEADER_CHUNK_SIZE', 7)
+
+    r = results.Results({'machine': 'mach', 'cpu': 'fast'}, {'six': ''}, 'aaaa',
+                        1234567, 'py', 'env', {'FOO': 'bar'})
+    for j in range(3):
+        value = runner.BenchmarkResult(result=[j * 1.5], samples=[[1.25] * 100],
+                                       number=[10], errcode=0, stderr='', profile=None)
+        benchmark = {'name': 'bench{0}'.format(j), 'version': '1', 'params': []}
+        r.add_result(benchmark, value, record_samples=True,
+                     started_at=datetime.datetime(1971, 1, 1), duration=1.5)
+    r.save(tmpdir)
+    path = join(tmpdir, 'mach', 'aaaa-env.json')
+
+    r2 = results.Results.load(path, machine_name='mach', lazy=True)
+    assert '_results' not in r2.__dict__
+    assert r2.commit_hash == 'aaaa'
+    assert r2.date == 1234567
+    assert r2.params == r.params
+    assert r2.env_name == 'env'
+    assert r2.env_vars == {'FOO': 'bar'}
+    assert r2.started_at == r.started_at
+    assert '_results' not in r2.__dict__
+
+    # Results decoded on first access
+    assert sorted(r2.get_all_result_keys()) == ['bench0', 'bench1', 'bench2']
+    assert r2._results == r._results
+    assert r2._samples == r._samples
+    assert r2._stats == r._stats
+
+    # Files not written with the results last are loaded in full
+    util.write_json(path, util.load_json(path), results.Results.api_version)
+    r3 = results.Results.load(path, lazy=True)
+    assert '_results' in r3.__dict__
+    assert r3._results == r._results
+    assert r3.started_at == r.started_at
+
+
+def test_parse_results_header_errors():
+    with pytest.raises(ValueError) as excinfo:
+        results._parse_results_header('  ["results"]')
+    assert str(excinfo.value) == "expected '{' at position 2"
+
+    with pytest.raises(ValueError) as excinfo:
+        results._parse_results_header('{"a" 1}')
+    assert str(excinfo.value) == "expected ':' at position 5"
+
+
+def test_samples_format(tmpdir):
+    tmpdir = six.text_type(tmpdir)
+
+    r = results.Results({'machine': 'mach'}, {}, 'aaaa', 0, 'py', 'env', {})
+    samples = [[0.5, 1e-300, float('inf'), -2.25], None, [3.0]]
+    value = runner.BenchmarkResult(result=[1.0, None, 3.0], samples=samples,
+                                   number=[1, None, 1], errcode=0, stderr='',
+                                   profile=None)
+    benchmark = {'name': 'bench', 'version': None, 'params': [['1', '2', '3']]}
+    r.add_result(benchmark, value, record_samples=True)
+    r.save(tmpdir, samples_format='binary')
+
+    path = join(tmpdir, 'mach', 'aaaa-env.json')
+    data = util.load_json(path)
+    assert data['samples_format'] == 'binary'
+    assert isinstance(data['results']['bench']['samples'][0], six.string_types)
+    assert data['results']['bench']['samples'][1] is None
+
+    r2 = results.Results.load(path)
+    got = r2.get_result_samples('bench', benchmark['params'])
+    assert [list(x) if x is not None else None for x in got] == samples
+
+    # The format is kept when saving again, unless changed
+    r2.save(tmpdir)
+    assert util.load_json(path)['samples_format'] == 'binary'
+    r2.save(tmpdir, samples_format='json')
+    data = util.load_json(path)
+    assert 'samples_format' not in data
+    assert data['results']['bench']['samples'] == samples
+
+    with pytest.raises(ValueError):
+        r2.save(tmpdir, samples_format='unknown')
+
+
+def test_journal(tmpdir):
+    tmpdir = six.text_type(tmpdir)
+    os.makedirs(join(tmpdir, 'mach'))
+    util.write_json(join(tmpdir, 'mach', 'machine.json'), {'machine': 'mach'},
+                    api_version=1)
+    path = join(tmpdir, 'mach', 'aaaa-env.json')
+    journal_path = path + results.JOURNAL_SUFFIX
+
+    r = results.Results({'machine': 'mach'}, {}, 'aaaa', 0, 'py', 'env', {})
+    r.open_journal(tmpdir)
+    assert os.path.isfile(path)
+    assert os.path.isfile(journal_path)
+
+    # The results file is marked as incomplete until saved
+    assert util.load_json(path)['incomplete'] is True
+    assert not r.incomplete
+
+    r.set_build_duration(2.5)
+    for j in range(2):
+        value = runner.BenchmarkResult(result=[j], samples=[[j, j]], number=[1],
+                                       errcode=0, stderr='', profile=b'\x00\xff')
+        benchmark = {'name': 'bench{0}'.format(j), 'version': '1', 'params': []}
+        r.add_result(benchmark, value, record_samples=True, duration=1.5,
+                     started_at=datetime.datetime(1971, 1, 1))
+
+    # Interrupted run: the results are loaded from the journal, except
+    # for incomplete entries
+    with open(journal_path, 'ab') as f:
+        f.write(b'{"key": "bench2", "res')
+
+    r2 = results.Results.load(path, lazy=True)
+    assert r2.incomplete
+    assert sorted(r2.get_all_result_keys()) == ['bench0', 'bench1']
+    assert r2._results == r._results
+    assert r2._samples == r._samples
+    assert r2.duration == r.duration
+    assert r2.get_profile('bench1') == b'\x00\xff'
+
+    infos = [info for _, _, _, info in results.iter_results_info(tmpdir, details=True)]
+    if infos[0] is not None:
+        assert infos[0]['benchmarks'] == ['bench0', 'bench1']
+
+    # Saving merges the journal into the results file
+    r.save(tmpdir)
+    assert not os.path.exists(journal_path)
+    r.set_build_duration(5)
+    assert not os.path.exists(journal_path)
+
+    r2 = results.Results.load(path)
+    assert not r2.incomplete
+    assert 'incomplete' not in util.load_json(path)
+    assert r2._results == r._results
+    assert r2.duration['<build>'] == 2.5
+
+
 def test_json_timestamp(tmpdir):
     # Check that per-benchmark timestamps are saved as JS timestamps in the result file
     tmpdir = six.text_type(tmpdir)
@@ -216,6 +472,65 @@ def test_iter_results(capsys, tmpdir):
     assert "machine.json" in out
 
 
+def test_results_catalog(tmpdir, monkeypatch):
+    src = os.path.join(os.path.dirname(__file__), 'example_results')
+    dst = os.path.join(six.text_type(tmpdir), 'example_results')
+    shutil.copytree(src, dst)
+
+    expected = set(r.commit_hash for r in results.iter_results(dst))
+    assert len(expected) > 1
+
+    # The catalog is kept out of the results directory
+    assert not any(results_catalog.CATALOG_FILENAME in files
+                   for _, _, files in os.walk(dst))
+    assert os.path.isfile(util.get_user_cache_path(dst, results_catalog.CATALOG_FILENAME))
+
+    # Lookups are served from the catalog, without loading files
+    def no_load(*a, **kw):
+        raise AssertionError("results file loaded")
+    monkeypatch.setattr(results.Results, 'load', no_load)
+    assert set(results.get_existing_hashes(dst)) == expected
+    assert results.get_result_hash_from_prefix(dst, 'cheetah', '624da0') == '624da0aa'
+    monkeypatch.undo()
+
+    # Files changed, added and removed behind its back are picked up
+    path = join(dst, 'cheetah', '624da0aa-py2.7-Cython-numpy1.8.json')
+    r = results.Results.load(path)
+    old_hash = r.commit_hash
+    r._commit_hash = 'f' * 40
+    r._filename = results.get_filename('cheetah', r._commit_hash, r.env_name)
+    r.save(dst)
+    os.remove(path)
+    hashes = set(results.get_existing_hashes(dst))
+    assert hashes == (expected - set([old_hash])) | set(['f' * 40])
+
+    def listed(machine_dir=None):
+        return set(filename for _, filename, _, _
+                   in results.iter_results_info(dst, machine_dir))
+
+    files = set(fn for fn in os.listdir(join(dst, 'cheetah'))
+                if fn.endswith('.json') and fn not in ('machine.json', 'benchmarks.json'))
+    assert r._filename.split(os.sep)[-1] in files
+    assert '624da0aa-py2.7-Cython-numpy1.8.json' not in files
+    assert listed() == files
+
+    # Results.rm updates the catalog
+    r.rm(dst)
+    assert set(results.get_existing_hashes(dst)) == hashes - set(['f' * 40])
+
+    # Updates restricted to a machine directory see only its files
+    os.makedirs(join(dst, 'other'))
+    shutil.copyfile(join(dst, 'cheetah', 'machine.json'), join(dst, 'other', 'machine.json'))
+    shutil.copyfile(join(dst, 'cheetah', '05d283b9-py2.7-Cython-numpy1.8.json'),
+                    join(dst, 'other', 'x.json'))
+    files.remove(r._filename.split(os.sep)[-1])
+    assert listed('cheetah') == files
+    with results_catalog.ResultsCatalog.open(dst) as catalog:
+        assert set(fn for _, fn, _ in catalog.iter_files()) == files
+    assert listed('other') == set(['x.json'])
+    assert listed() == files | set(['x.json'])
+
+
 def test_filename_format():
     r = results.Results({'machine': 'foo'}, [], "commit", 0, "", "env", {})
     assert r._filename == join("foo", "commit-env.json")
@@ -60,6 +60,31 @@ def test_set_commit_hash(capsys, existing_env_conf):
     assert times.commit_hash == commit_hash
 
 
+def test_run_time_budget(capsys, existing_env_conf):
+    tmpdir, local, conf, machine_file = existing_env_conf
+
+    r = repo.get_repo(conf)
+    commit_hash = r.get_hash_from_name(r.get_branch_name())
+
+    # Without previous results, benchmarks are assumed to take their
+    # timeout (60 s), so only one fits
+    tools.run_asv_with_conf(conf, 'run', '--set-commit-hash=' + commit_hash,
+                            '--time-budget=90s', '--quick',
+                            '--bench=time_secondary.track_value',
+                            '--bench=time_secondary.track_environment_value',
+                            _machine_file=join(tmpdir, 'asv-machine.json'))
+
+    text, err = capsys.readouterr()
+    assert "selected 1 of 2 benchmark runs" in text
+    assert "predicted 1.00m, actual" in text
+
+    env_name = list(environment.get_environments(conf, None))[0].name
+    result_filename = commit_hash[:conf.hash_length] + '-' + env_name + '.json'
+    result_path = join('results_workflow', 'orangutan', result_filename)
+    times = results.Results.load(result_path)
+    assert len(list(times.get_all_result_keys())) == 1
+
+
 def test_run_spec(basic_conf):
     tmpdir, local, conf, machine_file = basic_conf
     conf.build_cache_size = 5
@@ -12,6 +12,7 @@ import pstats
 import collections
 import socket
 import json
+import textwrap
 
 import six
 import pytest
@@ -23,6 +24,7 @@ from asv import config
 from asv import environment
 from asv import runner
 from asv import util
+from asv import setup_cache_store
 from asv.results import Results
 
 from .test_benchmarks import benchmarks_fixture, ASV_CONF_JSON, BENCHMARK_DIR
@@ -107,6 +109,8 @@ def test_run_benchmarks(benchmarks_fixture, tmpdir):
         # is CPython-only
         assert times[
             'mem_examples.mem_list'].result[0] > 1000
+        assert 2**16 <= times[
+            'mem_examples.mem_bytearray'].result[0] < 2**16 + 1000
     assert times[
         'time_secondary.track_value'].result == [42.0]
     assert times['time_secondary.track_value'].profile is not None
@@ -138,6 +142,15 @@ def test_run_benchmarks(benchmarks_fixture, tmpdir):
 
     assert times['peakmem_examples.peakmem_list'].result[0] >= 4 * 2**20
 
+    if sys.version_info[:2] >= (3, 4) and not ON_PYPY:
+        alloc_result = times['alloc_examples.alloc_list']
+        assert alloc_result.result[0] >= 4 * 2**20
+        alloc_stats = alloc_result.stats[0]
+        assert alloc_stats['peak'] == alloc_result.result[0]
+        assert 10 <= alloc_stats['blocks'] < 100
+        assert 0 < alloc_stats['size'] < 2**20
+        assert any(fn.endswith('alloc_examples.py') for fn in alloc_stats['by_file'])
+
     assert times['cache_examples.ClassLevelSetup.track_example'].result == [500]
     assert times['cache_examples.ClassLevelSetup.track_example2'].result == [500]
 
@@ -271,6 +284,50 @@ def test_forkserver(tmpdir):
     assert len(data['samples']) >= 1
 
 
+@pytest.mark.skipif(not (hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')),
+                    reason="test requires fork and unix sockets")
+def test_forkserver_pipelined(tmpdir):
+    tmpdir = six.text_type(tmpdir)
+    os.chdir(tmpdir)
+
+    shutil.copytree(BENCHMARK_DIR, 'benchmark')
+
+    d = {}
+    d.update(ASV_CONF_JSON)
+    d['env_dir'] = "env"
+    d['benchmark_dir'] = 'benchmark'
+    d['repo'] = 'None'
+    conf = config.Config.from_json(d)
+
+    env = environment.ExistingEnvironment(conf, sys.executable, {}, {})
+    spawner = runner.ForkServer(env, os.path.abspath('benchmark'))
+    spawner.pipeline_depth = 3
+
+    names = ['time_secondary.track_value',
+             'time_secondary.TimeSecondary.time_exception',
+             'time_secondary.track_fail_errcode_123',
+             'params_examples.ParamSuite.track_value-1'] * 2
+    jobs = [dict(name=name, params_str='{}', profile_path='None',
+                 timeout=60, cwd=os.getcwd())
+            for name in names]
+
+    try:
+        outputs = spawner.run_many(jobs)
+    finally:
+        spawner.close()
+
+    assert len(outputs) == len(names)
+    for k in (0, 4):
+        assert outputs[k + 0] == ('', 0, '42.0')
+        assert outputs[k + 1][1] == 1
+        assert 'RuntimeError' in outputs[k + 1][0]
+        assert outputs[k + 1][2] is None
+        assert outputs[k + 2][1] == 123
+        assert outputs[k + 3] == ('', 0, '2')
+
+    assert spawner.dispatch_count == len(names)
+
+
 needs_unix_socket_mark = pytest.mark.skipif(
     not (hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')),
     reason="test requires fork and unix sockets")
@@ -450,3 +507,192 @@ def test_timeraw_benchmark(benchmarks_fixture):
     assert times['timeraw_examples.TimerawSuite.timeraw_setup'].result is not None
     assert 'timed out' in times['timeraw_examples.TimerawSuite.timeraw_timeout'].stderr
     assert '0' * 7 * 3 in times['timeraw_examples.TimerawSuite.timeraw_count'].stderr
+
+
+@pytest.mark.skipif(len(util.get_available_cpus()) < 2,
+                    reason="test requires at least 2 CPUs")
+def test_run_benchmarks_parallel(benchmarks_fixture):
+    conf, repo, envs, commit_hash = benchmarks_fixture
+
+    b = benchmarks.Benchmarks.discover(conf, repo, envs, [commit_hash],
+                                       regex=['cache_examples.(ClassLevelSetup|track_)',
+                                              'time_secondary.track_value',
+                                              'params_examples.track_param'])
+    cores = util.get_available_cpus()[:2]
+
+    results = runner.run_benchmarks(b, envs[0], show_stderr=True,
+                                    benchmark_workers=2, cores=cores)
+    times = ResultsWrapper(results, b)
+
+    assert times['cache_examples.ClassLevelSetup.track_example'].result == [500]
+    assert times['cache_examples.ClassLevelSetup.track_example2'].result == [500]
+    assert times['cache_examples.track_cache_foo'].result == [42]
+    assert times['cache_examples.track_cache_bar'].result == [12]
+    assert times['cache_examples.track_my_cache_foo'].result == [0]
+    assert times['time_secondary.track_value'].result == [42.0]
+    assert times['params_examples.track_param'].result == [42, 42]
+
+    # Each benchmark ran pinned to a single worker's CPU, and
+    # benchmarks sharing a setup_cache in the same worker
+    affinity = results.cpu_affinity
+    assert set(affinity.keys()) == set(b.keys())
+    assert all(value in ([cores[0]], [cores[1]]) for value in affinity.values())
+    assert (affinity['cache_examples.ClassLevelSetup.track_example'] ==
+            affinity['cache_examples.ClassLevelSetup.track_example2'])
+    assert (affinity['cache_examples.track_cache_foo'] ==
+            affinity['cache_examples.track_cache_bar'])
+
+
+def test_split_cpus():
+    assert runner._split_cpus([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert runner._split_cpus([7, 2, 3, 5], 4) == [[2], [3], [5], [7]]
+    with pytest.raises(util.UserError):
+        runner._split_cpus([0, 1], 3)
+
+    assert runner._format_cpus([0, 1, 2, 5, 7, 8]) == "0-2,5,7-8"
+
+
+def test_setup_cache_store(benchmarks_fixture):
+    conf, repo, envs, commit_hash = benchmarks_fixture
+    conf.setup_cache_store_size = 10
+    store = setup_cache_store.SetupCacheStore.from_conf(conf)
+
+    counter = os.path.abspath('counter')
+    src = textwrap.dedent("""
+    def setup_cache():
+        with open({0!r}, 'a') as f:
+            f.write('x')
+        return {1}
+
+    def track_cached(value):
+        return value
+    """)
+
+    def run(value):
+        clear_pyc('benchmark')
+        with open(join('benchmark', 'store_examples.py'), 'w') as f:
+            f.write(src.format(counter, value))
+        b = benchmarks.Benchmarks.discover(conf, repo, envs, [commit_hash],
+                                           regex='store_examples')
+        results = runner.run_benchmarks(b, envs[0], show_stderr=True,
+                                        setup_cache_store=store)
+        return ResultsWrapper(results, b)['store_examples.track_cached'].result
+
+    # Stored result is reused across runs
+    assert run(42) == [42]
+    assert run(42) == [42]
+    with open(counter, 'r') as f:
+        assert f.read() == 'x'
+
+    # Changing the setup_cache source invalidates it
+    assert run(43) == [43]
+    with open(counter, 'r') as f:
+        assert f.read() == 'xx'
+
+
+def test_setup_cache_store_cleanup(tmpdir):
+    conf = config.Config()
+    conf.env_dir = six.text_type(tmpdir)
+    conf.setup_cache_store_size = 1
+    store = setup_cache_store.SetupCacheStore(conf)
+
+    def add(key, mtime):
+        path = store.create_cache_dir(key)
+        with open(join(path, 'data'), 'wb') as f:
+            f.write(b'x' * 400 * 1024)
+        store.finalize_cache_dir(key)
+        os.utime(path + '.timestamp', (mtime, mtime))
+        store.release_cache_dir(key)
+
+    add('a', 1000)
+    add('b', 2000)
+    add('c', 3000)
+
+    # Least recently used item evicted when size limit exceeded
+    assert store.get_cache_dir('a') is None
+    assert store.get_cache_dir('c') is not None
+    store.release_cache_dir('c')
+
+    # Items in use are not evicted until released
+    path = store.get_cache_dir('b')
+    assert path is not None
+    os.utime(path + '.timestamp', (0, 0))
+    add('d', 4000)
+    assert os.path.isfile(join(path, 'data'))
+    store.release_cache_dir('b')
+    assert not os.path.exists(path)
+    assert store.get_cache_dir('d') is not None
+
+
+@needs_unix_socket_mark
+def test_forkserver_preload_cache(tmpdir):
+    tmpdir = six.text_type(tmpdir)
+    os.chdir(tmpdir)
+
+    os.makedirs('benchmark')
+    with open(join('benchmark', '__init__.py'), 'w') as f:
+        pass
+    with open(join('benchmark', 'preload.py'), 'w') as f:
+        f.write(textwrap.dedent("""
+        def setup_cache():
+            return 42
+
+        def track_cache(value):
+            return value
+        """))
+
+    d = {}
+    d.update(ASV_CONF_JSON)
+    d['env_dir'] = "env"
+    d['benchmark_dir'] = 'benchmark'
+    d['repo'] = 'None'
+    conf = config.Config.from_json(d)
+
+    env = environment.ExistingEnvironment(conf, sys.executable, {}, {})
+    spawner = runner.ForkServer(env, os.path.abspath('benchmark'))
+    cache_dir = None
+    try:
+        cache_dir, stderr = spawner.create_setup_cache('preload.track_cache', 60, '{}')
+        assert stderr is None
+
+        # Benchmarks use the result loaded in the server, not the file
+        spawner.preload_cache(cache_dir)
+        os.unlink(join(cache_dir, 'cache.pickle'))
+
+        (out, errcode, result_text), = spawner.run_many([
+            dict(name='preload.track_cache', params_str='{}', profile_path=None,
+                 timeout=60, cwd=cache_dir)])
+        assert errcode == 0, out
+        assert json.loads(result_text) == 42
+
+        spawner.unload_cache(cache_dir)
+        (out, errcode, result_text), = spawner.run_many([
+            dict(name='preload.track_cache', params_str='{}', profile_path=None,
+                 timeout=60, cwd=cache_dir)])
+        assert errcode != 0
+    finally:
+        spawner.close()
+        if cache_dir is not None:
+            util.long_path_rmtree(cache_dir, True)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires pickle protocol 5")
+def test_setup_cache_mmap(tmpdir):
+    np = pytest.importorskip("numpy")
+    from asv import benchmark as asv_benchmark
+
+    tmpdir = six.text_type(tmpdir)
+    cache = {'a': np.arange(100.0), 'b': np.ones((3, 4))[:, ::2], 'c': 'text'}
+
+    asv_benchmark.save_setup_cache(cache, tmpdir, use_mmap=True)
+    assert os.path.isfile(join(tmpdir, 'cache.buffers'))
+
+    loaded = asv_benchmark.load_setup_cache(tmpdir)
+    assert loaded['c'] == 'text'
+    assert np.array_equal(loaded['a'], cache['a'])
+    assert np.array_equal(loaded['b'], cache['b'])
+
+    # Contiguous arrays are mapped (copy-on-write), not copied
+    assert not loaded['a'].flags.owndata
+    loaded['a'][0] = 5
+    assert asv_benchmark.load_setup_cache(tmpdir)['a'][0] == 0
@@ -9,7 +9,7 @@ import pytest
 
 from asv.step_detect import (solve_potts, solve_potts_autogamma, solve_potts_approx,
                              detect_regressions, golden_search, median, rolling_median_dev,
-                             L1Dist, detect_steps)
+                             L1Dist, NumpyL1Dist, detect_steps, detect_steps_incremental)
 from asv import step_detect
 
 
@@ -29,21 +29,21 @@ except ImportError:
 
 @pytest.fixture(params=[
     "python",
+    pytest.param("numpy", marks=pytest.mark.skipif(not HAVE_NUMPY, reason="test needs numpy")),
     pytest.param("rangemedian", marks=pytest.mark.skipif(not HAVE_RANGEMEDIAN, reason="compiled asv._rangemedian required"))
 ])
-def use_rangemedian(request):
+def use_rangemedian(request, monkeypatch):
     if request.param == "rangemedian":
         assert isinstance(step_detect.get_mu_dist([0], [1]), _rangemedian.RangeMedian)
         return True
     else:
-        step_detect._rangemedian = None
+        monkeypatch.setattr(step_detect, '_rangemedian', None)
 
-        def restore():
-            if HAVE_RANGEMEDIAN:
-                step_detect._rangemedian = _rangemedian
-        request.addfinalizer(restore)
-
-        assert isinstance(step_detect.get_mu_dist([0], [1]), L1Dist)
+        if request.param == "numpy":
+            assert isinstance(step_detect.get_mu_dist([0], [1]), NumpyL1Dist)
+        else:
+            monkeypatch.setattr(step_detect, '_numpy', False)
+            assert isinstance(step_detect.get_mu_dist([0], [1]), L1Dist)
         return False
 
 
@@ -167,6 +167,39 @@ def test_weighted():
     assert steps_pos == [0, 5, 10, 20, 50, 70]
 
 
+def test_detect_steps_incremental(use_rangemedian):
+    random.seed(1234)
+    y = ([1 + 0.05 * random.random() for j in range(300)] +
+         [2 + 0.05 * random.random() for j in range(300)])
+    w = [1 + random.random() for j in range(len(y))]
+    y[123] = None
+    w[234] = None
+
+    steps, state = detect_steps_incremental(y[:560], w[:560])
+    assert steps == detect_steps(y[:560], w[:560])
+    n_full = state['n_full']
+
+    # Appended data within the last step is solved incrementally
+    for n in [561, 570, 570, 590, 600]:
+        steps, state = detect_steps_incremental(y[:n], w[:n], state=state)
+        assert state['n'] == n
+        assert state['n_full'] == n_full
+
+        # Same result as the full solve, except for the normalization
+        # of the weights
+        expected = detect_steps(y[:n], w[:n])
+        assert [s[:4] for s in steps] == [s[:4] for s in expected]
+        assert [s[4] for s in steps] == pytest.approx([s[4] for s in expected], rel=0.1)
+
+    # A new step requires solving the full problem
+    y += [3 + 0.05 * random.random() for j in range(20)]
+    w += [1] * 20
+    steps, state = detect_steps_incremental(y, w, state=state)
+    assert state['n_full'] == len(y) - 1
+    assert steps == detect_steps(y, w)
+    assert [s[0] for s in steps] == [0, 300, 600]
+
+
 @pytest.mark.skipif(not HAVE_NUMPY, reason="test needs numpy")
 def test_detect_regressions(use_rangemedian):
     np.random.seed(1234)
@@ -264,8 +297,13 @@ def test_l1dist(use_rangemedian):
                 d = sum(ww*abs(yy - m) for yy, ww in zip(y[:j], w[:j]))
                 yield m, d
 
-    for y, w in datasets:
+    for y, w, batch_size in [d + (b,) for d in datasets for b in (None, 7)]:
         dist = step_detect.get_mu_dist(y, w)
+        if batch_size is not None:
+            if not hasattr(dist, 'get_windows'):
+                continue
+            # Windows up to the batch size are computed together
+            dist.get_windows(batch_size)
 
         for i in range(len(y)):
             for p, (m2, d2) in enumerate(median_iter(y[i:], w[i:])):
@@ -278,6 +316,39 @@ def test_l1dist(use_rangemedian):
                 assert abs(d - d2) < 1e-10, (i, j)
 
 
+@pytest.mark.skipif(not HAVE_RANGEMEDIAN, reason="compiled asv._rangemedian required")
+def test_rangemedian_rolling():
+    random.seed(1)
+
+    y = [random.choice([random.gauss(0, 1), random.randint(0, 3)]) for j in range(300)]
+    w = [random.choice([1, 0.5 + random.random()]) for j in range(300)]
+
+    # Windows visited in an arbitrary order, of sizes crossing over
+    # between the sorting and rolling median computations
+    dist = _rangemedian.RangeMedian(y, w)
+    for k in range(2000):
+        i = random.randint(0, len(y) - 1)
+        j = min(i + random.randint(0, 150), len(y) - 1)
+
+        m = step_detect.weighted_median(y[i:j+1], w[i:j+1])
+        d = sum(ww*abs(yy - m) for yy, ww in zip(y[i:j+1], w[i:j+1]))
+        assert abs(dist.dist(i, j) - d) < 1e-10 * len(y), (i, j)
+
+    # Batch queries agree with the single ones
+    ref = _rangemedian.RangeMedian(y, w)
+    row = dist.dist_row(20, 250)
+    col = dist.dist_col(20, 250)
+    assert len(row) == len(col) == 231
+    for k in range(20, 251):
+        assert abs(row[k - 20] - ref.dist(20, k)) < 1e-10 * len(y), k
+        assert abs(col[k - 20] - ref.dist(k, 250)) < 1e-10 * len(y), k
+
+    with pytest.raises(ValueError):
+        dist.dist_row(10, len(y))
+    with pytest.raises(ValueError):
+        dist.dist_col(10, 9)
+
+
 def test_regression_threshold():
     steps = [(0, 1,   1.0, 1.0, 0.0),
              (1, 2,   1.1, 1.1, 0.0),
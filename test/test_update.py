@@ -52,3 +52,10 @@ def test_update_simple(monkeypatch, generate_result_dir):
     items = [fn.lower() for fn in os.listdir(machine_dir)]
     assert long_result_fn not in items
     assert hash_result_fn in items
+
+    # Convert samples to the binary format and back
+    result_path = os.path.join(machine_dir, result_fn)
+    tools.run_asv("update", "--samples-format=binary", _machine_file=machine_file)
+    assert util.load_json(result_path)['samples_format'] == 'binary'
+    tools.run_asv("update", "--samples-format=json", _machine_file=machine_file)
+    assert 'samples_format' not in util.load_json(result_path)
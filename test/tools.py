@@ -22,7 +22,6 @@ import subprocess
 from os.path import abspath, join, dirname, relpath, isdir
 from contextlib import contextmanager
 from hashlib import sha256
-from six.moves import SimpleHTTPServer
 
 import pytest
 
@@ -37,7 +36,7 @@ from asv import commands
 from asv import config
 from asv import environment
 from asv import runner
-from asv.commands.preview import create_httpd
+from asv.commands.preview import create_httpd, RangeRequestHandler
 from asv.repo import get_repo
 from asv.results import Results
 from asv.plugins.conda import _find_conda
@@ -559,10 +558,10 @@ def preview(base_path):
 
     """
 
-    class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    class Handler(RangeRequestHandler):
         def translate_path(self, path):
             # Don't serve from cwd, but from a different directory
-            path = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(self, path)
+            path = RangeRequestHandler.translate_path(self, path)
             path = os.path.join(base_path, os.path.relpath(path, os.getcwd()))
             return util.long_path(path)
 